@@ -3,26 +3,27 @@
 Claude's English Fun House - Main Application
 """
 import streamlit as st
-from utils.api_client_simple import init_client
+from utils.api_client_simple import init_client, get_generation_service
+from utils.transport import (
+    get_pool_stats, get_rate_limit_stats, get_endpoint_stats,
+    get_hedge_stats, get_generation_stats, get_stream_stats
+)
+from utils.metrics import module_summary, start_metrics_server, process_rss_bytes
+from utils.cancellation import cancel_streams
+from utils.chat_history import chat_sessions
+from utils.story_prefetch import story_prefetcher
+from utils.fragments import fragment
 from modules import story_magic_module, role_chat_module, little_writer_module
 from config.settings import (
     APP_TITLE, APP_SUBTITLE, APP_DESCRIPTION, 
-    MODULES, OPENAI_API_KEY, OPENAI_API_BASE, OPENAI_MODEL
+    MODULES, OPENAI_API_KEY, OPENAI_API_BASE, OPENAI_MODEL,
+    METRICS_PORT, METRICS_HOST, METRICS_ADMIN_PANEL, STORY_PREFETCH_ENABLED, GENERATION_SERVICE_URL
 )
 import os
 
 
-def initialize_app():
-    """初始化应用程序配置"""
-    st.set_page_config(
-        page_title=APP_TITLE,
-        page_icon="🏠",
-        layout="wide",
-        initial_sidebar_state="expanded"
-    )
-    
-    # 自定义CSS样式
-    st.markdown("""
+# 静态内容在模块导入时构建一次，整页重跑时直接复用
+APP_CSS = """
     <style>
     /* 主标题样式 */
     .main-header {
@@ -66,7 +67,102 @@ def initialize_app():
         border-radius: 10px;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+
+def initialize_app():
+    """初始化应用程序配置"""
+    st.set_page_config(
+        page_title=APP_TITLE,
+        page_icon="🏠",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    # 自定义CSS样式
+    st.markdown(APP_CSS, unsafe_allow_html=True)
+
+
+@fragment
+def api_config_panel():
+    """
+    侧边栏API配置
+    
+    作为片段运行，输入密钥、端点或模型名称时只重跑这一块
+    """
+    st.markdown("### ⚙️ API配置")
+    
+    # API密钥输入 - 优先使用环境变量，否则使用session state
+    default_api_key = OPENAI_API_KEY or st.session_state.get('api_key', '')
+    api_key = st.text_input(
+        "API密钥",
+        type="password",
+        value=default_api_key,
+        placeholder="输入你的API密钥",
+        help="请输入你的API密钥以使用AI功能"
+    )
+    
+    # 高级配置（可选）
+    with st.expander("🔧 高级配置（可选）"):
+        default_api_base = OPENAI_API_BASE or st.session_state.get('api_base', '')
+        api_base = st.text_input(
+            "API端点",
+            value=default_api_base,
+            placeholder="https://api.openai.com/v1",
+            help="自定义API端点URL（如果使用默认OpenAI API，请留空）"
+        )
+        
+        default_model = OPENAI_MODEL or st.session_state.get('model', '')
+        model_name = st.text_input(
+            "模型名称",
+            value=default_model,
+            placeholder="gpt-3.5-turbo",
+            help="指定要使用的模型名称"
+        )
+    
+    # 连接按钮
+    if st.button("🔗 连接API", type="primary", use_container_width=True):
+        if api_key:
+            # 保存到session state
+            st.session_state.api_key = api_key
+            if api_base:
+                st.session_state.api_base = api_base
+            if model_name:
+                st.session_state.model = model_name
+            
+            # 初始化客户端
+            client = init_client(
+                api_key=api_key,
+                api_base=api_base if api_base else None,
+                model=model_name if model_name else None
+            )
+            
+            if client:
+                first_connection = st.session_state.get('client') is None
+                st.session_state.client = client
+                if first_connection:
+                    # 主页面要从欢迎页切换到功能模块，需要整页重跑
+                    st.rerun()
+                st.success("✅ API连接成功！")
+            else:
+                st.error("❌ API连接失败，请检查配置")
+        else:
+            st.warning("⚠️ 请输入API密钥")
+    
+    # 显示连接状态
+    if GENERATION_SERVICE_URL:
+        # 生成请求（包括批量批改和故事预取）都发给独立的生成服务，不需要在这里配置API
+        st.success("🟢 已连接生成服务")
+        st.caption(GENERATION_SERVICE_URL)
+    elif 'client' in st.session_state and st.session_state.client:
+        st.success("🟢 已连接")
+        if 'model' in st.session_state:
+            st.info(f"使用模型: {st.session_state.model}")
+        router = getattr(st.session_state.client, "router", None)
+        if router is not None:
+            st.caption(f"多端点路由: {len(router.endpoints)} 个端点")
+    else:
+        st.warning("🔴 未连接")
 
 
 def setup_sidebar():
@@ -83,68 +179,10 @@ def setup_sidebar():
         st.markdown("---")
         
         # API配置部分
-        st.markdown("### ⚙️ API配置")
-        
-        # API密钥输入 - 优先使用环境变量，否则使用session state
-        default_api_key = OPENAI_API_KEY or st.session_state.get('api_key', '')
-        api_key = st.text_input(
-            "API密钥",
-            type="password",
-            value=default_api_key,
-            placeholder="输入你的API密钥",
-            help="请输入你的API密钥以使用AI功能"
-        )
-        
-        # 高级配置（可选）
-        with st.expander("🔧 高级配置（可选）"):
-            default_api_base = OPENAI_API_BASE or st.session_state.get('api_base', '')
-            api_base = st.text_input(
-                "API端点",
-                value=default_api_base,
-                placeholder="https://api.openai.com/v1",
-                help="自定义API端点URL（如果使用默认OpenAI API，请留空）"
-            )
-            
-            default_model = OPENAI_MODEL or st.session_state.get('model', '')
-            model_name = st.text_input(
-                "模型名称",
-                value=default_model,
-                placeholder="gpt-3.5-turbo",
-                help="指定要使用的模型名称"
-            )
+        api_config_panel()
         
-        # 连接按钮
-        if st.button("🔗 连接API", type="primary", use_container_width=True):
-            if api_key:
-                # 保存到session state
-                st.session_state.api_key = api_key
-                if api_base:
-                    st.session_state.api_base = api_base
-                if model_name:
-                    st.session_state.model = model_name
-                
-                # 初始化客户端
-                client = init_client(
-                    api_key=api_key,
-                    api_base=api_base if api_base else None,
-                    model=model_name if model_name else None
-                )
-                
-                if client:
-                    st.session_state.client = client
-                    st.success("✅ API连接成功！")
-                else:
-                    st.error("❌ API连接失败，请检查配置")
-            else:
-                st.warning("⚠️ 请输入API密钥")
-        
-        # 显示连接状态
-        if 'client' in st.session_state and st.session_state.client:
-            st.success("🟢 已连接")
-            if 'model' in st.session_state:
-                st.info(f"使用模型: {st.session_state.model}")
-        else:
-            st.warning("🔴 未连接")
+        if METRICS_ADMIN_PANEL:
+            show_metrics_panel()
         
         st.markdown("---")
         
@@ -191,14 +229,90 @@ def setup_sidebar():
         return selected_module
 
 
+def show_metrics_panel():
+    """侧边栏运行指标面板（进程内所有会话的汇总）"""
+    with st.expander("📊 运行指标"):
+        rows = module_summary()
+        if not rows:
+            st.caption("还没有请求")
+        for row in rows:
+            kind = "流式" if row["stream"] else "非流式"
+            ttft = f" · 首字 {row['ttft_p50_s']:.2f}s" if row["stream"] else ""
+            st.markdown(
+                f"**{row['module']}** · {kind} · {row['requests']}次（失败 {row['errors']}）  \n"
+                f"p50 {row['p50_s']:.2f}s · p95 {row['p95_s']:.2f}s{ttft}  \n"
+                f"tokens 输入 {row['prompt_tokens']} / 输出 {row['completion_tokens']} · 重试 {row['retries']}"
+            )
+        
+        pool = get_pool_stats()
+        limits = get_rate_limit_stats()
+        st.caption(
+            f"连接复用 {pool['connection_reuse_hits']}/{pool['requests']} · "
+            f"限流排队 {limits['queue_depth']} · 重试 {limits['retries']}"
+        )
+        streams = get_stream_stats()
+        if streams["cancelled"] or streams["timeouts"]:
+            cancelled = " ".join(f"{reason} {count}" for reason, count in sorted(streams["cancelled"].items()))
+            timeouts = " ".join(f"{phase} {count}" for phase, count in sorted(streams["timeouts"].items()))
+            st.caption(f"取消的流 {cancelled or 0} · 超时 {timeouts or 0}")
+        for profile in get_generation_stats():
+            if not profile["requests"]:
+                continue
+            mode = "自适应" if profile["adaptive"] else "固定"
+            st.caption(
+                f"{profile['module']} max_tokens {profile['current_max_tokens']}（{mode}） · "
+                f"输出p99 {profile['completion_p99']:.0f} · 少预留 {profile['saved']} tokens · "
+                f"截断 {profile['truncated']}"
+            )
+        for hedge in get_hedge_stats():
+            st.caption(
+                f"{hedge['module']} 对冲 {hedge['hedges']}/{hedge['requests']} · "
+                f"对冲先到 {hedge['hedge_wins']} · 超出比例上限 {hedge['rate_capped']}"
+            )
+        if STORY_PREFETCH_ENABLED:
+            prefetch = story_prefetcher.stats()
+            st.caption(
+                f"故事预取 {prefetch['generated']}篇 · 命中 {prefetch['hits']}（{prefetch['hit_rate']:.0%}） · "
+                f"浪费 {prefetch['wasted']} · 超出上限 {prefetch['skipped']}"
+            )
+        history = chat_sessions.stats()
+        st.caption(
+            f"进程内存 {process_rss_bytes() / 2**20:.0f}MB · 聊天历史 {history['sessions']}个在内存 · "
+            f"{history['turns_in_memory']}条 {history['bytes'] / 1024:.0f}KB · 闲置移出 {history['evictions']}"
+        )
+        for row in chat_sessions.memory_report()[:5]:
+            st.caption(
+                f"会话 {row['session'][:8]} · {row['role']} · 内存 {row['turns_in_memory']}条 "
+                f"{row['bytes'] / 1024:.1f}KB · 磁盘 {row['turns_on_disk']}条 · 闲置 {row['idle_s']:.0f}s"
+            )
+        for endpoint in get_endpoint_stats():
+            ttft = "—" if endpoint["ewma_ttft_s"] is None else f"{endpoint['ewma_ttft_s']:.2f}s"
+            state = {"closed": "🟢", "half_open": "🟡", "open": "🔴"}[endpoint["state"]]
+            st.caption(
+                f"{state} {endpoint['url']} · 首字 {ttft} · "
+                f"{endpoint['requests']}次（失败 {endpoint['failures']}）"
+            )
+        if METRICS_PORT:
+            st.caption(f"Prometheus: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+
 def main():
     """主函数"""
     # 初始化应用
     initialize_app()
     
+    # 指标端点每个进程只启动一次
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+    
     # 设置侧边栏并获取选择的模块
     selected_module = setup_sidebar()
     
+    # 切换功能时，离开的页面上还在生成的内容已经没人看了
+    if st.session_state.get('current_module') != selected_module:
+        cancel_streams(st.session_state, reason="navigation")
+        st.session_state.current_module = selected_module
+    
     # 主页面标题
     st.markdown("""
     <div class='main-header'>
@@ -207,8 +321,8 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # 检查API连接状态
-    if 'client' not in st.session_state or st.session_state.client is None:
+    # 检查API连接状态（配置了生成服务时不需要在页面里连接API）
+    if get_generation_service() is None:
         # 显示欢迎页面
         st.markdown(APP_DESCRIPTION)
         
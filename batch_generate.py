@@ -0,0 +1,199 @@
+"""
+批量生成命令行工具 - 不用打开浏览器，批量生成故事、批改作文或运行脚本化对话
+
+结果每完成一条就追加写入JSONL；中断后用同样的命令再次运行会跳过已成功的条目。
+
+用法:
+    python batch_generate.py story keywords.txt -o stories.jsonl --concurrency 8
+    python batch_generate.py writer essays.csv homework.zip -o feedback.jsonl
+    python batch_generate.py chat openers.jsonl -o chats.jsonl
+
+输入格式:
+    story   每行一组关键词（.txt），或JSONL中的 {"id": ..., "keywords": "..."}
+    writer  .csv / .txt / .zip（与老师批量批改相同），或JSONL中的 {"id": ..., "text": "..."}
+    chat    每行 "角色<TAB>第一句话"（.txt），或JSONL中的
+            {"id": ..., "role": "🐱 一只会说话的猫", "turns": ["Hello!", "What do you eat?"]}
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from config.settings import (
+    OPENAI_API_KEY, OPENAI_API_BASE, OPENAI_MODEL, CHAT_ROLES
+)
+from utils.batch_grading import parse_uploaded_essays
+from utils.generation_service import GenerationService
+from utils.latency import summarize_latencies
+from utils.transport import client_registry
+
+
+def _read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def load_items(kind: str, paths):
+    """
+    读取输入文件
+
+    Returns:
+        条目列表，每项至少包含 id
+    """
+    items = []
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if path.endswith(".jsonl"):
+            for number, record in enumerate(_read_jsonl(path), start=1):
+                record.setdefault("id", f"{stem}-{number}")
+                items.append(record)
+        elif kind == "writer":
+            with open(path, "rb") as f:
+                essays = parse_uploaded_essays([(path, f.read())])
+            for essay in essays:
+                items.append({"id": essay["name"], "text": essay["text"]})
+        else:
+            with open(path, encoding="utf-8") as f:
+                lines = [line.strip() for line in f if line.strip()]
+            for number, line in enumerate(lines, start=1):
+                item_id = f"{stem}-{number}"
+                if kind == "story":
+                    items.append({"id": item_id, "keywords": line})
+                else:
+                    role, _, opener = line.partition("\t")
+                    if not opener:
+                        role, opener = CHAT_ROLES[0], line
+                    items.append({"id": item_id, "role": role, "turns": [opener]})
+
+    for item in items:
+        item["id"] = str(item["id"])
+    return items
+
+
+def run_item(kind: str, service: GenerationService, item: dict):
+    """
+    生成一个条目
+
+    Returns:
+        写入JSONL的结果字典
+    """
+    start = time.perf_counter()
+    record = {"id": item["id"], "kind": kind, "model": service.model}
+    try:
+        if kind == "story":
+            record["input"] = item["keywords"]
+            record["output"] = service.story(item["keywords"])
+        elif kind == "writer":
+            text = item.get("text") or item.get("essay", "")
+            record["input"] = text
+            record["output"] = service.grade(text)
+        else:
+            # 脚本化对话：逐句发送，和聊天室一样按token预算组装上下文
+            role = item.get("role") or CHAT_ROLES[0]
+            turns = item.get("turns") or [item.get("opener", "")]
+            history, summary_cache = [], {}
+            for turn in turns:
+                history.append({"role": "user", "content": turn})
+                _, chunks = service.chat(role, history, turn, summary_cache)
+                history.append({"role": "assistant", "content": "".join(chunks)})
+            record["input"] = {"role": role, "turns": turns}
+            record["output"] = history
+        record["status"] = "ok"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = str(e)
+    record["latency"] = round(time.perf_counter() - start, 3)
+    record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    return record
+
+
+def load_checkpoint(output_path: str):
+    """读取已有输出中成功完成的条目ID"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 上次中断时可能留下半行
+            if record.get("status") == "ok":
+                done.add(str(record.get("id")))
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("kind", choices=["story", "writer", "chat"], help="生成类型")
+    parser.add_argument("inputs", nargs="+", help="输入文件")
+    parser.add_argument("-o", "--output", required=True, help="输出JSONL文件")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="最大并发数（默认8）")
+    parser.add_argument("--api-key", default=OPENAI_API_KEY, help="API密钥（默认读取环境变量）")
+    parser.add_argument("--api-base", default=OPENAI_API_BASE, help="API端点")
+    parser.add_argument("--model", default=OPENAI_MODEL, help="模型名称")
+    parser.add_argument("--transport", choices=["sync", "async"], default=None, help="传输方式")
+    parser.add_argument("--restart", action="store_true", help="忽略已有输出，从头开始")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("缺少API密钥：请设置 OPENAI_API_KEY 或使用 --api-key")
+
+    items = load_items(args.kind, args.inputs)
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done = load_checkpoint(args.output)
+    pending = [item for item in items if item["id"] not in done]
+    print(f"共 {len(items)} 条，已完成 {len(items) - len(pending)} 条，本次处理 {len(pending)} 条",
+          file=sys.stderr)
+
+    service = GenerationService(client_registry.get_client(args.api_key, args.api_base, args.transport), args.model)
+    latencies, failed = [], 0
+    start = time.perf_counter()
+
+    with open(args.output, "a", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        queue = iter(pending)
+        running = set()
+        while True:
+            # 控制在途任务数，输入再大也不会一次性全部提交
+            for item in queue:
+                running.add(pool.submit(run_item, args.kind, service, item))
+                if len(running) >= args.concurrency * 2:
+                    break
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                latencies.append(record["latency"])
+                if record["status"] != "ok":
+                    failed += 1
+                    print(f"❌ {record['id']}: {record['error']}", file=sys.stderr)
+                completed = len(latencies)
+                if completed % 10 == 0 or completed == len(pending):
+                    print(f"进度 {completed}/{len(pending)}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    summary = summarize_latencies(latencies)
+    print(json.dumps({
+        "processed": len(latencies),
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 2),
+        "items_per_second": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_seconds": {k: round(v, 3) if isinstance(v, float) else v for k, v in summary.items()},
+    }, ensure_ascii=False, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
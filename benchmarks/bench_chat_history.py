@@ -0,0 +1,129 @@
+"""
+聊天历史内存基准：很多会话、很长的对话时进程常驻内存（RSS）的增长
+
+两种方式各在一个子进程里运行（RSS互不影响）：
+  list    原来的方式，每个会话一个不断增长的消息字典列表
+  store   内存环形队列 + SQLite溢出（utils.chat_history），最后把所有会话当作闲置移出内存
+报告RSS增长、每个会话的内存估算、追加一条消息的耗时分位，以及闲置移出和恢复会话的耗时。
+
+用法:
+    python benchmarks/bench_chat_history.py [--sessions 500] [--turns 200] [--chars 300] [--json]
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.latency import summarize_latencies  # noqa: E402
+from utils.metrics import process_rss_bytes  # noqa: E402
+
+
+def make_turn(session: int, turn: int, chars: int) -> str:
+    text = f"Session {session} turn {turn}: I like my cat and we play in the garden every day. "
+    return (text * (chars // len(text) + 1))[:chars]
+
+
+def run_list(args):
+    sessions = {}
+    for turn in range(args.turns):
+        for session in range(args.sessions):
+            sessions.setdefault(session, []).append({
+                "role": "user" if turn % 2 else "assistant",
+                "content": make_turn(session, turn, args.chars),
+            })
+    gc.collect()
+    return {"rss_full": process_rss_bytes()}
+
+
+def run_store(args, directory):
+    from utils.chat_history import ChatHistoryStore, ChatSessions
+
+    registry = ChatSessions(ChatHistoryStore(os.path.join(directory, "chat_history.sqlite3")),
+                            idle_timeout=3600, retention=0)
+    latencies = []
+    for turn in range(args.turns):
+        for session in range(args.sessions):
+            history = registry.get(f"s{session}", "cat")
+            began = time.perf_counter()
+            history.append("user" if turn % 2 else "assistant", make_turn(session, turn, args.chars))
+            latencies.append(time.perf_counter() - began)
+    before_eviction = registry.stats()
+    gc.collect()
+    rss_full = process_rss_bytes()
+
+    began = time.perf_counter()
+    evicted = registry.sweep(time.time() + 7200)
+    evict_seconds = time.perf_counter() - began
+    gc.collect()
+
+    began = time.perf_counter()
+    restored = registry.get("s0", "cat")
+    restore_seconds = time.perf_counter() - began
+    return {
+        "append": summarize_latencies(latencies),
+        "bytes_per_session": before_eviction["bytes"] / args.sessions,
+        "rss_full": rss_full,
+        "evicted": evicted,
+        "evict_seconds": evict_seconds,
+        "restore_seconds": restore_seconds,
+        "restored_turns_in_memory": len(restored.ring),
+        "restored_turns_on_disk": restored.earlier_count,
+    }
+
+
+def run_mode(args):
+    import utils.chat_history  # noqa: F401  两种方式都先导入，RSS增长只算数据本身
+    gc.collect()
+    start_rss = process_rss_bytes()
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        result = run_list(args) if args.mode == "list" else run_store(args, directory)
+        result["seconds"] = time.perf_counter() - started
+        result["rss_growth"] = max(result["rss_full"] - start_rss, 0)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=500, help="会话数")
+    parser.add_argument("--turns", type=int, default=200, help="每个会话的消息数")
+    parser.add_argument("--chars", type=int, default=300, help="每条消息的字符数")
+    parser.add_argument("--mode", choices=("list", "store"), help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    results = {}
+    for mode in ("list", "store"):
+        command = [sys.executable, os.path.abspath(__file__), "--mode", mode, "--sessions", str(args.sessions),
+                   "--turns", str(args.turns), "--chars", str(args.chars)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+    report = {"config": vars(args), "results": results}
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    listed, stored = results["list"], results["store"]
+    print(f"{args.sessions} 个会话 × {args.turns} 条消息 × {args.chars} 字符")
+    print(f"list   RSS增长 {listed['rss_growth'] / 2**20:.1f}MB")
+    print(f"store  RSS增长 {stored['rss_growth'] / 2**20:.1f}MB · 每个会话内存 {stored['bytes_per_session'] / 1024:.1f}KB · "
+          f"追加 p50 {stored['append']['p50'] * 1e6:.0f}µs p99 {stored['append']['p99'] * 1e6:.0f}µs")
+    print(f"闲置移出 {stored['evicted']} 个会话用时 {stored['evict_seconds']:.2f}s · "
+          f"恢复一个会话 {stored['restore_seconds'] * 1000:.1f}ms"
+          f"（内存 {stored['restored_turns_in_memory']} 条，磁盘 {stored['restored_turns_on_disk']} 条）")
+
+
+if __name__ == "__main__":
+    main()
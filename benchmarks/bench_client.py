@@ -0,0 +1,249 @@
+"""
+API客户端端到端基准：在本地模拟服务上测量客户端自身的开销
+
+模拟服务（benchmarks/mock_llm_server.py）在子进程中运行，所以这里统计的CPU时间
+只包含客户端。依次测量：
+  - chat_completion          SimpleAPIClient.chat_completion（非流式）
+  - chat_completion_stream   SimpleAPIClient.chat_completion（流式）
+  - get_claude_response      故事/作文使用的非流式入口
+  - get_streaming_response   聊天室使用的流式入口（含上下文组装）
+
+每个场景报告延迟p50/p95/p99、首token时间、tokens/秒、每请求CPU时间，
+另用tracemalloc单独跑几次统计每请求的内存分配峰值。
+
+用法:
+    python benchmarks/bench_client.py [--requests 50] [--ttft-ms 50] [--token-delay-ms 2]
+                                      [--tokens 200] [--json] [--output result.json]
+                                      [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import streamlit as st  # noqa: E402
+from utils import api_client_simple  # noqa: E402
+from utils.transport import SimpleAPIClient  # noqa: E402
+from utils.latency import summarize_latencies  # noqa: E402
+from benchmarks.mock_llm_server import add_config_arguments  # noqa: E402
+
+SCENARIOS = ("chat_completion", "chat_completion_stream", "get_claude_response", "get_streaming_response")
+SYSTEM_PROMPT = "You are a friendly English teacher for children."
+
+
+class BenchSessionState(dict):
+    """
+    脚本模式下 st.session_state 不保存数据，这里用一个支持属性访问的字典代替，
+    让 get_claude_response / get_streaming_response 可以在 streamlit run 之外调用
+    """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+
+def start_mock_server(args):
+    """在子进程中启动模拟服务，返回 (进程, API端点)"""
+    command = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "mock_llm_server.py"), "--port", "0",
+        "--ttft-ms", str(args.ttft_ms), "--token-delay-ms", str(args.token_delay_ms),
+        "--tokens", str(args.tokens), "--error-rate", str(args.error_rate),
+        "--error-status", str(args.error_status),
+    ]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def run_once(scenario: str, client, number: int):
+    """
+    执行一次请求
+
+    Returns:
+        (延迟, 首token时间, 输出token数, 是否成功)
+    """
+    # 每次的提示词都不同，避免被单飞合并或缓存命中
+    prompt = f"Tell me a short story about a cat. #{number}"
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+    start = time.perf_counter()
+    ttft = None
+    tokens = 0
+    ok = True
+
+    if scenario == "chat_completion":
+        try:
+            response = client.chat_completion(messages, stream=False)
+            tokens = (response.get("usage") or {}).get("completion_tokens", 0)
+        except Exception:
+            ok = False
+    elif scenario == "get_claude_response":
+        content = api_client_simple.get_claude_response(prompt, SYSTEM_PROMPT)
+        ok = content is not None
+        tokens = len(content.split()) if content else 0
+    else:
+        if scenario == "chat_completion_stream":
+            try:
+                chunks = client.chat_completion(messages, stream=True)
+            except Exception:
+                chunks, ok = [], False
+        else:
+            st.session_state.messages = [{"role": "user", "content": prompt}]
+            chunks = api_client_simple.get_streaming_response(prompt, SYSTEM_PROMPT)
+        try:
+            for chunk in chunks:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                if chunk.startswith("\n\n❌"):
+                    ok = False
+                tokens += 1
+        except Exception:
+            ok = False
+
+    latency = time.perf_counter() - start
+    return latency, latency if ttft is None else ttft, tokens, ok
+
+
+def run_scenario(scenario: str, client, requests: int, warmup: int, alloc_requests: int):
+    """测量一个场景"""
+    for number in range(warmup):
+        run_once(scenario, client, -number - 1)
+
+    latencies, ttfts, total_tokens, failures = [], [], 0, 0
+    cpu_start = time.process_time()
+    for number in range(requests):
+        latency, ttft, tokens, ok = run_once(scenario, client, number)
+        latencies.append(latency)
+        ttfts.append(ttft)
+        total_tokens += tokens
+        failures += not ok
+    cpu = time.process_time() - cpu_start
+
+    # 内存分配单独测量：tracemalloc本身会明显拖慢请求
+    peaks = []
+    tracemalloc.start()
+    try:
+        for number in range(alloc_requests):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            run_once(scenario, client, requests + number)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    latency_ms = {k: v * 1000 if k != "count" else v for k, v in summarize_latencies(latencies).items()}
+    ttft_ms = {k: v * 1000 if k != "count" else v for k, v in summarize_latencies(ttfts).items()}
+    return {
+        "requests": requests,
+        "failures": failures,
+        "latency_ms": latency_ms,
+        "ttft_ms": ttft_ms,
+        "tokens_per_second": total_tokens / sum(latencies) if latencies else 0.0,
+        "cpu_ms_per_request": cpu * 1000 / requests if requests else 0.0,
+        "alloc_peak_kib_per_request": sum(peaks) / len(peaks) / 1024 if peaks else 0.0,
+    }
+
+
+def print_table(report, baseline=None):
+    """打印可读的结果表；提供基准结果时附上变化百分比"""
+    config = report["config"]
+    print(f"模拟服务: ttft {config['ttft_ms']}ms, token间隔 {config['token_delay_ms']}ms, "
+          f"{config['tokens']} tokens, 错误率 {config['error_rate']}")
+    header = f"{'场景':<26}{'p50':>9}{'p95':>9}{'p99':>9}{'TTFT50':>9}{'tok/s':>9}{'CPU/req':>10}{'KiB/req':>10}{'失败':>6}"
+    print(header)
+    for name, row in report["results"].items():
+        print(f"{name:<26}{row['latency_ms']['p50']:>9.1f}{row['latency_ms']['p95']:>9.1f}"
+              f"{row['latency_ms']['p99']:>9.1f}{row['ttft_ms']['p50']:>9.1f}{row['tokens_per_second']:>9.0f}"
+              f"{row['cpu_ms_per_request']:>10.2f}{row['alloc_peak_kib_per_request']:>10.1f}{row['failures']:>6}")
+        old = (baseline or {}).get("results", {}).get(name)
+        if old:
+            def change(new, before):
+                return f"{(new - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{'  vs 基准':<26}{change(row['latency_ms']['p50'], old['latency_ms']['p50']):>9}"
+                  f"{change(row['latency_ms']['p95'], old['latency_ms']['p95']):>9}"
+                  f"{change(row['latency_ms']['p99'], old['latency_ms']['p99']):>9}"
+                  f"{change(row['ttft_ms']['p50'], old['ttft_ms']['p50']):>9}"
+                  f"{change(row['tokens_per_second'], old['tokens_per_second']):>9}"
+                  f"{change(row['cpu_ms_per_request'], old['cpu_ms_per_request']):>10}"
+                  f"{change(row['alloc_peak_kib_per_request'], old['alloc_peak_kib_per_request']):>10}")
+    print("延迟单位：毫秒（ms）；CPU/req 为每请求客户端CPU毫秒数")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="每个场景的请求数")
+    parser.add_argument("--warmup", type=int, default=3, help="预热请求数")
+    parser.add_argument("--alloc-requests", type=int, default=5, help="统计内存分配的请求数")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景列表")
+    parser.add_argument("--base-url", default=None, help="使用已运行的服务，而不是启动模拟服务")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    parser.add_argument("--output", default=None, help="把JSON结果保存到文件")
+    parser.add_argument("--compare", default=None, help="与之前保存的JSON结果比较")
+    add_config_arguments(parser)
+    parser.set_defaults(ttft_ms=50, token_delay_ms=2)
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    process = None
+    api_base = args.base_url
+    if api_base is None:
+        process, api_base = start_mock_server(args)
+
+    try:
+        client = SimpleAPIClient("bench-key", api_base)
+        st.session_state = BenchSessionState(client=client, model="mock-model")
+        results = {
+            scenario: run_scenario(scenario, client, args.requests, args.warmup, args.alloc_requests)
+            for scenario in scenarios
+        }
+        pool = client.pool_stats()
+        client.close()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        "config": {
+            "requests": args.requests,
+            "ttft_ms": args.ttft_ms,
+            "token_delay_ms": args.token_delay_ms,
+            "tokens": args.tokens,
+            "error_rate": args.error_rate,
+            "python": sys.version.split()[0],
+        },
+        "results": results,
+        "pool": pool,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
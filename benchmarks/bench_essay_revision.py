@@ -0,0 +1,124 @@
+"""
+作文增量批改基准：孩子按建议逐轮修改作文时，每轮重新提交能少用多少token
+
+生成一篇带错误的作文和对应的批改结果（每个错误一条“修改建议”），每轮改正其中 --fixes-per-round 处，
+按 utils.essay_revision 的句子级比较只批改改动过的句子，新批改的长度按改动句子数估算。
+报告每一轮的模式、改动句子数、沿用的建议数，以及相对完整重新批改少用的输入/输出token，
+另外报告句子比较本身的耗时。
+
+用法:
+    python benchmarks/bench_essay_revision.py [--sentences 20] [--rounds 5] [--fixes-per-round 2] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.essay_revision import RevisionPlan  # noqa: E402
+
+MISTAKES = (
+    ("Yesterday I go to the park with my friend.", "Yesterday I go", "Yesterday I went", "过去的事情用过去式"),
+    ("I like read books after school.", "like read", "like reading", "like 后面常用 -ing"),
+    ("My sister have a small cat.", "sister have", "sister has", "他/她后面用 has"),
+    ("we play football in the garden.", "we play", "We play", "句子开头要大写"),
+)
+CORRECT = "My favorite subject is English and I study it every day."
+
+
+def mistake(i: int):
+    """第 i 个句子的错误（每个句子带编号，互不相同）"""
+    sentence, original, revised, tip = MISTAKES[(i // 2) % len(MISTAKES)]
+    return sentence.replace(".", f" on day {i}."), original, revised, tip
+
+
+def make_essay(sentences: int, fixed: int):
+    """前 fixed 个错误已经改正的作文"""
+    lines = []
+    for i in range(sentences):
+        if i % 2:
+            lines.append(CORRECT.replace("English", f"English {i}"))
+            continue
+        sentence, original, revised, _ = mistake(i)
+        lines.append(sentence.replace(original, revised) if i // 2 < fixed else sentence)
+    return " ".join(lines)
+
+
+def make_feedback(essay: str, sentences: int, fixed: int):
+    """每个还没改正的错误一条修改建议的批改结果"""
+    rows = []
+    for i in range(0, sentences, 2):
+        if i // 2 < fixed:
+            continue
+        sentence, original, revised, tip = mistake(i)
+        rows.append(f"| {sentence} | {sentence.replace(original, revised)} | {tip} |")
+    return ("### 🌟 总体评价\n\n你写得很认真！句子都很清楚。\n\n"
+            "### ✏️ 修改建议\n\n| 原文 | 修改后 | 小贴士 |\n|------|--------|---------|\n" + "\n".join(rows) +
+            "\n\n### 💡 写得更好的小建议\n\n试试用 because 把两个句子连起来。\n\n"
+            "### ✨ 今天学一个新知识\n\n过去式的规则变化是在动词后面加 -ed。\n\n"
+            "### 🎯 继续加油\n\n" + "你真棒！" * 10 + f"\n\n（共 {len(essay)} 个字符）")
+
+
+def make_revision(plan: RevisionPlan):
+    """增量批改的回复：改动的句子都改对了，每句表扬一行"""
+    praise = "\n".join(f"- {sentence} 改得很好！" for sentence in plan.changed)
+    return "### 🌟 进步的地方\n\n" + praise + "\n\n### ✏️ 修改建议\n\n全部正确！\n\n### 🎯 继续加油\n\n加油！"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sentences", type=int, default=20, help="作文的句子数")
+    parser.add_argument("--rounds", type=int, default=5, help="修改的轮数")
+    parser.add_argument("--fixes-per-round", type=int, default=2, help="每轮改正的错误数")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    essay = make_essay(args.sentences, 0)
+    feedback = make_feedback(essay, args.sentences, 0)
+    rounds = []
+    for round_number in range(1, args.rounds + 1):
+        fixed = round_number * args.fixes_per_round
+        revised = make_essay(args.sentences, fixed)
+        began = time.perf_counter()
+        plan = RevisionPlan(essay, feedback, revised)
+        diff_seconds = time.perf_counter() - began
+        response = make_revision(plan) if plan.mode == "incremental" else ""
+        savings = plan.savings(response)
+        rounds.append({
+            "round": round_number,
+            "mode": plan.mode,
+            "changed": len(plan.changed),
+            "reused": len(plan.reused),
+            "resolved": len(plan.resolved),
+            "diff_seconds": diff_seconds,
+            **savings,
+        })
+        essay = revised
+        feedback = plan.merge(response) if response else (feedback if plan.mode == "unchanged" else
+                                                          make_feedback(revised, args.sentences, fixed))
+    total = {key: sum(row[key] for row in rounds)
+             for key in ("prompt_full", "prompt_saved", "completion_full", "completion_saved")}
+    report = {"config": vars(args), "rounds": rounds, "total": total}
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"{args.sentences} 个句子的作文，修改 {args.rounds} 轮，每轮改正 {args.fixes_per_round} 处")
+    print(f"{'轮次':<6}{'模式':<13}{'改动句子':>8}{'沿用建议':>8}{'已改正':>7}"
+          f"{'输入省':>8}{'/完整':>7}{'输出省':>8}{'/完整':>7}{'比较耗时':>10}")
+    for row in rounds:
+        print(f"{row['round']:<6}{row['mode']:<13}{row['changed']:>8}{row['reused']:>8}{row['resolved']:>7}"
+              f"{row['prompt_saved']:>8}{row['prompt_full']:>7}{row['completion_saved']:>8}{row['completion_full']:>7}"
+              f"{row['diff_seconds'] * 1e6:>8.0f}µs")
+    prompt_ratio = total["prompt_saved"] / total["prompt_full"] if total["prompt_full"] else 0.0
+    completion_ratio = total["completion_saved"] / total["completion_full"] if total["completion_full"] else 0.0
+    print(f"合计少发送 {total['prompt_saved']} 个输入token（{prompt_ratio:.0%}），"
+          f"少生成 {total['completion_saved']} 个输出token（{completion_ratio:.0%}）")
+
+
+if __name__ == "__main__":
+    main()
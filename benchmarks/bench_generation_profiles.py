@@ -0,0 +1,95 @@
+"""
+生成参数基准：按模块的 max_tokens 和自适应 max_tokens 能少预留多少输出token
+
+每个模块（story/chat/writer）各起一个模拟服务，回复长度按 --*-tokens 设置并随机浮动 --token-spread，
+开启自适应模式后用流式请求（带 stream_options.include_usage）依次发出，报告每个模块：
+全局 MAX_TOKENS、模块固定上限和自适应上限三种方式的总预留token数、实际输出token的p50/p99、
+最终的自适应上限以及被截断的响应数。
+
+用法:
+    python benchmarks/bench_generation_profiles.py [--requests 200] [--story-tokens 900]
+                                                   [--chat-tokens 120] [--writer-tokens 1500]
+                                                   [--token-spread 0.5] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.mock_llm_server import MockConfig, start_in_thread  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="每个模块的请求数")
+    parser.add_argument("--story-tokens", type=int, default=900, help="故事回复的平均token数")
+    parser.add_argument("--chat-tokens", type=int, default=120, help="聊天回复的平均token数")
+    parser.add_argument("--writer-tokens", type=int, default=1500, help="作文批改回复的平均token数")
+    parser.add_argument("--token-spread", type=float, default=0.5, help="回复长度的随机浮动比例")
+    parser.add_argument("--seed", type=int, default=11, help="回复长度的随机种子")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    # 配置在导入客户端时读取，所以先设置环境变量
+    os.environ.update({
+        "ADAPTIVE_MAX_TOKENS": "true",
+        "STREAM_INCLUDE_USAGE": "true",
+        "SINGLE_FLIGHT_ENABLED": "false",
+        "HEDGE_MODULES": "",
+        "OPENAI_API_ENDPOINTS": "",
+    })
+    from config.settings import MAX_TOKENS
+    from utils.transport import SimpleAPIClient, get_generation_stats
+
+    lengths = {"story": args.story_tokens, "chat": args.chat_tokens, "writer": args.writer_tokens}
+    servers = []
+    try:
+        for index, (module, tokens) in enumerate(lengths.items()):
+            config = MockConfig(ttft=0.0, token_delay=0.0, tokens=tokens,
+                                seed=args.seed + index, token_spread=args.token_spread)
+            server, api_base = start_in_thread(config)
+            servers.append(server)
+            client = SimpleAPIClient("bench-key", api_base)
+            for i in range(args.requests):
+                messages = [{"role": "user", "content": f"{module} request #{i}"}]
+                for _ in client.chat_completion(messages, stream=True, module=module):
+                    pass
+            client.close()
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    results = {}
+    for profile in get_generation_stats():
+        requests = profile["requests"]
+        results[profile["module"]] = {
+            "requests": requests,
+            "reserved_global": MAX_TOKENS * requests,
+            "reserved_profile": profile["max_tokens"] * requests,
+            "reserved_adaptive": profile["reserved"],
+            "completion_p50": profile["completion_p50"],
+            "completion_p99": profile["completion_p99"],
+            "final_max_tokens": profile["current_max_tokens"],
+            "truncated": profile["truncated"],
+        }
+    report = {"config": vars(args), "max_tokens": MAX_TOKENS, "results": results}
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"每个模块 {args.requests} 个流式请求，全局 MAX_TOKENS={MAX_TOKENS}")
+    print(f"{'模块':<8}{'全局预留':>12}{'模块上限':>12}{'自适应':>12}{'节省':>8}"
+          f"{'输出p50':>9}{'输出p99':>9}{'最终上限':>9}{'截断':>6}")
+    for module, row in results.items():
+        saved = 1 - row["reserved_adaptive"] / row["reserved_global"] if row["reserved_global"] else 0.0
+        print(f"{module:<8}{row['reserved_global']:>12}{row['reserved_profile']:>12}{row['reserved_adaptive']:>12}"
+              f"{saved:>8.0%}{row['completion_p50']:>9.0f}{row['completion_p99']:>9.0f}"
+              f"{row['final_max_tokens']:>9}{row['truncated']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+本地语法预检查基准：每秒能检查多少篇作文、单篇耗时和各规则的命中数
+
+用句型模板随机合成小学生作文（约一半的句子带有常见错误：过去时间词配现在时、
+like read、he go、句首小写等），在同一进程里反复检查（正则只在导入时编译一次）。
+开始前先确认 NO_HINT 中的正确句子没有任何提示。
+
+用法:
+    python benchmarks/bench_grammar_check.py [--essays 5000] [--sentences 8] [--json]
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config.settings import DEFAULT_WRITING_SAMPLE  # noqa: E402
+from utils.grammar_check import check_grammar  # noqa: E402
+from utils.latency import summarize_latencies  # noqa: E402
+
+SUBJECTS = ("I", "We", "They", "He", "She", "My friend")
+ACTIVITIES = ("play football", "read books", "watch TV", "go to the park", "eat noodles", "swim in the river",
+              "visit my grandma", "draw a cat", "ride a bike", "sing songs")
+CORRECT = (
+    "Yesterday {s} went to the zoo.", "{s} like to {a} every day.", "Last weekend we visited the museum.",
+    "My mother likes cooking.", "It was a sunny day.", "I enjoy reading stories.", "She goes to school by bus.",
+    "On Sunday we {a} together.", "He can {a} very well.", "I want to {a} tomorrow.",
+)
+WRONG = (
+    "Yesterday {s} go to the zoo.", "I like {v} with my friends.", "Last weekend we visit the museum.",
+    "he {v} every day.", "she don't like milk.", "They is very happy.", "I want {v} after school.",
+    "i enjoy {v} on monday.", "Two days ago I eat a big cake.", "my brother and i love english.",
+)
+
+# 正确的句子，不能有任何提示（误报会教给孩子错误的语法）
+NO_HINT = (
+    "Tom and I are friends.", "My mother and I are happy.", "My friend and I were at home yesterday.",
+    "It likes fish.", "I need help.",
+)
+
+
+def synthesize(count: int, sentences: int, seed: int = 3):
+    """生成作文列表"""
+    rng = random.Random(seed)
+    essays = []
+    for _ in range(count):
+        parts = []
+        for _ in range(sentences):
+            activity = rng.choice(ACTIVITIES)
+            template = rng.choice(WRONG if rng.random() < 0.5 else CORRECT)
+            parts.append(template.format(s=rng.choice(SUBJECTS), a=activity, v=activity.split()[0]))
+        essays.append(" ".join(parts))
+    return essays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--essays", type=int, default=5000, help="作文篇数")
+    parser.add_argument("--sentences", type=int, default=8, help="每篇作文的句子数")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    for sentence in NO_HINT:
+        hints = check_grammar(sentence)
+        assert not hints, f"误报：{sentence} → {[(hint['text'], hint['suggestion']) for hint in hints]}"
+
+    essays = synthesize(args.essays, args.sentences)
+    check_grammar(DEFAULT_WRITING_SAMPLE)  # 预热
+
+    rules = collections.Counter()
+    latencies = []
+    start = time.perf_counter()
+    for essay in essays:
+        began = time.perf_counter()
+        hints = check_grammar(essay)
+        latencies.append(time.perf_counter() - began)
+        rules.update(hint["rule"] for hint in hints)
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "config": vars(args),
+        "essays_per_second": args.essays / elapsed if elapsed else 0.0,
+        "latency": summarize_latencies(latencies),
+        "hints_per_essay": sum(rules.values()) / args.essays if args.essays else 0.0,
+        "rules": dict(rules),
+        "sample_hints": [(hint["text"], hint["suggestion"]) for hint in check_grammar(DEFAULT_WRITING_SAMPLE)],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    latency = report["latency"]
+    print(f"{args.essays} 篇作文，每篇 {args.sentences} 句")
+    print(f"每秒检查 {report['essays_per_second']:.0f} 篇，单篇 p50 {latency['p50'] * 1e6:.0f}µs "
+          f"p99 {latency['p99'] * 1e6:.0f}µs")
+    print(f"平均每篇 {report['hints_per_essay']:.1f} 条提示：" +
+          "，".join(f"{rule} {count}" for rule, count in rules.most_common()))
+    print("示例作文：" + "，".join(f"{text} → {suggestion}" for text, suggestion in report["sample_hints"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+对冲请求基准：上游偶尔很慢时，对冲能把首token的长尾压下来多少
+
+模拟服务按 --slow-rate 的比例让请求的首token延迟变成 --slow-ttft-ms（模拟30秒级的长尾），
+同样的请求序列分别在不开对冲（plain模块）和开对冲（story模块）时各跑一遍
+（各先预热 HEDGE_MIN_SAMPLES 个请求，让对冲等待时间按分位计算），
+报告首token时间p50/p95/p99/最大值、对冲次数、对冲获胜次数和上游实际收到的请求数。
+
+用法:
+    python benchmarks/bench_hedging.py [--requests 200] [--ttft-ms 50] [--slow-rate 0.05]
+                                       [--slow-ttft-ms 2000] [--hedge-percentile 95]
+                                       [--hedge-max-rate 0.1] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.mock_llm_server import MockConfig, start_in_thread  # noqa: E402
+
+WARMUP = 20
+
+
+def run(client, module: str, count: int):
+    """顺序发出流式请求，返回 (首token时间列表, 总耗时列表)"""
+    ttfts, totals = [], []
+    for i in range(count):
+        messages = [{"role": "user", "content": f"Tell me a story about a {module} cat. #{i}"}]
+        start = time.perf_counter()
+        first = None
+        for _ in client.chat_completion(messages, stream=True, module=module):
+            if first is None:
+                first = time.perf_counter() - start
+        ttfts.append(first if first is not None else time.perf_counter() - start)
+        totals.append(time.perf_counter() - start)
+    return ttfts, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="每种模式的请求数")
+    parser.add_argument("--ttft-ms", type=float, default=50, help="正常请求的首token延迟（毫秒）")
+    parser.add_argument("--tokens", type=int, default=20, help="每条回复的token数")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="慢请求比例")
+    parser.add_argument("--slow-ttft-ms", type=float, default=2000, help="慢请求的首token延迟（毫秒）")
+    parser.add_argument("--hedge-percentile", type=float, default=95, help="对冲等待的首token延迟分位")
+    parser.add_argument("--hedge-max-rate", type=float, default=0.1, help="对冲请求比例上限")
+    parser.add_argument("--seed", type=int, default=7, help="慢请求的随机种子")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    # 配置在导入客户端时读取，所以先设置环境变量
+    os.environ.update({
+        "HEDGE_MODULES": "story",
+        "HEDGE_PERCENTILE": str(args.hedge_percentile),
+        "HEDGE_MAX_RATE": str(args.hedge_max_rate),
+        "HEDGE_MIN_SAMPLES": str(WARMUP),
+        "HEDGE_INITIAL_DELAY": str(args.slow_ttft_ms / 1000.0),
+        "SINGLE_FLIGHT_ENABLED": "false",
+        "OPENAI_API_ENDPOINTS": "",
+    })
+    from utils.transport import SimpleAPIClient, get_hedge_stats
+    from utils.latency import summarize_latencies
+
+    config = MockConfig(ttft=args.ttft_ms / 1000.0, token_delay=0.001, tokens=args.tokens,
+                        seed=args.seed, slow_rate=args.slow_rate, slow_ttft=args.slow_ttft_ms / 1000.0)
+    server, api_base = start_in_thread(config)
+    client = SimpleAPIClient("bench-key", api_base)
+    report = {"config": vars(args), "results": {}}
+    try:
+        for mode, module in (("plain", "plain"), ("hedged", "story")):
+            run(client, module, WARMUP)
+            before = config.requests
+            ttfts, totals = run(client, module, args.requests)
+            report["results"][mode] = {
+                "ttft": summarize_latencies(ttfts),
+                "total": summarize_latencies(totals),
+                "upstream_requests": config.requests - before,
+            }
+        report["results"]["hedged"]["hedge"] = get_hedge_stats()[0]
+    finally:
+        client.close()
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"{args.requests} 个请求/模式，{args.slow_rate:.0%} 的请求首token为 {args.slow_ttft_ms:.0f}ms")
+    print(f"{'模式':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'上游请求':>10}")
+    for mode, row in report["results"].items():
+        ttft = row["ttft"]
+        print(f"{mode:<10}{ttft['p50'] * 1000:>10.0f}{ttft['p95'] * 1000:>10.0f}"
+              f"{ttft['p99'] * 1000:>10.0f}{ttft['max'] * 1000:>10.0f}{row['upstream_requests']:>10}")
+    hedge = report["results"]["hedged"]["hedge"]
+    print(f"对冲 {hedge['hedges']} 次，对冲先到 {hedge['hedge_wins']} 次，超出比例上限 {hedge['rate_capped']} 次")
+
+
+if __name__ == "__main__":
+    main()
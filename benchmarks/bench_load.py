@@ -0,0 +1,362 @@
+"""
+并发会话压测：一个 `streamlit run app.py` 进程能同时服务多少个孩子
+
+用无头的 streamlit 进程和本地模拟服务（--ttft-ms、--token-delay-ms 模拟真实的生成速度），
+通过websocket（benchmarks/st_client.py）模拟多个浏览器会话。会话数按 --sessions 逐级增加
+（已有的会话保持连接），每一级运行 --duration 秒。每个会话按 --mix 的比例随机选择操作，
+两次操作之间停顿 --think-ms（上下浮动50%）：
+  story   在故事魔法屋点击“🎨 开始创作！”（流式生成）
+  chat    在聊天室发送一条消息（历史越来越长）
+  writer  在小作家修改作文后点击“📤 请老师批改！”（第一次完整批改，之后只批改改动的句子）
+切换功能模块记为 navigate，新会话建立连接记为 connect，这两种单独列出，不计入总体分位和吞吐。
+
+每一级报告各操作从发送到脚本运行结束的耗时分位、吞吐、失败数，以及 streamlit 进程的CPU占用和常驻内存（RSS）。
+每种操作以第一级的 p95 为基准，任何一种操作的 p95 比基准慢 --degrade-ms 以上、
+或失败率超过 --max-error-rate 的一级记为性能下降，它前面那一级的会话数就是单个进程的容量。
+
+加 --generation-service 时在本进程启动 generation_server.py，页面通过 GENERATION_SERVICE_URL 生成，
+用来比较把生成移出页面进程之后的容量。CPU和RSS只统计 streamlit 进程（只支持Linux）。
+
+用法:
+    python benchmarks/bench_load.py [--sessions 1,5,10,20,40] [--duration 20] [--mix story=2,chat=5,writer=3]
+                                    [--think-ms 2000] [--ttft-ms 300] [--token-delay-ms 20] [--tokens 150]
+                                    [--degrade-ms 1000] [--max-error-rate 0.01] [--generation-service]
+                                    [--seed 1] [--json] [--output load.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 每次都真正生成，不让缓存、相同请求合并和预取掩盖压力；
+# 配置在导入时读取，所以在导入之前设置（streamlit 进程和本进程里的生成服务都使用）
+os.environ.update({
+    "RESPONSE_CACHE_MODULES": "",
+    "SINGLE_FLIGHT_ENABLED": "false",
+    "STORY_PREFETCH_ENABLED": "false",
+    "STREAMING_OUTPUT": "true",
+})
+
+from benchmarks.mock_llm_server import MockConfig, start_in_thread  # noqa: E402
+from benchmarks.st_client import StreamlitSession, start_streamlit  # noqa: E402
+from config.settings import MODULES, DEFAULT_WRITING_SAMPLE  # noqa: E402
+from utils.latency import summarize_latencies  # noqa: E402
+
+FLOWS = ("story", "chat", "writer")
+CHAT_LINES = (
+    "Hello! How are you today?",
+    "What do you like to eat?",
+    "Can you tell me a story about your home?",
+    "What is your favorite color?",
+    "Do you have any friends?",
+)
+WRITER_EDITS = (
+    " I like read books after school.",
+    " My sister have a small cat.",
+    " We play football in the garden.",
+    " Tomorrow I will visit my grandma.",
+)
+
+
+def parse_mix(text: str):
+    """ "story=2,chat=5,writer=3" -> {"story": 2.0, ...} """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f"未知的操作: {name}（可选 {', '.join(FLOWS)}）")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("至少一种操作的比例要大于0")
+    return mix
+
+
+class ProcessSampler:
+    """定期读取一个进程的CPU时间和常驻内存（/proc/<pid>，只支持Linux）"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.peak_rss = 0
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                # 进程名可能带空格，从最后一个右括号之后开始数
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def rss_bytes(self):
+        try:
+            with open(f"/proc/{self.pid}/statm") as f:
+                rss = int(f.read().split()[1]) * self.page_size
+        except (OSError, IndexError, ValueError):
+            return None
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    async def watch(self, interval: float = 0.5):
+        while True:
+            self.rss_bytes()
+            await asyncio.sleep(interval)
+
+
+class SimulatedKid:
+    """一个模拟会话：记住当前所在的功能模块、写到第几版作文"""
+
+    def __init__(self, number: int, url: str, rng: random.Random):
+        self.number = number
+        self.session = StreamlitSession(url)
+        self.rng = rng
+        self.module = None
+        self.turn = 0
+        self.essay = DEFAULT_WRITING_SAMPLE
+        self.broken = False
+
+    async def connect(self, record):
+        await self.timed(record, "connect", self.session.connect())
+        await self.timed(record, "connect", self.session.click("🔗 连接API"))
+
+    async def act(self, flow: str, record):
+        if self.module != flow:
+            await self.timed(record, "navigate", self.session.select("选择你想使用的功能", MODULES[flow]))
+            self.module = flow
+        self.turn += 1
+        if flow == "story":
+            await self.timed(record, flow, self.session.click("🎨 开始创作！"))
+        elif flow == "chat":
+            line = CHAT_LINES[self.turn % len(CHAT_LINES)]
+            await self.timed(record, flow, self.session.chat(f"{line} (#{self.turn})"))
+        else:
+            # 每次在上一版作文后面接一句，重新提交时只批改改动的句子
+            self.essay += WRITER_EDITS[self.turn % len(WRITER_EDITS)].replace(".", f" on day {self.turn}.")
+            await self.session.set_text("在这里写下你的英文作品", self.essay)
+            await self.timed(record, flow, self.session.click("📤 请老师批改！"))
+
+    @staticmethod
+    async def timed(record, name, run):
+        try:
+            result = await run
+        except Exception as e:
+            record(name, None, f"{type(e).__name__}: {e}")
+            raise
+        record(name, result.elapsed, None if result.ok else result.status)
+
+
+async def run_level(kids, url, sessions, args, rng, sampler):
+    """把会话数增加到 sessions，所有会话一起运行 args.duration 秒"""
+    latencies = {}
+    errors = {}
+
+    def record(name, elapsed, error):
+        if error is None:
+            latencies.setdefault(name, []).append(elapsed)
+        else:
+            errors.setdefault(name, []).append(error)
+
+    flows, weights = zip(*[(name, weight) for name, weight in args.mix.items() if weight > 0])
+    think = args.think_ms / 1000.0
+
+    async def run_kid(kid, deadline, new):
+        try:
+            if new:
+                await kid.connect(record)
+            # 错开开始时间，避免所有会话同时点击
+            await asyncio.sleep(kid.rng.uniform(0, think))
+            while time.perf_counter() < deadline:
+                await kid.act(kid.rng.choices(flows, weights)[0], record)
+                await asyncio.sleep(think * kid.rng.uniform(0.5, 1.5))
+        except Exception:
+            # 这个会话已经坏掉（超时或断开），下一级重新连接
+            kid.broken = True
+
+    for kid in kids:
+        if kid.broken:
+            await kid.session.close()
+    kids[:] = [kid for kid in kids if not kid.broken]
+    existing = len(kids)
+    while len(kids) < sessions:
+        kids.append(SimulatedKid(len(kids), url, random.Random(rng.random())))
+
+    cpu_before = sampler.cpu_seconds()
+    harness_before = time.process_time()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*[run_kid(kid, deadline, i >= existing) for i, kid in enumerate(kids)])
+    wall = time.perf_counter() - started
+    cpu_after = sampler.cpu_seconds()
+
+    # 总体分位只统计生成类操作；切换模块和建立连接单独列出
+    interactions = [value for name in FLOWS for value in latencies.get(name, [])]
+    failed = sum(len(values) for name, values in errors.items() if name != "connect")
+    attempts = len(interactions) + failed
+    return {
+        "sessions": sessions,
+        "seconds": wall,
+        "interactions": len(interactions),
+        "throughput": len(interactions) / wall if wall else 0.0,
+        "errors": failed,
+        "error_rate": failed / attempts if attempts else 0.0,
+        "connect_errors": len(errors.get("connect", [])),
+        "first_error": next((e[0] for e in errors.values() if e), None),
+        "latency": summarize_latencies(interactions),
+        "flows": {name: summarize_latencies(values) for name, values in sorted(latencies.items())},
+        "cpu_percent": (cpu_after - cpu_before) / wall * 100 if cpu_before is not None and wall else None,
+        "rss": sampler.rss_bytes(),
+        "peak_rss": sampler.peak_rss or None,
+        "harness_cpu_percent": (time.process_time() - harness_before) / wall * 100 if wall else 0.0,
+    }
+
+
+def find_capacity(levels, degrade_ms: float, max_error_rate: float):
+    """
+    第一次性能下降的一级，以及它前面那一级的会话数（单个进程的容量）
+
+    每种操作（不含 connect）以最早有样本的一级为基准，p95 比基准慢 degrade_ms 以上就算下降。
+    生成类操作的耗时大部分是等上游，按比例比较会掩盖页面进程本身变慢，所以比较增加的毫秒数。
+
+    Returns:
+        (容量会话数或None, 下降的一级的会话数或None, 原因)
+    """
+    baseline = {}
+    capacity = None
+    for level in levels:
+        for name, row in level["flows"].items():
+            if name != "connect" and row["count"]:
+                baseline.setdefault(name, row["p95"])
+        reason = None
+        if level["error_rate"] > max_error_rate:
+            reason = f"失败率 {level['error_rate']:.1%}"
+        else:
+            slower, name = max(((row["p95"] - baseline[name], name) for name, row in level["flows"].items()
+                                if name in baseline and row["count"]), default=(0.0, None))
+            if slower * 1000 > degrade_ms:
+                reason = f"{name} p95 {level['flows'][name]['p95'] * 1000:.0f}ms，比基准慢 {slower * 1000:.0f}ms"
+        if reason:
+            return capacity, level["sessions"], reason
+        capacity = level["sessions"]
+    return capacity, None, None
+
+
+async def drive(url, args, sampler):
+    rng = random.Random(args.seed)
+    kids = []
+    levels = []
+    watcher = asyncio.ensure_future(sampler.watch())
+    try:
+        for sessions in args.sessions:
+            level = await run_level(kids, url, sessions, args, rng, sampler)
+            levels.append(level)
+            if not args.json:
+                print_level(level)
+            if args.stop_on_degrade:
+                _, degraded, _ = find_capacity(levels, args.degrade_ms, args.max_error_rate)
+                if degraded is not None:
+                    break
+    finally:
+        watcher.cancel()
+        for kid in kids:
+            await kid.session.close()
+    return levels
+
+
+def print_level(level):
+    latency = level["latency"]
+    cpu = f"{level['cpu_percent']:.0f}%" if level["cpu_percent"] is not None else "-"
+    rss = f"{level['peak_rss'] / 2**20:.0f}MB" if level["peak_rss"] else "-"
+    print(f"{level['sessions']:>5}{level['interactions']:>7}{level['throughput']:>8.1f}"
+          f"{latency['p50'] * 1000:>9.0f}{latency['p95'] * 1000:>9.0f}{latency['p99'] * 1000:>9.0f}"
+          f"{level['errors']:>6}{cpu:>8}{rss:>9}{level['harness_cpu_percent']:>8.0f}%", flush=True)
+    print("       " + " · ".join(f"{name} p50 {row['p50'] * 1000:.0f}ms p95 {row['p95'] * 1000:.0f}ms ×{row['count']}"
+                                  for name, row in level["flows"].items()), flush=True)
+    if level["first_error"]:
+        print(f"       失败示例: {level['first_error']}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=lambda s: [int(n) for n in s.split(",")], default=[1, 5, 10, 20, 40],
+                        help="逐级增加的并发会话数，逗号分隔")
+    parser.add_argument("--duration", type=float, default=20, help="每一级运行的秒数")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("story=2,chat=5,writer=3"),
+                        help="各操作的比例，例如 story=2,chat=5,writer=3")
+    parser.add_argument("--think-ms", type=float, default=2000, help="两次操作之间的平均停顿（毫秒）")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="模拟服务的首token延迟（毫秒）")
+    parser.add_argument("--token-delay-ms", type=float, default=20, help="模拟服务的token间隔（毫秒）")
+    parser.add_argument("--tokens", type=int, default=150, help="模拟回复的token数")
+    parser.add_argument("--degrade-ms", type=float, default=1000, help="任何一种操作的 p95 比第一级慢多少毫秒算性能下降")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="失败率超过该值算性能下降")
+    parser.add_argument("--stop-on-degrade", action="store_true", help="性能下降后不再增加会话数")
+    parser.add_argument("--generation-service", action="store_true",
+                        help="在本进程启动 generation_server.py，页面通过 GENERATION_SERVICE_URL 生成")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子（操作顺序和停顿）")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    parser.add_argument("--output", default=None, help="把JSON结果保存到文件")
+    args = parser.parse_args()
+
+    config = MockConfig(ttft=args.ttft_ms / 1000.0, token_delay=args.token_delay_ms / 1000.0, tokens=args.tokens)
+    server, api_base = start_in_thread(config)
+    env = {
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_API_BASE": api_base,
+        "OPENAI_MODEL": "mock-model",
+        "HTTP_POOL_MAXSIZE": str(max(args.sessions) * 2),
+    }
+    stop_service = None
+    if args.generation_service:
+        import generation_server
+        from utils.transport import SimpleAPIClient
+        stop_service, env["GENERATION_SERVICE_URL"] = generation_server.start_in_thread(
+            SimpleAPIClient("bench-key", api_base, pool_maxsize=max(args.sessions) * 2)
+        )
+
+    process, url = start_streamlit(env)
+    if not args.json:
+        print(f"模拟服务: 首token {args.ttft_ms:.0f}ms，token间隔 {args.token_delay_ms:.0f}ms，{args.tokens} tokens；"
+              f"每级 {args.duration:.0f}s，停顿 {args.think_ms:.0f}ms，比例 "
+              + ", ".join(f"{k}={v:g}" for k, v in args.mix.items())
+              + ("；生成服务独立运行" if args.generation_service else ""))
+        print(f"{'会话':>5}{'操作数':>7}{'次/秒':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'失败':>6}{'CPU':>8}{'RSS':>9}{'压测CPU':>9}")
+    try:
+        levels = asyncio.run(drive(url, args, ProcessSampler(process.pid)))
+    finally:
+        process.terminate()
+        process.wait()
+        if stop_service is not None:
+            stop_service()
+        server.shutdown()
+
+    capacity, degraded, reason = find_capacity(levels, args.degrade_ms, args.max_error_rate)
+    config_report = dict(vars(args), mix=args.mix)
+    report = {"config": config_report, "levels": levels,
+              "capacity": capacity, "degraded_at": degraded, "degrade_reason": reason}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    if degraded is None:
+        print(f"最多 {levels[-1]['sessions']} 个会话时性能没有明显下降（各操作的 p95 比第一级慢不到 {args.degrade_ms:.0f}ms）")
+    elif capacity is None:
+        print(f"第一级（{degraded} 个会话）就出现了失败：{reason}")
+    else:
+        print(f"{degraded} 个会话时性能下降（{reason}），单个进程的容量约为 {capacity} 个会话")
+    if any(level["harness_cpu_percent"] > 80 for level in levels):
+        print("注意：压测进程本身的CPU接近跑满，结果可能受压测端限制")
+
+
+if __name__ == "__main__":
+    main()
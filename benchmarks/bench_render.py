@@ -0,0 +1,111 @@
+"""
+流式渲染基准：逐片段渲染 vs RenderCoalescer 合并渲染
+
+模拟一条流式回复（按固定的token间隔到达），统计两种方式向浏览器
+发送的Markdown增量次数、发送的总字符数和渲染消耗的CPU时间。
+
+用法:
+    python benchmarks/bench_render.py [--tokens 600] [--interval-ms 20] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit as st  # noqa: E402
+from utils.stream_render import RenderCoalescer  # noqa: E402
+
+
+class CountingPlaceholder:
+    """转发到真实占位容器，同时统计增量次数和发送的字符数"""
+
+    def __init__(self, placeholder):
+        self.placeholder = placeholder
+        self.deltas = 0
+        self.chars_sent = 0
+
+    def markdown(self, body):
+        self.deltas += 1
+        self.chars_sent += len(body)
+        return self.placeholder.markdown(body)
+
+    def empty(self):
+        self.deltas += 1
+        return self.placeholder.empty()
+
+
+class SimulatedClock:
+    """模拟时钟：每个token到达时前进固定间隔"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_chunks(tokens: int):
+    """生成一条类似聊天回复的token序列"""
+    words = "Hello there little friend ! I am a friendly robot from the future .".split()
+    return [(" " if i else "") + words[i % len(words)] for i in range(tokens)]
+
+
+def run_naive(chunks):
+    """原来的做法：每个片段都重新渲染整段文本"""
+    placeholder = CountingPlaceholder(st.empty())
+    start = time.process_time()
+    full_response = ""
+    for chunk in chunks:
+        full_response += chunk
+        placeholder.markdown(full_response + "▌")
+    placeholder.markdown(full_response)
+    return placeholder, time.process_time() - start
+
+
+def run_coalesced(chunks, interval):
+    """按帧合并渲染"""
+    placeholder = CountingPlaceholder(st.empty())
+    clock = SimulatedClock()
+    coalescer = RenderCoalescer(placeholder, clock=clock)
+    start = time.process_time()
+    for chunk in chunks:
+        clock.now += interval
+        coalescer.append(chunk)
+    coalescer.close()
+    return placeholder, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=600, help="回复的token数")
+    parser.add_argument("--interval-ms", type=float, default=20.0, help="token之间的间隔（毫秒）")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.tokens)
+    naive, naive_cpu = run_naive(chunks)
+    coalesced, coalesced_cpu = run_coalesced(chunks, args.interval_ms / 1000.0)
+
+    result = {
+        "tokens": args.tokens,
+        "interval_ms": args.interval_ms,
+        "naive": {"deltas": naive.deltas, "chars_sent": naive.chars_sent, "cpu_ms": naive_cpu * 1000},
+        "coalesced": {"deltas": coalesced.deltas, "chars_sent": coalesced.chars_sent, "cpu_ms": coalesced_cpu * 1000},
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    print(f"回复长度: {args.tokens} tokens，间隔 {args.interval_ms:.0f} ms")
+    print(f"{'方式':<12}{'增量次数':>10}{'发送字符数':>14}{'CPU(ms)':>10}")
+    for name in ("naive", "coalesced"):
+        row = result[name]
+        print(f"{name:<12}{row['deltas']:>10}{row['chars_sent']:>14}{row['cpu_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+交互重跑基准：每次交互在服务端执行脚本花多少时间、向浏览器发送多少元素
+
+用无头的 `streamlit run app.py` 和本地模拟服务（首token和token间隔都为0，
+只测脚本本身的开销），通过websocket像浏览器一样操作页面：
+  - sidebar_typing   在侧边栏API密钥输入框里输入
+  - chat_message     在聊天室发送一条消息（历史越来越长）
+  - chat_tips        点击“💡 对话提示”
+  - story_generate   点击“🎨 开始创作！”
+  - story_feedback   故事生成后点击“👍 很棒的故事！”
+  - writer_submit    点击“📤 请老师批改！”
+
+报告每种交互的耗时p50/p95（毫秒，发送到运行结束）、发送的元素增量数，以及是否只重跑了片段。
+
+用法:
+    python benchmarks/bench_rerun.py [--repeat 10] [--json] [--output after.json] [--compare before.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.mock_llm_server import MockConfig, start_in_thread  # noqa: E402
+from benchmarks.st_client import StreamlitSession, start_streamlit  # noqa: E402
+from config.settings import MODULES, DEFAULT_WRITING_SAMPLE  # noqa: E402
+from utils.latency import summarize_latencies  # noqa: E402
+
+
+async def drive(url: str, repeat: int):
+    """按顺序执行各种交互，返回 {交互名: [RunResult, ...]}"""
+    session = StreamlitSession(url)
+    results = {}
+
+    def record(name, result):
+        if not result.ok:
+            raise RuntimeError(f"{name} 运行失败: {result.status}")
+        results.setdefault(name, []).append(result)
+
+    await session.connect()
+    record("connect", await session.click("🔗 连接API"))
+
+    for i in range(repeat):
+        record("sidebar_typing", await session.set_text("API密钥", f"bench-key-{i}"))
+
+    await session.select("选择你想使用的功能", MODULES["chat"])
+    for i in range(repeat):
+        record("chat_message", await session.chat(f"Hello, how are you? #{i}"))
+        record("chat_tips", await session.click("💡 对话提示"))
+
+    await session.select("选择你想使用的功能", MODULES["story"])
+    for _ in range(repeat):
+        record("story_generate", await session.click("🎨 开始创作！"))
+        record("story_feedback", await session.click("👍 很棒的故事！"))
+
+    await session.select("选择你想使用的功能", MODULES["writer"])
+    await session.set_text("在这里写下你的英文作品", DEFAULT_WRITING_SAMPLE)
+    for _ in range(repeat):
+        record("writer_submit", await session.click("📤 请老师批改！"))
+
+    await session.close()
+    return results
+
+
+def summarize(runs):
+    latency = summarize_latencies([r.elapsed * 1000 for r in runs])
+    return {
+        "runs": len(runs),
+        "p50_ms": latency["p50"],
+        "p95_ms": latency["p95"],
+        "mean_deltas": sum(r.deltas for r in runs) / len(runs),
+        "fragment_runs": sum(r.fragment for r in runs),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="每种交互的次数")
+    parser.add_argument("--tokens", type=int, default=80, help="模拟回复的token数")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    parser.add_argument("--output", default=None, help="把JSON结果保存到文件")
+    parser.add_argument("--compare", default=None, help="与之前保存的JSON结果比较")
+    args = parser.parse_args()
+
+    server, api_base = start_in_thread(MockConfig(ttft=0, token_delay=0, tokens=args.tokens))
+    process, url = start_streamlit({
+        "OPENAI_API_KEY": "bench-key",
+        "OPENAI_API_BASE": api_base,
+        "OPENAI_MODEL": "mock-model",
+        "RESPONSE_CACHE_MODULES": "",
+        "STREAMING_OUTPUT": "true",
+    })
+    try:
+        runs = asyncio.run(drive(url, args.repeat))
+    finally:
+        process.terminate()
+        process.wait()
+        server.shutdown()
+
+    import streamlit
+    report = {
+        "config": {"repeat": args.repeat, "tokens": args.tokens, "streamlit": streamlit.__version__},
+        "results": {name: summarize(items) for name, items in runs.items()},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    print(f"streamlit {streamlit.__version__}，每种交互 {args.repeat} 次")
+    print(f"{'交互':<18}{'p50 ms':>10}{'p95 ms':>10}{'元素增量':>10}{'片段重跑':>10}")
+    for name, row in report["results"].items():
+        print(f"{name:<18}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['mean_deltas']:>10.1f}"
+              f"{row['fragment_runs']:>7}/{row['runs']}")
+        old = baseline.get(name)
+        if old:
+            print(f"{'  之前':<18}{old['p50_ms']:>10.1f}{old['p95_ms']:>10.1f}{old['mean_deltas']:>10.1f}"
+                  f"{old['fragment_runs']:>7}/{old['runs']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+SSE解析吞吐量基准
+
+在录制的流式响应（benchmarks/data/recorded_stream.sse）上比较：
+  - legacy: 原来的 iter_lines + 逐行decode + json.loads
+  - parser: 增量字节解析器 SSEParser + 当前JSON解码器（装了orjson时使用orjson）
+
+录制的数据按网络包大小切片后反复解析，报告MB/s和事件/秒。
+
+用法:
+    python benchmarks/bench_sse_parser.py [--packet-size 1400] [--repeat 200] [--json]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests  # noqa: E402
+from utils.transport import read_stream_event  # noqa: E402
+from utils.sse_parser import SSEParser, JSON_DECODER  # noqa: E402
+
+RECORDED_STREAM = os.path.join(ROOT, "benchmarks", "data", "recorded_stream.sse")
+
+
+class PacketReader(io.RawIOBase):
+    """把录制的字节流按固定大小的“网络包”返回"""
+
+    def __init__(self, body: bytes, packet_size: int):
+        self.body = body
+        self.packet_size = packet_size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.packet_size
+        size = min(size, self.packet_size)
+        data = self.body[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+
+def legacy_parse(body: bytes, packet_size: int):
+    """原来的实现：requests.iter_lines + decode + json.loads"""
+    response = requests.Response()
+    response.raw = PacketReader(body, packet_size)
+    parts = []
+    for line in response.iter_lines():
+        if line:
+            line = line.decode('utf-8')
+            if line.startswith('data: '):
+                line = line[6:]
+                if line == '[DONE]':
+                    break
+                try:
+                    chunk = json.loads(line)
+                    if chunk.get('choices') and len(chunk['choices']) > 0:
+                        delta = chunk['choices'][0].get('delta', {})
+                        if delta.get('content'):
+                            parts.append(delta['content'])
+                except json.JSONDecodeError:
+                    continue
+    return "".join(parts)
+
+
+def parser_parse(packets):
+    """新实现：增量字节解析"""
+    parser = SSEParser()
+    parts = []
+    for packet in packets:
+        for event in parser.feed(packet):
+            done, content = read_stream_event(event)
+            if done:
+                return "".join(parts)
+            if content:
+                parts.append(content)
+    return "".join(parts)
+
+
+def measure(fn, repeat):
+    """返回每次解析的平均耗时（秒）"""
+    fn()  # 预热
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--packet-size", type=int, default=1400, help="模拟网络包大小（字节）")
+    parser.add_argument("--repeat", type=int, default=200, help="重复解析次数")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    with open(RECORDED_STREAM, "rb") as f:
+        body = f.read()
+    packets = [body[i:i + args.packet_size] for i in range(0, len(body), args.packet_size)]
+    events = body.count(b"\n\n")
+
+    expected = legacy_parse(body, args.packet_size)
+    assert parser_parse(packets) == expected, "两种实现的解析结果不一致"
+
+    results = {}
+    for name, fn in (
+        ("legacy", lambda: legacy_parse(body, args.packet_size)),
+        ("parser", lambda: parser_parse(packets)),
+    ):
+        seconds = measure(fn, args.repeat)
+        results[name] = {
+            "ms_per_stream": seconds * 1000,
+            "mb_per_s": len(body) / seconds / 1e6,
+            "events_per_s": events / seconds,
+        }
+
+    report = {
+        "stream_bytes": len(body),
+        "events": events,
+        "packet_size": args.packet_size,
+        "json_decoder": JSON_DECODER,
+        "results": results,
+        "speedup": results["legacy"]["ms_per_stream"] / results["parser"]["ms_per_stream"],
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"录制流: {len(body)} 字节, {events} 个事件, 包大小 {args.packet_size}, JSON解码器 {JSON_DECODER}")
+    print(f"{'实现':<10}{'ms/流':>10}{'MB/s':>10}{'事件/秒':>14}")
+    for name, row in results.items():
+        print(f"{name:<10}{row['ms_per_stream']:>10.3f}{row['mb_per_s']:>10.1f}{row['events_per_s']:>14.0f}")
+    print(f"加速比: {report['speedup']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+离线故事库基准：构建耗时、文件大小、打开耗时和单次查询耗时
+
+用词表随机合成故事（带标题、正文和词汇表，结构和真实生成结果一致），
+构建故事库后打开并用随机关键词查询。
+
+用法:
+    python benchmarks/bench_story_library.py [--stories 30000] [--queries 2000] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.latency import summarize_latencies  # noqa: E402
+from utils.story_library import build_library, StoryLibrary  # noqa: E402
+
+NOUNS = ("dragon castle magic robot space friend cat dog forest river moon star princess pirate ship "
+         "treasure garden school teacher rabbit bear apple cake rainbow cloud rocket dinosaur unicorn "
+         "wizard owl island volcano snow tree flower bird fish ocean mountain train bicycle kite").split()
+VERBS = "found loved wanted saw helped played flew jumped ran laughed shared built opened".split()
+ADJECTIVES = "shiny happy tiny huge brave kind magic secret golden funny sleepy".split()
+
+
+def synthesize(count: int, seed: int = 1):
+    """生成 (关键词, 故事) 序列"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        keywords = rng.sample(NOUNS, 3)
+        sentences = []
+        for _ in range(14):
+            sentences.append(f"The {rng.choice(ADJECTIVES)} {rng.choice(keywords + NOUNS[:5])} "
+                             f"{rng.choice(VERBS)} a {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}.")
+        vocabulary = "\n".join(f"| {word} | 意思 | I like the {word}. |" for word in rng.sample(NOUNS, 5))
+        story = (f"### The {keywords[0].title()} and the {keywords[1].title()}\n\n" + " ".join(sentences)
+                 + "\n\n| 单词 | 中文意思 | 例句 |\n|------|---------|------|\n" + vocabulary)
+        yield ", ".join(keywords), story
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stories", type=int, default=30000, help="故事数")
+    parser.add_argument("--queries", type=int, default=2000, help="查询次数")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "story_library.bin")
+        start = time.perf_counter()
+        stats = build_library(synthesize(args.stories), path)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        library = StoryLibrary(path)
+        open_ms = (time.perf_counter() - start) * 1000
+
+        rng = random.Random(2)
+        search_us, get_us = [], []
+        for _ in range(args.queries):
+            keywords = ", ".join(rng.sample(NOUNS, rng.randint(1, 3)))
+            start = time.perf_counter()
+            story_id, _ = library.search(keywords)
+            search_us.append((time.perf_counter() - start) * 1e6)
+            start = time.perf_counter()
+            library.get(story_id)
+            get_us.append((time.perf_counter() - start) * 1e6)
+        library.close()
+
+    report = {
+        "library": {**stats, "build_seconds": round(build_seconds, 2), "open_ms": round(open_ms, 3),
+                    "bytes_per_story": round(stats["bytes"] / max(stats["stories"], 1), 1)},
+        "search_us": summarize_latencies(search_us),
+        "get_us": summarize_latencies(get_us),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    lib = report["library"]
+    print(f"{lib['stories']} 个故事，{lib['terms']} 个词条，文件 {lib['bytes'] / 1024 / 1024:.1f} MiB"
+          f"（每个故事 {lib['bytes_per_story']:.0f} 字节），构建 {lib['build_seconds']}s，打开 {lib['open_ms']}ms")
+    for name in ("search_us", "get_us"):
+        row = report[name]
+        print(f"{name:<10} p50 {row['p50']:.0f}µs  p95 {row['p95']:.0f}µs  p99 {row['p99']:.0f}µs")
+
+
+if __name__ == "__main__":
+    main()
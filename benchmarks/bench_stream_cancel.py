@@ -0,0 +1,231 @@
+"""
+流式响应取消和超时基准：没人再读的流多快释放上游连接
+
+各种情况各并发 --streams 个流式请求（模拟服务在输出到一半时卡住 --stall-ms）：
+  abandon     读到一半就不再读取，也不关闭（原来页面重跑时的情况），等待 --hold-ms 后看上游还占着多少连接
+  cancel      读到一半时从另一个线程触发取消令牌（“开始新对话”、切换角色），记录到上游连接断开的耗时
+  first_byte  首字节要等 --stall-ms，还没收到首字节时取消，记录到上游连接断开的耗时
+  hedged      同上，但开启了对冲请求：主请求和对冲请求都在等首字节时取消，两个连接都要断开，也不再对冲
+  stall       一直读取，靠 LLM_STREAM_IDLE_TIMEOUT 发现卡住的流，记录从卡住到报超时的耗时
+报告每种情况结束时模拟服务上仍在输出的流数，以及取消和超时的计数。
+
+用法:
+    python benchmarks/bench_stream_cancel.py [--streams 20] [--stall-ms 10000] [--idle-timeout 1]
+                                             [--hold-ms 1000] [--json]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.mock_llm_server import MockConfig, start_in_thread  # noqa: E402
+from utils.latency import summarize_latencies  # noqa: E402
+
+
+def wait_until(condition, deadline: float) -> bool:
+    """等待条件成立，超过 deadline（perf_counter 时间）返回False"""
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(0.001)
+    return False
+
+
+def open_streams(client, streams: int, cancels=None):
+    """并发发出流式请求，每个读到卡住为止（前半段输出），返回 (片段迭代器列表, 错误列表)"""
+    from utils.cancellation import CancelToken
+
+    iterators = [None] * streams
+    errors = []
+    ready = threading.Barrier(streams + 1)
+
+    def worker(i):
+        token = CancelToken() if cancels is not None else None
+        if cancels is not None:
+            cancels[i] = token
+        chunks = client.chat_completion([{"role": "user", "content": f"stream #{i}"}], stream=True,
+                                        module="chat", cancel=token)
+        iterators[i] = chunks
+        try:
+            next(chunks)
+        except Exception as e:
+            errors.append(str(e))
+        ready.wait()
+
+    for i in range(streams):
+        threading.Thread(target=worker, args=(i,), daemon=True).start()
+    ready.wait()
+    return iterators, errors
+
+
+def run_abandon(client, config, args):
+    iterators, _ = open_streams(client, args.streams)
+    time.sleep(args.hold_ms / 1000.0)
+    held = config.active_streams
+    # 保留引用到这里，模拟没有关闭的生成器
+    del iterators
+    return {"held_after_hold": held}
+
+
+def run_cancel(client, config, args):
+    cancels = [None] * args.streams
+    iterators, _ = open_streams(client, args.streams, cancels)
+    # 等所有流都卡住后再取消，计时只包括断开连接
+    time.sleep(0.2)
+    latencies = []
+    for token in cancels:
+        before = config.disconnects
+        began = time.perf_counter()
+        token.cancel("bench")
+        if wait_until(lambda: config.disconnects > before, began + 5):
+            latencies.append(time.perf_counter() - began)
+    for chunks in iterators:
+        for _ in chunks:
+            pass
+    wait_until(lambda: config.active_streams == 0, time.perf_counter() + 1)
+    return {"release": summarize_latencies(latencies), "released": len(latencies),
+            "held_after_cancel": config.active_streams}
+
+
+def run_first_byte(client, config, args, module="chat", attempts=1):
+    """
+    在等待首字节时取消
+
+    开启对冲的模块（attempts=2）在主请求和对冲请求都发出后才取消，两个连接都应断开。
+    """
+    from utils.cancellation import CancelToken
+
+    cancels = [CancelToken() for _ in range(args.streams)]
+    errors = []
+
+    def worker(i):
+        try:
+            for _ in client.chat_completion([{"role": "user", "content": f"first byte #{i}"}], stream=True,
+                                            module=module, cancel=cancels[i]):
+                pass
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.streams)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: config.active_streams == args.streams * attempts, time.perf_counter() + 5)
+    opened = config.active_streams
+    latencies = []
+    for token in cancels:
+        before = config.disconnects
+        began = time.perf_counter()
+        token.cancel("bench")
+        if wait_until(lambda: config.disconnects >= before + attempts, began + 5):
+            latencies.append(time.perf_counter() - began)
+    for thread in threads:
+        thread.join(5)
+    wait_until(lambda: config.active_streams == 0, time.perf_counter() + 1)
+    assert not errors, errors[0]
+    assert len(latencies) == args.streams, f"只断开了 {len(latencies)}/{args.streams} 个请求的连接"
+    return {"release": summarize_latencies(latencies), "released": len(latencies), "opened": opened,
+            "held_after_cancel": config.active_streams}
+
+
+def run_hedged_first_byte(client, config, args):
+    return run_first_byte(client, config, args, module="writer", attempts=2)
+
+
+def run_stall(client, config, args):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(i):
+        chunks = client.chat_completion([{"role": "user", "content": f"stall #{i}"}], stream=True, module="chat")
+        last = time.perf_counter()
+        try:
+            for _ in chunks:
+                last = time.perf_counter()
+        except Exception as e:
+            with lock:
+                latencies.append(time.perf_counter() - last)
+                errors.append(str(e))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.streams)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wait_until(lambda: config.active_streams == 0, time.perf_counter() + 1)
+    return {"detect": summarize_latencies(latencies), "timed_out": len(latencies),
+            "error": errors[0] if errors else None, "held_after_timeout": config.active_streams}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=20, help="每种情况并发的流式请求数")
+    parser.add_argument("--stall-ms", type=float, default=10000, help="模拟服务在输出到一半时卡住的时长（毫秒）")
+    parser.add_argument("--idle-timeout", type=float, default=1.0, help="LLM_STREAM_IDLE_TIMEOUT（秒）")
+    parser.add_argument("--hold-ms", type=float, default=1000, help="abandon 情况下停止读取后等待的时长（毫秒）")
+    parser.add_argument("--json", action="store_true", help="输出JSON")
+    args = parser.parse_args()
+
+    # 配置在导入客户端时读取，所以先设置环境变量
+    os.environ.update({
+        "LLM_STREAM_IDLE_TIMEOUT": str(args.idle_timeout),
+        "SINGLE_FLIGHT_ENABLED": "false",
+        # 只有 writer 开启对冲，首字节等 50ms 就对冲
+        "HEDGE_MODULES": "writer",
+        "HEDGE_INITIAL_DELAY": "0.05",
+        "HEDGE_MAX_RATE": "1",
+        "OPENAI_API_ENDPOINTS": "",
+        "HTTP_POOL_MAXSIZE": str(args.streams * 2),
+    })
+    from utils.transport import SimpleAPIClient
+    from utils.metrics import registry
+
+    results = {}
+    modes = (("abandon", run_abandon), ("cancel", run_cancel), ("first_byte", run_first_byte),
+             ("hedged", run_hedged_first_byte), ("stall", run_stall))
+    for mode, run in modes:
+        if mode in ("first_byte", "hedged"):
+            config = MockConfig(ttft=args.stall_ms / 1000.0, token_delay=0.001, tokens=40)
+        else:
+            config = MockConfig(ttft=0.0, token_delay=0.001, tokens=40, stall_rate=1.0,
+                                stall_seconds=args.stall_ms / 1000.0)
+        server, api_base = start_in_thread(config)
+        client = SimpleAPIClient("bench-key", api_base, pool_maxsize=args.streams * 2)
+        try:
+            results[mode] = run(client, config, args)
+        finally:
+            client.close()
+            server.shutdown()
+
+    counters = [line for line in registry.render_prometheus().splitlines()
+                if line.startswith(("llm_stream_cancellations_total{", "llm_request_timeouts_total{"))]
+    report = {"config": vars(args), "results": results, "counters": counters}
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    abandon, cancel, stall = results["abandon"], results["cancel"], results["stall"]
+    print(f"{args.streams} 个流式请求，上游在输出到一半时卡住 {args.stall_ms:.0f}ms")
+    print(f"abandon  停止读取 {args.hold_ms:.0f}ms 后上游仍占用 {abandon['held_after_hold']} 个连接")
+    print(f"cancel   断开 {cancel['released']}/{args.streams} 个连接，耗时 p50 {cancel['release']['p50'] * 1000:.1f}ms "
+          f"p99 {cancel['release']['p99'] * 1000:.1f}ms，之后仍占用 {cancel['held_after_cancel']} 个")
+    for mode, label in (("first_byte", "未收到首字节时取消"), ("hedged", "对冲请求未收到首字节时取消")):
+        result = results[mode]
+        print(f"{mode:<10} {label}：断开 {result['released']}/{args.streams} 个请求（{result['opened']} 个连接），"
+              f"耗时 p50 {result['release']['p50'] * 1000:.1f}ms p99 {result['release']['p99'] * 1000:.1f}ms，"
+              f"之后仍占用 {result['held_after_cancel']} 个")
+    print(f"stall    {stall['timed_out']}/{args.streams} 个流在卡住后 p50 {stall['detect']['p50']:.2f}s "
+          f"p99 {stall['detect']['p99']:.2f}s 报超时（LLM_STREAM_IDLE_TIMEOUT={args.idle_timeout}s），"
+          f"之后仍占用 {stall['held_after_timeout']} 个")
+    for line in counters:
+        print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+本地模拟的OpenAI兼容服务 - 基准测试和压测用，不需要真实的API密钥
+
+支持 POST /v1/chat/completions（JSON和SSE流式）和 GET /v1/models。
+首token延迟、token间隔、回复长度（及其随机浮动）和错误注入都可以配置；
+还可以让一部分请求的首token特别慢，模拟上游的长尾，或者在输出到一半时卡住，模拟停滞的流。
+回复被请求的 max_tokens 截断时 finish_reason 为 length。
+
+用法:
+    python benchmarks/mock_llm_server.py [--port 8765] [--ttft-ms 200] [--token-delay-ms 20]
+                                         [--tokens 200] [--error-rate 0.05] [--error-status 429]
+                                         [--slow-rate 0.05] [--slow-ttft-ms 5000] [--token-spread 0.5]
+                                         [--stall-rate 0.05] [--stall-ms 30000]
+
+启动后在标准输出打印一行API端点（--port 0 时由系统分配端口），
+其它脚本可以读取这一行得到地址。
+"""
+import argparse
+import json
+import random
+import select
+import socket
+import sys
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# 回复内容循环使用的词表，每个词算一个token
+WORDS = ("Once upon a time , a little cat named Tom found a shiny red ball in the "
+         "garden . He was very happy and played with it all day long !").split()
+
+
+class MockConfig:
+    """模拟服务的参数（秒为单位）"""
+
+    def __init__(self, ttft: float = 0.2, token_delay: float = 0.02, tokens: int = 200,
+                 error_rate: float = 0.0, error_status: int = 500, seed: int = None,
+                 slow_rate: float = 0.0, slow_ttft: float = 5.0, token_spread: float = 0.0,
+                 stall_rate: float = 0.0, stall_seconds: float = 30.0):
+        self.ttft = ttft
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_ttft = slow_ttft
+        self.token_spread = token_spread
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.active_streams = 0  # 正在输出的流式响应数
+        self.disconnects = 0  # 输出完之前客户端就断开的流式响应数
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+    def first_token_delay(self) -> float:
+        """本次请求的首token延迟：按 slow_rate 的比例使用 slow_ttft"""
+        with self.lock:
+            if self.slow_rate and self.random.random() < self.slow_rate:
+                return self.slow_ttft
+            return self.ttft
+
+    def stall_delay(self) -> float:
+        """本次请求输出到一半时卡住的秒数：按 stall_rate 的比例使用 stall_seconds"""
+        with self.lock:
+            if self.stall_rate and self.random.random() < self.stall_rate:
+                return self.stall_seconds
+            return 0.0
+
+    def stream_started(self):
+        with self.lock:
+            self.active_streams += 1
+
+    def stream_finished(self, disconnected: bool):
+        with self.lock:
+            self.active_streams -= 1
+            if disconnected:
+                self.disconnects += 1
+
+
+def completion_tokens(config: MockConfig, data: dict):
+    """
+    按配置和请求的 max_tokens 生成回复token序列
+
+    Returns:
+        (token列表, finish_reason)
+    """
+    count = config.tokens
+    if config.token_spread:
+        with config.lock:
+            count = round(count * (1 + config.random.uniform(-config.token_spread, config.token_spread)))
+    finish_reason = "stop"
+    if data.get("max_tokens") and count > int(data["max_tokens"]):
+        count, finish_reason = int(data["max_tokens"]), "length"
+    return [(" " if i else "") + WORDS[i % len(WORDS)] for i in range(max(count, 1))], finish_reason
+
+
+def prompt_tokens(data: dict) -> int:
+    """粗略估算输入token数（约4个字符一个token）"""
+    return sum(len(str(m.get("content") or "")) for m in data.get("messages", [])) // 4 + 1
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """处理OpenAI兼容请求；流式响应使用分块传输以保持keep-alive连接"""
+
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _sleep_unless_closed(self, seconds: float):
+        """等待 seconds 秒；期间客户端断开连接时立即结束（抛出ConnectionResetError）"""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self.connection], [], [], min(remaining, 0.05))
+            if readable:
+                try:
+                    closed = self.connection.recv(1, socket.MSG_PEEK) == b""
+                except OSError:
+                    closed = True
+                if closed:
+                    raise ConnectionResetError("client disconnected")
+
+    def _write_chunk(self, payload: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(payload), payload))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        config = self.config
+        if config.should_fail():
+            headers = {"Retry-After": "1"} if config.error_status == 429 else None
+            self._send_json(config.error_status, {
+                "error": {"message": f"injected error {config.error_status}", "type": "mock_error"}
+            }, headers)
+            return
+
+        tokens, finish_reason = completion_tokens(config, data)
+        usage = {
+            "prompt_tokens": prompt_tokens(data),
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens(data) + len(tokens),
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = data.get("model", "mock-model")
+
+        ttft = config.first_token_delay()
+        if not data.get("stream"):
+            time.sleep(ttft + config.token_delay * (len(tokens) - 1))
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        stall = config.stall_delay()
+        config.stream_started()
+        disconnected = False
+        try:
+            self._sleep_unless_closed(ttft)
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(config.token_delay)
+                if stall and i == len(tokens) // 2:
+                    self._sleep_unless_closed(stall)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self._write_chunk(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}],
+            }
+            if (data.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = usage
+            self._write_chunk(b"data: " + json.dumps(final).encode("utf-8") + b"\n\n")
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中途断开（例如取消了生成）
+            self.close_connection = True
+            disconnected = True
+        finally:
+            config.stream_finished(disconnected)
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭连接（取消生成、对冲请求输掉）是正常情况，不打印异常栈
+        error = sys.exc_info()[1]
+        if isinstance(error, (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, config: MockConfig = None):
+    """
+    创建模拟服务（不启动）
+
+    Returns:
+        ThreadingHTTPServer 实例，server.config 为当前配置
+    """
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {"config": config or MockConfig()})
+    server = MockLLMServer((host, port), handler)
+    server.config = handler.config
+    return server
+
+
+def start_in_thread(config: MockConfig = None, host: str = "127.0.0.1"):
+    """
+    在后台线程中启动模拟服务
+
+    Returns:
+        (server, api_base) 元组；用完调用 server.shutdown()
+    """
+    server = make_server(host, 0, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1"
+
+
+def add_config_arguments(parser):
+    """添加模拟服务参数（基准脚本复用）"""
+    parser.add_argument("--ttft-ms", type=float, default=200, help="首token延迟（毫秒）")
+    parser.add_argument("--token-delay-ms", type=float, default=20, help="token间隔（毫秒）")
+    parser.add_argument("--tokens", type=int, default=200, help="每条回复的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的比例（0-1）")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的HTTP状态码")
+    parser.add_argument("--seed", type=int, default=None, help="错误注入和慢请求的随机种子")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="首token特别慢的请求比例（0-1）")
+    parser.add_argument("--slow-ttft-ms", type=float, default=5000, help="慢请求的首token延迟（毫秒）")
+    parser.add_argument("--token-spread", type=float, default=0.0, help="回复长度的随机浮动比例（0-1）")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="输出到一半时卡住的请求比例（0-1）")
+    parser.add_argument("--stall-ms", type=float, default=30000, help="卡住的时长（毫秒）")
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(
+        ttft=args.ttft_ms / 1000.0,
+        token_delay=args.token_delay_ms / 1000.0,
+        tokens=args.tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        seed=args.seed,
+        slow_rate=args.slow_rate,
+        slow_ttft=args.slow_ttft_ms / 1000.0,
+        token_spread=args.token_spread,
+        stall_rate=args.stall_rate,
+        stall_seconds=args.stall_ms / 1000.0,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟的OpenAI兼容服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="端口（0表示随机分配）")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, config_from_args(args))
+    print(f"http://{args.host}:{server.server_port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
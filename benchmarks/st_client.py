@@ -0,0 +1,214 @@
+"""
+无浏览器的Streamlit会话客户端 - 通过websocket驱动 `streamlit run app.py`，供基准和压测脚本使用
+
+与浏览器前端一样发送 BackMsg(rerun_script)：点击按钮、输入文字、发送聊天消息。
+控件位于片段（fragment）中时只请求重跑该片段。每次交互返回从发送到脚本运行结束的耗时，
+以及这次运行向浏览器发送的元素增量数。
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 脚本运行结束的状态（FINISHED_FRAGMENT_RUN_SUCCESSFULLY 只在支持片段的版本中存在）
+FINISHED_OK = {"FINISHED_SUCCESSFULLY", "FINISHED_FRAGMENT_RUN_SUCCESSFULLY"}
+
+
+class Widget:
+    """页面上的一个控件"""
+
+    def __init__(self, kind: str, widget_id: str, label: str, fragment_id: str, options=None):
+        self.kind = kind
+        self.id = widget_id
+        self.label = label
+        self.fragment_id = fragment_id
+        self.options = list(options or [])
+
+
+class RunResult:
+    """一次脚本（或片段）运行的结果"""
+
+    def __init__(self, elapsed: float, deltas: int, status: str, fragment: bool):
+        self.elapsed = elapsed
+        self.deltas = deltas
+        self.status = status
+        self.fragment = fragment
+
+    @property
+    def ok(self) -> bool:
+        return self.status in FINISHED_OK
+
+
+class StreamlitSession:
+    """一个浏览器会话"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.connection = None
+        self.widgets = {}  # 标签 -> Widget
+        self.markdown = {}  # 元素路径 -> Markdown文本
+        self._message_cache = {}
+        self.supports_fragments = "fragment_id" in BackMsg().rerun_script.DESCRIPTOR.fields_by_name
+
+    async def connect(self):
+        """建立websocket连接并完成首次运行"""
+        ws_url = self.url.replace("http://", "ws://") + "/_stcore/stream"
+        self.connection = await websocket_connect(ws_url, max_message_size=64 * 1024 * 1024)
+        return await self.run()
+
+    async def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    async def run(self, states=None, fragment_id: str = "", timeout: float = 60) -> RunResult:
+        """
+        请求一次重跑并等待运行结束
+
+        Args:
+            states: 本次变化的 WidgetState 列表
+            fragment_id: 非空时只重跑该片段
+        """
+        message = BackMsg()
+        client_state = message.rerun_script
+        client_state.query_string = ""
+        client_state.page_script_hash = ""
+        for state in states or []:
+            client_state.widget_states.widgets.append(state)
+        fragment = bool(fragment_id) and self.supports_fragments
+        if fragment:
+            client_state.fragment_id = fragment_id
+
+        start = time.perf_counter()
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+        deltas = 0
+        deadline = start + timeout
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError("等待脚本运行结束超时")
+            raw = await asyncio.wait_for(self.connection.read_message(), remaining)
+            if raw is None:
+                raise ConnectionError("websocket连接已关闭")
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            if msg.WhichOneof("type") == "ref_hash":
+                msg = self._message_cache[msg.ref_hash]
+            elif msg.hash and msg.metadata.cacheable:
+                self._message_cache[msg.hash] = msg
+
+            kind = msg.WhichOneof("type")
+            if kind == "delta":
+                deltas += 1
+                self._record_delta(msg)
+            elif kind == "script_finished":
+                status = ForwardMsg.ScriptFinishedStatus.Name(msg.script_finished)
+                if status == "FINISHED_EARLY_FOR_RERUN":
+                    continue
+                return RunResult(time.perf_counter() - start, deltas, status, fragment)
+
+    def _record_delta(self, msg):
+        delta = msg.delta
+        if delta.WhichOneof("type") != "new_element":
+            return
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        path = tuple(msg.metadata.delta_path)
+        if kind == "markdown":
+            self.markdown[path] = element.markdown.body
+            return
+        proto = getattr(element, kind)
+        widget_id = getattr(proto, "id", "")
+        if not widget_id:
+            return
+        label = getattr(proto, "label", "") or getattr(proto, "placeholder", "")
+        fragment_id = getattr(delta, "fragment_id", "")
+        self.widgets[label] = Widget(kind, widget_id, label, fragment_id, getattr(proto, "options", None))
+
+    def find(self, label: str) -> Widget:
+        """按标签（包含即可）查找控件"""
+        if label in self.widgets:
+            return self.widgets[label]
+        for widget_label, widget in self.widgets.items():
+            if label in widget_label:
+                return widget
+        raise KeyError(f"页面上没有控件: {label}")
+
+    async def click(self, label: str) -> RunResult:
+        widget = self.find(label)
+        return await self.run([WidgetState(id=widget.id, trigger_value=True)], widget.fragment_id)
+
+    async def set_text(self, label: str, text: str) -> RunResult:
+        widget = self.find(label)
+        return await self.run([WidgetState(id=widget.id, string_value=text)], widget.fragment_id)
+
+    async def set_checkbox(self, label: str, value: bool) -> RunResult:
+        widget = self.find(label)
+        return await self.run([WidgetState(id=widget.id, bool_value=value)], widget.fragment_id)
+
+    async def select(self, label: str, option: str) -> RunResult:
+        """选择单选框/下拉框的选项（按显示文字匹配）"""
+        widget = self.find(label)
+        index = next(i for i, o in enumerate(widget.options) if option in o)
+        return await self.run([WidgetState(id=widget.id, int_value=index)], widget.fragment_id)
+
+    async def chat(self, text: str) -> RunResult:
+        widget = next(w for w in self.widgets.values() if w.kind == "chat_input")
+        state = WidgetState(id=widget.id)
+        state.string_trigger_value.data = text
+        return await self.run([state], widget.fragment_id)
+
+    def text(self) -> str:
+        """当前页面上所有Markdown文本"""
+        return "\n".join(self.markdown.values())
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_streamlit(env=None, script: str = None, port: int = None, timeout: float = 60):
+    """
+    以无头模式启动 streamlit run app.py
+
+    Returns:
+        (进程, 应用URL)
+    """
+    port = port or free_port()
+    command = [
+        sys.executable, "-m", "streamlit", "run", script or os.path.join(ROOT, "app.py"),
+        "--server.headless", "true",
+        "--global.developmentMode", "false",
+        "--server.port", str(port),
+        "--server.address", "127.0.0.1",
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ]
+    process = subprocess.Popen(
+        command, cwd=ROOT, env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url + "/_stcore/health", timeout=1).read()
+            return process, url
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("streamlit 启动失败")
+            time.sleep(0.2)
+    process.terminate()
+    raise TimeoutError("streamlit 启动超时")
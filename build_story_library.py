@@ -0,0 +1,66 @@
+"""
+构建离线故事库 - 把批量生成的故事写成带关键词倒排索引的故事库文件
+
+故事魔法屋在上游API失败或被限流时，以及“秒出故事”模式下，从故事库里挑关键词最匹配的故事。
+
+用法:
+    python batch_generate.py story keywords.txt -o stories.jsonl --concurrency 8
+    python build_story_library.py stories.jsonl [more.jsonl ...] [-o .cache/story_library.bin]
+
+输入为 batch_generate.py story 的输出（只收录 status 为 ok 的条目），
+或任意包含 {"keywords": "...", "story": "..."} 的JSONL。相同的故事只收录一次。
+"""
+import argparse
+import json
+import sys
+import time
+
+from config.settings import STORY_LIBRARY_PATH
+from utils.story_library import build_library, StoryLibrary
+
+
+def iter_stories(paths):
+    """
+    读取输入文件中的故事
+
+    Yields:
+        (关键词, 故事正文)
+    """
+    seen = set()
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 批量生成中断时可能留下半行
+                if record.get("kind", "story") != "story" or record.get("status", "ok") != "ok":
+                    continue
+                keywords = record.get("keywords") or record.get("input") or ""
+                story = record.get("story") or record.get("output") or ""
+                if not isinstance(story, str) or not story.strip() or story in seen:
+                    continue
+                seen.add(story)
+                yield keywords, story
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("inputs", nargs="+", help="batch_generate.py story 输出的JSONL文件")
+    parser.add_argument("-o", "--output", default=STORY_LIBRARY_PATH, help="故事库文件（默认读取 STORY_LIBRARY_PATH）")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    stats = build_library(iter_stories(args.inputs), args.output)
+    stats["build_seconds"] = round(time.perf_counter() - start, 2)
+
+    # 打开一次确认文件可用
+    StoryLibrary(args.output).close()
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+    return 0 if stats["stories"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 """
 配置管理模块
 """
+import json
 import os
 from dotenv import load_dotenv
 
@@ -14,6 +15,156 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "claude-3-opus-20240229")
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "15000"))  # Gemini-2.5-pro 支持的最大token数
 TEMPERATURE = 0.7
 
+
+def _generation_profile(module: str, max_tokens: int, timeout: float):
+    """
+    按模块的生成参数，可用 <模块>_MAX_TOKENS / _TEMPERATURE / _STOP（JSON字符串数组）/ _TIMEOUT 覆盖
+
+    timeout 是等待首字节的超时（非流式请求为等待整个响应）
+    """
+    prefix = module.upper()
+    return {
+        "max_tokens": int(os.getenv(f"{prefix}_MAX_TOKENS", str(max_tokens))),
+        "temperature": float(os.getenv(f"{prefix}_TEMPERATURE", str(TEMPERATURE))),
+        "stop": json.loads(os.getenv(f"{prefix}_STOP", "[]")),
+        "timeout": float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+    }
+
+
+# 按模块的生成参数：角色聊天的几句回复不必预留和完整作文批改一样多的输出token
+# （推理模型的思考过程也计入输出token，所以上限留得比较宽）；其它调用方使用全局 MAX_TOKENS
+GENERATION_PROFILES = {
+    "story": _generation_profile("story", 6000, 60),
+    "chat": _generation_profile("chat", 3000, 30),
+    "writer": _generation_profile("writer", 8000, 90),
+    # 修改后的增量批改只批改改动的句子，回复比完整批改短得多，单独统计自适应样本
+    "writer_revision": _generation_profile("writer_revision", 3000, 60),
+}
+# 后台预取和批量批改等调用方沿用对应模块的生成参数
+GENERATION_PROFILE_ALIASES = {"story_prefetch": "story"}
+
+# 自适应 max_tokens：按每个模块最近实际的输出token数（响应中的 usage.completion_tokens）的分位
+# 乘以余量设置上限，不超过模块的 max_tokens；样本不足时使用模块的 max_tokens
+ADAPTIVE_MAX_TOKENS = os.getenv("ADAPTIVE_MAX_TOKENS", "false").lower() == "true"
+ADAPTIVE_MAX_TOKENS_PERCENTILE = float(os.getenv("ADAPTIVE_MAX_TOKENS_PERCENTILE", "99"))
+ADAPTIVE_MAX_TOKENS_HEADROOM = float(os.getenv("ADAPTIVE_MAX_TOKENS_HEADROOM", "1.5"))  # 分位值乘以该倍数
+ADAPTIVE_MAX_TOKENS_MIN_SAMPLES = int(os.getenv("ADAPTIVE_MAX_TOKENS_MIN_SAMPLES", "30"))
+ADAPTIVE_MAX_TOKENS_FLOOR = int(os.getenv("ADAPTIVE_MAX_TOKENS_FLOOR", "256"))  # 自适应上限的最小值
+# 流式请求要求上游在最后一个事件里返回 usage（stream_options.include_usage），默认随自适应模式开启
+STREAM_INCLUDE_USAGE = os.getenv("STREAM_INCLUDE_USAGE", str(ADAPTIVE_MAX_TOKENS)).lower() == "true"
+
+# 多端点路由（可选）：逗号分隔的 URL|密钥|权重，配置后每个请求按首token延迟和权重选择端点
+OPENAI_API_ENDPOINTS = os.getenv("OPENAI_API_ENDPOINTS", "")
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.3"))  # 首token延迟的指数加权系数
+ROUTER_LATENCY_SLACK = float(os.getenv("ROUTER_LATENCY_SLACK", "1.5"))  # 延迟不超过最快端点该倍数的端点按权重分流
+ROUTER_HEALTH_INTERVAL = float(os.getenv("ROUTER_HEALTH_INTERVAL", "30"))  # 后台健康探测间隔（秒，0为关闭）
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))  # 连续失败多少次熔断
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))  # 熔断多少秒后放行试探请求
+
+# HTTP连接池配置（进程内所有会话共享）
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))  # 缓存的主机连接池数量
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "50"))  # 每个主机保持的最大keep-alive连接数
+
+# 流式响应每次读取的最大字节数
+SSE_READ_SIZE = int(os.getenv("SSE_READ_SIZE", "8192"))
+
+# 上游请求的超时（秒）：建立连接的超时，以及流式响应开始后两次收到数据之间的最长间隔；
+# 等待首字节的超时按模块的生成参数（<模块>_TIMEOUT）
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "20"))
+
+# API传输方式: sync（requests，阻塞）或 async（aiohttp，进程级事件循环多路复用）
+# async 不支持多端点路由（OPENAI_API_ENDPOINTS）和对冲请求（HEDGE_MODULES），同时配置时创建客户端会报错
+API_TRANSPORT = os.getenv("API_TRANSPORT", "sync")
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "32"))  # 异步客户端同时在途的最大请求数
+
+# 独立的生成服务（generation_server.py）：配置地址后页面只负责输入和显示，故事、聊天和作文批改都发给生成服务，
+# 页面进程不需要API密钥；生成服务不保存会话状态，可以单独扩容多个实例
+GENERATION_SERVICE_URL = os.getenv("GENERATION_SERVICE_URL", "")
+GENERATION_SERVICE_TIMEOUT = float(os.getenv("GENERATION_SERVICE_TIMEOUT", "120"))  # 等待生成服务返回数据的最长秒数
+GENERATION_SERVER_HOST = os.getenv("GENERATION_SERVER_HOST", "127.0.0.1")
+GENERATION_SERVER_PORT = int(os.getenv("GENERATION_SERVER_PORT", "8600"))
+GENERATION_SERVER_THREADS = int(os.getenv("GENERATION_SERVER_THREADS", "64"))  # 生成服务同时在途的生成数
+
+# 进程级限流（0表示不限制）：所有会话共享的请求数/分钟和token数/分钟
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", "0"))
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", "0"))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "20"))  # 排队超过该秒数直接报“请求太频繁”
+
+# 失败重试：429/5xx和连接错误按带抖动的指数退避重试，并遵守Retry-After
+MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "20"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))  # 每个请求积累的重试额度
+
+# 单飞请求合并：同时发出的完全相同的请求只调用一次上游
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+SINGLE_FLIGHT_MAX_FANOUT_BYTES = int(os.getenv("SINGLE_FLIGHT_MAX_FANOUT_BYTES", str(1024 * 1024)))  # 每条共享流的缓冲上限
+
+# 对冲请求（按模块开启，例如 "story,writer"，默认关闭）：首字节在最近首token延迟的该分位内没到，
+# 就再发一个相同的请求（有多个端点时发往另一个端点），用先到的那个
+HEDGE_MODULES = [m.strip() for m in os.getenv("HEDGE_MODULES", "").split(",") if m.strip()]
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_INITIAL_DELAY = float(os.getenv("HEDGE_INITIAL_DELAY", "5"))  # 样本不足时等待的秒数
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.2"))  # 对冲前至少等待的秒数
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))  # 按分位计算前需要的样本数
+HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))  # 对冲请求最多占请求数的比例
+
+# 故事预取（默认关闭）：故事显示后在后台提前生成下一个，点击“再来一个”时直接显示
+STORY_PREFETCH_ENABLED = os.getenv("STORY_PREFETCH_ENABLED", "false").lower() == "true"
+STORY_PREFETCH_COUNT = int(os.getenv("STORY_PREFETCH_COUNT", "1"))  # 每组关键词提前准备几篇（1-2）
+STORY_PREFETCH_TTL = int(os.getenv("STORY_PREFETCH_TTL", "600"))  # 预取的故事多少秒后作废
+STORY_PREFETCH_SESSION_LIMIT = int(os.getenv("STORY_PREFETCH_SESSION_LIMIT", "10"))  # 每个会话最多预取的篇数
+STORY_PREFETCH_HOURLY_LIMIT = int(os.getenv("STORY_PREFETCH_HOURLY_LIMIT", "200"))  # 整个进程每小时最多预取的篇数
+STORY_PREFETCH_WORKERS = int(os.getenv("STORY_PREFETCH_WORKERS", "2"))  # 同时在后台生成的篇数
+
+# 离线故事库：用 build_story_library.py 从批量生成的结果构建；上游失败或被限流时自动使用，
+# 也可以在故事魔法屋勾选“秒出故事”直接使用。文件不存在时不启用
+STORY_LIBRARY_PATH = os.getenv("STORY_LIBRARY_PATH", ".cache/story_library.bin")
+STORY_LIBRARY_FALLBACK = os.getenv("STORY_LIBRARY_FALLBACK", "true").lower() == "true"
+
+# 老师批量批改时同时批改的作文数
+BATCH_GRADING_WORKERS = int(os.getenv("BATCH_GRADING_WORKERS", "8"))
+
+# 修改后重新提交作文时，两次提交的句子相似度不低于该值就只批改改动过的句子，否则重新完整批改
+WRITER_REVISION_MIN_SIMILARITY = float(os.getenv("WRITER_REVISION_MIN_SIMILARITY", "0.5"))
+
+# 提交作文时先用本地规则检查常见语法错误，在AI批改出来之前马上显示小提示
+GRAMMAR_PRECHECK_ENABLED = os.getenv("GRAMMAR_PRECHECK_ENABLED", "true").lower() == "true"
+
+# 故事和作文批改默认使用流式输出（边生成边显示）
+STREAMING_OUTPUT = os.getenv("STREAMING_OUTPUT", "true").lower() == "true"
+
+# 流式渲染合并：每秒最多刷新次数，以及积累多少字符后立即刷新
+STREAM_RENDER_FPS = float(os.getenv("STREAM_RENDER_FPS", "12"))
+STREAM_RENDER_MAX_CHARS = int(os.getenv("STREAM_RENDER_MAX_CHARS", "400"))
+
+# 聊天上下文：每次请求的输入token预算，以及较早对话的滚动摘要最多占用的token数
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "1500"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "200"))
+
+# 聊天历史：内存里每个会话只保留最近的若干条消息，更早的写入SQLite（WAL）文件；
+# 闲置超过 CHAT_SESSION_IDLE_TIMEOUT 秒的会话整个移出内存，回来时再从文件读取最近的消息
+CHAT_HISTORY_RING_SIZE = int(os.getenv("CHAT_HISTORY_RING_SIZE", "40"))
+CHAT_HISTORY_PATH = os.getenv("CHAT_HISTORY_PATH", ".cache/chat_history.sqlite3")
+CHAT_SESSION_IDLE_TIMEOUT = float(os.getenv("CHAT_SESSION_IDLE_TIMEOUT", "1800"))
+CHAT_HISTORY_RETENTION = float(os.getenv("CHAT_HISTORY_RETENTION", "604800"))  # 文件中的消息保留秒数（0为永久）
+
+# 响应缓存配置（默认关闭；按模块开启，多个模块用逗号分隔，例如 "story,writer"）
+RESPONSE_CACHE_MODULES = [m.strip() for m in os.getenv("RESPONSE_CACHE_MODULES", "").split(",") if m.strip()]
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3")
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "86400"))  # 秒
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "256"))
+RESPONSE_CACHE_DISK_ENTRIES = int(os.getenv("RESPONSE_CACHE_DISK_ENTRIES", "5000"))
+
+# 运行指标：Prometheus文本格式端点的端口（0表示不启动）和监听地址
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_ADMIN_PANEL = os.getenv("METRICS_ADMIN_PANEL", "false").lower() == "true"  # 侧边栏显示运行指标
+# 请求日志（JSONL）：路径为空表示不记录；成功的请求按比例抽样，失败的请求全部记录
+METRICS_LOG_PATH = os.getenv("METRICS_LOG_PATH", "")
+METRICS_LOG_SAMPLE_RATE = float(os.getenv("METRICS_LOG_SAMPLE_RATE", "0.1"))
+
 # UI配置
 APP_TITLE = "🏠 克劳德的奇妙英语屋"
 APP_SUBTITLE = "Claude's English Fun House"
@@ -0,0 +1,323 @@
+"""
+生成服务 - 把故事创作、角色聊天和作文批改作为无状态的HTTP接口（asyncio + aiohttp）
+
+页面配置 GENERATION_SERVICE_URL 后只负责输入和显示，生成请求都发到这里。服务不保存会话状态，
+需要的聊天历史和上次批改都在请求里，可以在负载均衡后面单独扩容多个实例，
+不必为了生成能力多开完整的Streamlit服务。
+
+接口（请求为JSON；"stream": true 时响应为 text/event-stream）:
+    POST /v1/story            {"keywords": "dragon, castle", "variant": 0, "stream": false}
+    POST /v1/writer           {"text": "...", "stream": false}
+    POST /v1/writer/revision  {"previous_text": "...", "previous_feedback": "...", "text": "...", "stream": false}
+    POST /v1/chat             {"role": "🐱 一只会说话的猫", "history": [{"role": "user", "content": "..."}],
+                               "prompt": "...", "earlier": [已移出的消息数, [摘要行, ...]]}（总是流式）
+    GET  /healthz
+    GET  /metrics             Prometheus文本格式
+生成接口都可以带 "model" 代替默认模型。故事的 "variant" 可选，大于0时为同样关键词的第几个新故事。
+
+非流式响应为 {"text": "..."}；出错时为 {"error": "..."}，参数错误状态码400，生成失败502。
+流式响应每个片段一个 data: {"text": "..."} 事件，结束时为 data: [DONE]；中途出错时发送
+event: error（data 为 {"error": "..."}）。聊天的第一个事件是 event: meta（data 为 {"prompt_tokens": n}）。
+客户端断开时立即断开上游请求（非流式请求在服务内部也以流式调用上游）。
+
+用法:
+    python generation_server.py [--host 127.0.0.1] [--port 8600] [--threads 64]
+
+上游API的配置与页面相同（OPENAI_API_KEY、OPENAI_API_BASE、OPENAI_MODEL、API_TRANSPORT 等环境变量）。
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from config.settings import (
+    OPENAI_API_KEY, OPENAI_API_BASE,
+    GENERATION_SERVER_HOST, GENERATION_SERVER_PORT, GENERATION_SERVER_THREADS
+)
+from utils.transport import client_registry
+from utils.cancellation import CancelToken
+from utils.generation_service import GenerationService
+from utils.metrics import registry as metrics_registry
+
+
+generation_requests = metrics_registry.counter(
+    "generation_server_requests_total",
+    "生成服务处理的请求数：ok为完成，error为生成失败，invalid为参数错误，disconnect为客户端提前断开",
+    ("endpoint", "outcome")
+)
+_inflight = {"count": 0}
+
+# 生成接口：路径 -> (GenerationService的方法, 参数名列表, 可选的整数参数名列表)
+ENDPOINTS = {
+    "story": ("story", ("keywords",), ("variant",)),
+    "writer": ("grade", ("text",), ()),
+    "writer/revision": ("revise", ("previous_text", "previous_feedback", "text"), ()),
+}
+
+
+class InvalidRequest(Exception):
+    """请求参数不正确"""
+
+
+def _text(body: dict, name: str) -> str:
+    value = body.get(name)
+    if not isinstance(value, str) or not value.strip():
+        raise InvalidRequest(f"缺少参数 {name}")
+    return value
+
+
+def _options(body: dict, names) -> dict:
+    options = {}
+    for name in names:
+        value = body.get(name)
+        if value is None:
+            continue
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise InvalidRequest(f"{name} 应为非负整数")
+        options[name] = value
+    return options
+
+
+def _history(body: dict):
+    history = body.get("history") or []
+    if not isinstance(history, list) or not all(
+            isinstance(m, dict) and isinstance(m.get("role"), str) and isinstance(m.get("content"), str)
+            for m in history):
+        raise InvalidRequest("history 应为 [{\"role\": ..., \"content\": ...}] 列表")
+    return history
+
+
+def _earlier(body: dict):
+    earlier = body.get("earlier")
+    if not earlier:
+        return None
+    try:
+        count, lines = earlier
+        return int(count), [str(line) for line in lines]
+    except (TypeError, ValueError):
+        raise InvalidRequest("earlier 应为 [消息数, [摘要行, ...]]")
+
+
+def _event(payload: dict, name: str = None) -> bytes:
+    data = json.dumps(payload, ensure_ascii=False)
+    return (f"event: {name}\ndata: {data}\n\n" if name else f"data: {data}\n\n").encode("utf-8")
+
+
+def _json(payload: dict, status: int = 200) -> web.Response:
+    return web.json_response(payload, status=status, dumps=functools.partial(json.dumps, ensure_ascii=False))
+
+
+async def _read_body(request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise InvalidRequest("请求体不是JSON")
+    if not isinstance(body, dict):
+        raise InvalidRequest("请求体应为JSON对象")
+    return body
+
+
+def _service(request, body: dict) -> GenerationService:
+    model = body.get("model")
+    return GenerationService(request.app["client"], model if isinstance(model, str) else None)
+
+
+async def handle_generate(request):
+    """故事和作文批改：stream 为true时流式返回"""
+    endpoint = request.match_info["endpoint"]
+    if endpoint not in ENDPOINTS:
+        raise web.HTTPNotFound()
+    method, fields, optional = ENDPOINTS[endpoint]
+    try:
+        body = await _read_body(request)
+        args = [_text(body, name) for name in fields]
+        options = _options(body, optional)
+    except InvalidRequest as e:
+        generation_requests.inc((endpoint, "invalid"))
+        return _json({"error": str(e)}, 400)
+
+    generate = getattr(_service(request, body), method)
+    cancel = CancelToken()
+    if body.get("stream") is True:
+        return await _stream(request, endpoint, lambda: generate(*args, stream=True, cancel=cancel, **options),
+                             cancel)
+
+    def collect():
+        # 非流式的上游请求在等到完整响应之前无法中断，所以内部也流式生成再拼接，
+        # 客户端断开时取消令牌可以立即断开上游连接
+        with contextlib.closing(generate(*args, stream=True, cancel=cancel, **options)) as chunks:
+            return "".join(chunks)
+
+    loop = asyncio.get_running_loop()
+    _inflight["count"] += 1
+    try:
+        text = await loop.run_in_executor(request.app["executor"], collect)
+    except asyncio.CancelledError:
+        cancel.cancel("client_disconnect")
+        generation_requests.inc((endpoint, "disconnect"))
+        raise
+    except Exception as e:
+        generation_requests.inc((endpoint, "error"))
+        return _json({"error": str(e)}, 502)
+    finally:
+        _inflight["count"] -= 1
+    generation_requests.inc((endpoint, "ok"))
+    return _json({"text": text})
+
+
+async def handle_chat(request):
+    """角色聊天：总是流式返回，第一个事件是输入token数"""
+    try:
+        body = await _read_body(request)
+        role, prompt = _text(body, "role"), _text(body, "prompt")
+        history, earlier = _history(body), _earlier(body)
+    except InvalidRequest as e:
+        generation_requests.inc(("chat", "invalid"))
+        return _json({"error": str(e)}, 400)
+
+    service = _service(request, body)
+    cancel = CancelToken()
+    replies = {}
+
+    def start():
+        replies["prompt_tokens"], chunks = service.chat(role, history, prompt, earlier=earlier, cancel=cancel)
+        return chunks
+
+    return await _stream(request, "chat", start, cancel, replies)
+
+
+async def _stream(request, endpoint: str, start, cancel: CancelToken, meta: dict = None):
+    """
+    在线程池里逐段读取生成结果并以SSE写出
+
+    每读一段切换一次线程，事件循环不会被阻塞；客户端断开时触发取消令牌，
+    正在读取的那一段返回后再关闭生成器。
+    """
+    executor = request.app["executor"]
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    pending = None
+    chunks = None
+    outcome = "disconnect"
+    _inflight["count"] += 1
+    try:
+        await response.prepare(request)
+        pending = executor.submit(start)
+        chunks = await asyncio.wrap_future(pending)
+        if meta is not None:
+            await response.write(_event(meta, "meta"))
+        while True:
+            pending = executor.submit(next, chunks, None)
+            chunk = await asyncio.wrap_future(pending)
+            if chunk is None:
+                break
+            await response.write(_event({"text": chunk}))
+        await response.write(b"data: [DONE]\n\n")
+        outcome = "ok"
+    except asyncio.CancelledError:
+        # 客户端断开：立即断开上游连接
+        cancel.cancel("client_disconnect")
+        raise
+    except ConnectionResetError:
+        cancel.cancel("client_disconnect")
+    except Exception as e:
+        outcome = "error"
+        with contextlib.suppress(ConnectionResetError):
+            await response.write(_event({"error": str(e)}, "error"))
+    finally:
+        _inflight["count"] -= 1
+        generation_requests.inc((endpoint, outcome))
+        if chunks is not None:
+            # 生成器还在线程里读取时不能关闭，等这一段读完
+            pending.add_done_callback(lambda _: chunks.close())
+    return response
+
+
+async def handle_health(request):
+    return _json({"status": "ok", "inflight": _inflight["count"]})
+
+
+async def handle_metrics(request):
+    return web.Response(text=metrics_registry.render_prometheus(), content_type="text/plain")
+
+
+metrics_registry.register_collector(
+    lambda: {"generation_server_inflight": ("生成服务正在处理的生成请求数", _inflight["count"])}
+)
+
+
+def create_app(client, threads: int = None) -> web.Application:
+    """
+    创建生成服务
+
+    Args:
+        client: 拥有 chat_completion 方法的客户端（见 utils.transport.client_registry）
+        threads: 同时在途的生成数（默认 GENERATION_SERVER_THREADS）
+    """
+    app = web.Application()
+    app["client"] = client
+    app["executor"] = ThreadPoolExecutor(threads or GENERATION_SERVER_THREADS, thread_name_prefix="generation")
+    app.router.add_post("/v1/chat", handle_chat)
+    app.router.add_post("/v1/{endpoint:story|writer|writer/revision}", handle_generate)
+    app.router.add_get("/healthz", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+
+    async def shutdown_executor(app):
+        app["executor"].shutdown(wait=False, cancel_futures=True)
+
+    app.on_cleanup.append(shutdown_executor)
+    return app
+
+
+def start_in_thread(client, host: str = "127.0.0.1", port: int = 0, threads: int = None):
+    """
+    在后台线程的事件循环里启动生成服务（基准测试用）
+
+    Returns:
+        (停止服务的函数, 服务地址)
+    """
+    app = create_app(client, threads)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app, handler_cancellation=True)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, host, port)
+    loop.run_until_complete(site.start())
+    bound_port = runner.addresses[0][1]
+    thread = threading.Thread(target=loop.run_forever, name="generation-server", daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return stop, f"http://{host}:{bound_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=GENERATION_SERVER_HOST, help="监听地址")
+    parser.add_argument("--port", type=int, default=GENERATION_SERVER_PORT, help="监听端口")
+    parser.add_argument("--threads", type=int, default=GENERATION_SERVER_THREADS, help="同时在途的生成数")
+    args = parser.parse_args(argv)
+
+    if not OPENAI_API_KEY:
+        print("请先设置 OPENAI_API_KEY 环境变量", file=sys.stderr)
+        return 1
+
+    client = client_registry.get_client(OPENAI_API_KEY, OPENAI_API_BASE or None)
+    router = getattr(client, "router", None)
+    if router is not None:
+        print(f"多端点路由: {len(router.endpoints)} 个端点", flush=True)
+    web.run_app(create_app(client, args.threads), host=args.host, port=args.port, handler_cancellation=True,
+                print=lambda _: print(f"生成服务已启动: http://{args.host}:{args.port}", flush=True))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,8 +2,34 @@
 我是小作家模块
 """
 import streamlit as st
-from utils.api_client_simple import get_claude_response
-from config.settings import DEFAULT_WRITING_SAMPLE
+from utils.api_client_simple import generate, stream_generation, get_generation_service
+from utils.stream_render import render_markdown_stream
+from utils.batch_grading import parse_uploaded_essays, grade_essays, build_export_bundle
+from utils.essay_revision import RevisionPlan
+from utils.fragments import fragment
+from utils.grammar_check import check_grammar
+from config.settings import (
+    DEFAULT_WRITING_SAMPLE, STREAMING_OUTPUT, BATCH_GRADING_WORKERS, GRAMMAR_PRECHECK_ENABLED
+)
+
+
+# 侧边栏写作小贴士
+WRITING_TIPS = """
+        **开头句型：**
+        - Today I want to tell you about...
+        - Let me share...
+        - I'd like to talk about...
+        
+        **连接词：**
+        - First, ... Then, ... Finally, ...
+        - Also, ... / Besides, ...
+        - However, ... / But, ...
+        
+        **结尾句型：**
+        - That's all about...
+        - I hope you like...
+        - Thank you for reading!
+        """
 
 
 def little_writer_module():
@@ -26,6 +52,25 @@ def little_writer_module():
     记住：**写作最重要的是表达你的想法，语法错误没关系，我们一起进步！**
     """)
     
+    writer_workspace()
+    
+    # 老师批量批改
+    batch_grading_section()
+    
+    # 添加写作小贴士
+    with st.sidebar:
+        st.markdown("### 📚 写作小贴士")
+        st.markdown(WRITING_TIPS)
+
+
+@fragment
+def writer_workspace():
+    """
+    写作区域：作文输入、提交按钮和批改结果
+    
+    作为片段运行，点击按钮时只重跑这一块。批改结果保存在 session_state 中，
+    点击下面的按钮后依然显示。
+    """
     # 文本输入区
     user_text = st.text_area(
         "✍️ 在这里写下你的英文作品",
@@ -50,6 +95,11 @@ def little_writer_module():
     col1, col2, col3 = st.columns([1, 1, 1])
     with col2:
         submit_button = st.button("📤 请老师批改！", type="primary", use_container_width=True)
+        streaming = st.checkbox(
+            "⚡ 边批改边看",
+            value=STREAMING_OUTPUT,
+            help="批改意见一边生成一边显示，不用等全部写完"
+        )
     
     # 处理提交
     if submit_button:
@@ -57,92 +107,201 @@ def little_writer_module():
             st.warning("😊 请先写一些内容再提交哦！")
             return
         
-        # 构建系统提示词
-        system_prompt = """你是一位经验丰富、极具耐心和亲和力的小学英语老师，专门辅导中国10岁的孩子学习英语。
-
-你的任务是批改学生写的英文段落，并提供建设性的反馈。
-
-批改原则：
-1. 永远保持积极、鼓励的态度
-2. 先表扬孩子的努力和亮点
-3. 用温和的方式指出错误
-4. 提供清晰的改正建议
-5. 适当拓展，但不要太难
-
-你的输出必须严格遵循以下Markdown格式：
-
-### 🌟 总体评价
-
-[用1-2句非常鼓励的话，表扬孩子的闪光点。比如：想象力很棒！用词很有创意！敢于表达真实想法！句子结构有进步！等等。一定要具体，不要泛泛而谈]
+        # 本地检查瞬间完成，AI批改还在生成时就能先看到
+        if GRAMMAR_PRECHECK_ENABLED:
+            st.session_state.writer_hints = check_grammar(user_text)
+            show_grammar_hints(st.session_state.writer_hints)
+        
+        # 修改后重新提交：只批改改动过的句子，没改动的句子沿用上次的建议
+        previous = st.session_state.get('writer_submission')
+        plan = RevisionPlan(previous["text"], previous["feedback"], user_text) if previous else None
+        if plan and plan.mode == "full":
+            # 改动太大，相当于写了一篇新作文，按新作文完整批改
+            plan = None
+        mode = plan.mode if plan else "full"
+        # 流式批改中途出错时页面上只有一部分批改，不能作为下次修改的基准
+        outcome = {"completed": True}
+        
+        if mode == "unchanged":
+            response = previous["feedback"]
+            st.markdown("---")
+            st.markdown(response)
+        elif mode == "incremental":
+            st.markdown("---")
+            if not plan.changed:
+                # 只删掉了句子：不用再请老师批改，删掉的句子的建议不再显示
+                revision = ""
+                st.markdown(plan.merge(revision))
+            elif streaming:
+                revision = render_markdown_stream(stream_generation(
+                    "writer_revision",
+                    lambda service, cancel: service.revise(
+                        previous["text"], previous["feedback"], user_text, stream=True, cancel=cancel),
+                    outcome=outcome
+                ))
+                if revision:
+                    st.markdown(plan.appendix(revision))
+            else:
+                revision = generate(
+                    lambda service: service.revise(previous["text"], previous["feedback"], user_text)
+                )
+                if revision:
+                    st.markdown(plan.merge(revision))
+            response = plan.merge(revision) if revision or not plan.changed else None
+        else:
+            # 调用生成服务获取批改结果
+            if streaming:
+                # 流式批改：各个小节逐步出现
+                st.markdown("---")
+                response = render_markdown_stream(stream_generation(
+                    "writer", lambda service, cancel: service.grade(user_text, stream=True, cancel=cancel),
+                    outcome=outcome
+                ))
+            else:
+                response = generate(lambda service: service.grade(user_text))
+                if response:
+                    # 显示批改结果
+                    st.markdown("---")
+                    st.markdown(response)
+        
+        st.session_state.writer_result = response
+        st.session_state.writer_revision_note = None
+        if response and outcome["completed"]:
+            if plan:
+                savings = plan.record(revision if mode == "incremental" else "")
+                st.session_state.writer_revision_note = revision_note(plan, savings)
+                show_revision_note(st.session_state.writer_revision_note)
+            st.session_state.writer_submission = {"text": user_text, "feedback": response}
+    elif st.session_state.get('writer_result'):
+        # 重跑时显示上一次的批改结果
+        show_grammar_hints(st.session_state.get('writer_hints'))
+        st.markdown("---")
+        st.markdown(st.session_state.writer_result)
+        show_revision_note(st.session_state.get('writer_revision_note'))
+    
+    if st.session_state.get('writer_result'):
+        # 添加互动元素
+        st.markdown("---")
+        st.success("🎉 你真棒！继续努力，你的英语会越来越好！")
+        
+        # 添加额外功能按钮
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            if st.button("📝 再写一篇", use_container_width=True):
+                st.info("清空上面的文本框，写下新的内容吧！")
+        
+        with col2:
+            if st.button("💪 我要改进", use_container_width=True):
+                st.info("根据老师的建议，试着重写一遍吧！")
+        
+        with col3:
+            if st.button("⭐ 收藏批改", use_container_width=True):
+                st.info("批改结果已显示，你可以截图保存！")
 
-### ✏️ 修改建议
 
-[用表格展示需要修改的地方。如果没有错误，就选1-2个地方提供"更地道的表达"。记住：不要列出太多错误，最多3-4个即可]
+def revision_note(plan, savings):
+    """重新提交后的说明：这一轮批改了多少句子、沿用了多少建议、少用了多少token"""
+    rounds = st.session_state.setdefault('writer_revision_rounds', [])
+    rounds.append(savings)
+    if plan.mode == "unchanged":
+        summary = "作文没有改动，沿用上次的批改"
+    elif not plan.changed:
+        summary = f"删掉了 {len(plan.removed)} 个句子，沿用 {len(plan.reused)} 条之前的建议"
+    else:
+        summary = f"只批改了 {len(plan.changed)} 个改动的句子，沿用 {len(plan.reused)} 条之前的建议"
+        if plan.resolved:
+            summary += f"，改正了 {len(plan.resolved)} 处"
+    return (f"🔁 第{len(rounds)}次修改：{summary} · 少发送约 {savings['prompt_saved']} 个输入token、"
+            f"少生成约 {savings['completion_saved']} 个输出token")
 
-| 原文 | 修改后 | 小贴士 |
-|------|--------|---------|
-| 原句或词组 | 修改后的版本 | 用简单的中文解释为什么这样改更好 |
 
-### ✨ 今天学一个新知识
+def show_revision_note(note):
+    """显示重新提交后的说明"""
+    if note:
+        st.caption(note)
 
-[选择一个与作文相关的知识点进行简单讲解。可以是：
-- 一个更地道的表达方式
-- 一个简单的语法规则
-- 一个相关的词汇拓展
-用1-2句话说明，并给出一个简单例句]
 
-### 🎯 继续加油
+def show_grammar_hints(hints):
+    """显示本地语法检查的小提示"""
+    if not hints:
+        return
+    with st.expander(f"⚡ 小提示：先看看这 {len(hints)} 处（老师的详细批改马上就来）", expanded=True):
+        for hint in hints:
+            st.markdown(f"- ~~{hint['text']}~~ → **{hint['suggestion']}**：{hint['message']}")
 
-[用1句话鼓励孩子继续写作，可以提供一个小建议或下次写作的方向]
 
-记住：你的目标是让孩子爱上英语写作，而不是打击他们的信心！"""
-        
-        # 构建用户提示词
-        prompt = f"请批改这篇英文作文：\n\n{user_text}"
+@fragment
+def batch_grading_section():
+    """
+    老师批量批改：上传一个班的作文，并发批改并导出结果
+    
+    作为片段运行，上传文件、批改和下载都不会重跑页面其它部分
+    """
+    with st.expander("👩‍🏫 老师批量批改"):
+        st.markdown("""
+        上传全班的作文，克劳德老师会同时批改多篇，完成一篇显示一篇。支持：
+        - **CSV**：包含"姓名/name"和"作文/essay"列（没有表头时第一列为姓名、最后一列为作文）
+        - **TXT**：每个文件一篇作文，文件名作为学生姓名
+        - **ZIP**：包含以上文件的压缩包
+        """)
         
-        # 调用API获取批改结果
-        response = get_claude_response(prompt, system_prompt)
+        uploaded_files = st.file_uploader(
+            "📂 上传作文文件",
+            type=["csv", "txt", "zip"],
+            accept_multiple_files=True,
+            help="可以一次选择多个文件"
+        )
         
-        if response:
-            # 显示批改结果
-            st.markdown("---")
-            st.markdown(response)
+        if st.button("🚀 开始批量批改", disabled=not uploaded_files, use_container_width=True):
+            service = get_generation_service()
+            if service is None:
+                st.error("❌ 请先在侧边栏输入您的API配置信息")
+                return
             
-            # 添加互动元素
-            st.markdown("---")
-            st.success("🎉 你真棒！继续努力，你的英语会越来越好！")
-            
-            # 添加额外功能按钮
-            col1, col2, col3 = st.columns(3)
+            try:
+                essays = parse_uploaded_essays([(f.name, f.getvalue()) for f in uploaded_files])
+            except Exception as e:
+                st.error(f"❌ 文件解析失败: {str(e)}")
+                return
+            if not essays:
+                st.warning("😊 没有在文件中找到作文内容哦！")
+                return
             
-            with col1:
-                if st.button("📝 再写一篇", use_container_width=True):
-                    st.info("清空上面的文本框，写下新的内容吧！")
+            st.info(f"共 {len(essays)} 篇作文，最多同时批改 {BATCH_GRADING_WORKERS} 篇")
+            progress = st.progress(0.0, text="批改中...")
+            status_placeholder = st.empty()
             
-            with col2:
-                if st.button("💪 我要改进", use_container_width=True):
-                    st.info("根据老师的建议，试着重写一遍吧！")
+            results = []
+            rows = []
+            for result in grade_essays(service, essays):
+                results.append(result)
+                rows.append({
+                    "学生": result["name"],
+                    "状态": "✅ 完成" if result["status"] == "ok" else "❌ 失败",
+                    "耗时(秒)": round(result["latency"], 1),
+                })
+                progress.progress(len(results) / len(essays), text=f"已完成 {len(results)}/{len(essays)}")
+                status_placeholder.dataframe(rows, use_container_width=True)
             
-            with col3:
-                if st.button("⭐ 收藏批改", use_container_width=True):
-                    st.info("批改结果已显示，你可以截图保存！")
-    
-    # 添加写作小贴士
-    with st.sidebar:
-        st.markdown("### 📚 写作小贴士")
-        st.markdown("""
-        **开头句型：**
-        - Today I want to tell you about...
-        - Let me share...
-        - I'd like to talk about...
+            st.session_state.batch_results = results
         
-        **连接词：**
-        - First, ... Then, ... Finally, ...
-        - Also, ... / Besides, ...
-        - However, ... / But, ...
-        
-        **结尾句型：**
-        - That's all about...
-        - I hope you like...
-        - Thank you for reading!
-        """)
\ No newline at end of file
+        # 结果保存在session state中，点击下载按钮触发重跑后依然可见
+        results = st.session_state.get('batch_results')
+        if results:
+            failed = [r for r in results if r["status"] != "ok"]
+            latencies = [r["latency"] for r in results]
+            st.success(
+                f"🎉 批改完成：成功 {len(results) - len(failed)} 篇，失败 {len(failed)} 篇；"
+                f"单篇最长 {max(latencies):.1f} 秒"
+            )
+            for r in failed:
+                st.warning(f"{r['name']}：{r['error']}")
+            
+            st.download_button(
+                "📦 下载批改结果（Markdown + CSV）",
+                data=build_export_bundle(results),
+                file_name="batch_feedback.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
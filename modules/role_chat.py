@@ -1,8 +1,15 @@
 """
 角色扮演聊天室模块
 """
+import contextlib
+import uuid
 import streamlit as st
-from utils.api_client_simple import get_streaming_response
+from utils.api_client_simple import stream_chat_reply
+from utils.cancellation import cancel_streams
+from utils.chat_history import chat_sessions
+from utils.stream_render import RenderCoalescer
+from utils.prompts import build_role_welcome_message
+from utils.fragments import fragment, rerun_fragment
 from config.settings import CHAT_ROLES
 
 
@@ -20,6 +27,28 @@ def role_chat_module():
     在这里，你可以和各种有趣的角色用英语聊天。不要害羞，大胆说出你的想法！
     """)
     
+    chat_pane()
+
+
+def chat_history(role: str):
+    """
+    当前会话在这个角色下的聊天历史
+    
+    历史保存在进程级的注册表里（内存只留最近的消息，闲置会话会移出内存），
+    session_state 中只保存会话编号。
+    """
+    if 'chat_session_id' not in st.session_state:
+        st.session_state.chat_session_id = uuid.uuid4().hex
+    return chat_sessions.get(st.session_state.chat_session_id, role)
+
+
+@fragment
+def chat_pane():
+    """
+    聊天区域：角色选择、对话历史、输入框和控制按钮
+    
+    作为片段运行，发送消息或点击按钮时只重跑这一块，不重跑侧边栏和页面其它部分
+    """
     # 角色选择
     selected_role = st.selectbox(
         "🎭 选择你想对话的角色",
@@ -27,81 +56,62 @@ def role_chat_module():
         help="选择一个你感兴趣的角色，开始对话吧！"
     )
     
-    # 初始化或重置对话历史
+    history = chat_history(selected_role)
+    
+    # 初始化对话历史
     if 'current_role' not in st.session_state:
         st.session_state.current_role = selected_role
-        st.session_state.messages = []
+        history.clear()
     
-    # 如果角色改变，重置对话
+    # 如果角色改变，停止上一个角色还在生成的回复并重置对话
     if st.session_state.current_role != selected_role:
+        cancel_streams(st.session_state, "chat", "role_switch")
+        chat_sessions.discard(st.session_state.chat_session_id, st.session_state.current_role)
         st.session_state.current_role = selected_role
-        st.session_state.messages = []
-        # 添加欢迎消息
-        welcome_msg = f"你好！我是{selected_role.split()[1]}，让我们用英语聊聊天吧！What would you like to talk about today?"
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": welcome_msg
-        })
+        history.clear()
     
     # 如果是新对话，添加欢迎消息
-    if len(st.session_state.messages) == 0:
-        welcome_msg = f"你好！我是{selected_role.split()[1]}，让我们用英语聊聊天吧！What would you like to talk about today?"
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": welcome_msg
-        })
+    if len(history) == 0:
+        welcome_msg = build_role_welcome_message(selected_role)
+        history.append("assistant", welcome_msg)
+    
+    # 更早的对话只在磁盘上，需要时再读取
+    if history.earlier_count:
+        with st.expander(f"📜 更早的 {history.earlier_count} 条对话"):
+            if st.button("读取更早的对话", use_container_width=True):
+                for message in history.load_earlier():
+                    with st.chat_message(message["role"]):
+                        st.markdown(message["content"])
     
     # 显示对话历史
-    for message in st.session_state.messages:
+    for message in history.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
     
     # 用户输入
     if prompt := st.chat_input("Type your message in English... (用英语输入你的消息)"):
         # 添加用户消息到历史
-        st.session_state.messages.append({
-            "role": "user",
-            "content": prompt
-        })
+        history.append("user", prompt)
         
         # 显示用户消息
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # 构建系统提示词
-        role_name = selected_role.split()[1]  # 提取角色名称
-        system_prompt = f"""你现在正在扮演角色：{selected_role}。
-
-你的规则是：
-1. 必须完全沉浸在你的角色里，无论用户说什么，你都要以{role_name}的身份和口吻回应
-2. 你的对话对象是一个正在学习英语的10岁中国孩子，所以你的语言必须：
-   - 使用简单的词汇和短句
-   - 友好、充满鼓励
-   - 偶尔使用一些有趣的表情符号
-3. 绝对不要跳出角色。如果遇到不会回答的问题，就用角色的方式巧妙回避
-4. 你的每条回复都应该简短，最好不要超过3句话，以便孩子能跟上
-5. 可以适当地问一些简单的问题，鼓励孩子继续对话
-6. 当孩子用中文时，要温柔地鼓励他们用英语，比如说 "Try to say it in English! I believe you can do it!"
-
-记住：你现在是{role_name}，保持角色的特点和说话方式！"""
-        
         # 显示AI回复
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
-            full_response = ""
             
-            # 获取流式响应
-            for response_chunk in get_streaming_response(prompt, system_prompt):
-                full_response += response_chunk
-                message_placeholder.markdown(full_response + "▌")
+            # 获取流式响应，按帧合并渲染，避免每个片段都重发整段文本；
+            # 页面重跑打断渲染时立即关闭响应，断开上游连接
+            coalescer = RenderCoalescer(message_placeholder)
+            with contextlib.closing(stream_chat_reply(selected_role, prompt, history)) as chunks:
+                for response_chunk in chunks:
+                    coalescer.append(response_chunk)
             
-            message_placeholder.markdown(full_response)
+            full_response = coalescer.close()
         
         # 添加AI回复到历史
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": full_response
-        })
+        history.append("assistant", full_response)
     
     # 添加控制按钮
     st.markdown("---")
@@ -109,8 +119,9 @@ def role_chat_module():
     
     with col1:
         if st.button("🔄 开始新对话", use_container_width=True):
-            st.session_state.messages = []
-            st.rerun()
+            cancel_streams(st.session_state, "chat", "new_chat")
+            history.clear()
+            rerun_fragment()
     
     with col2:
         if st.button("💡 对话提示", use_container_width=True):
@@ -125,7 +136,7 @@ def role_chat_module():
     
     with col3:
         if st.button("📝 查看对话历史", use_container_width=True):
-            if len(st.session_state.messages) > 1:
-                st.info(f"你已经和{selected_role}进行了{len(st.session_state.messages)//2}轮对话！继续加油！")
+            if len(history) > 1:
+                st.info(f"你已经和{selected_role}进行了{len(history)//2}轮对话！继续加油！")
             else:
                 st.info("开始聊天吧！")
\ No newline at end of file
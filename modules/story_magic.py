@@ -2,8 +2,14 @@
 AI故事魔法屋模块
 """
 import streamlit as st
-from utils.api_client_simple import get_claude_response
-from config.settings import DEFAULT_KEYWORDS
+from utils.api_client_simple import generate, stream_generation, get_generation_service
+from utils.stream_render import render_markdown_stream
+from utils.story_prefetch import PrefetchSlot, story_prefetcher
+from utils.story_library import get_story_library, library_served
+from utils.fragments import fragment, rerun_fragment
+from config.settings import (
+    DEFAULT_KEYWORDS, STREAMING_OUTPUT, STORY_PREFETCH_ENABLED, STORY_LIBRARY_FALLBACK
+)
 
 
 def story_magic_module():
@@ -22,6 +28,17 @@ def story_magic_module():
     比如：`dragon, castle, magic` 或者 `space, robot, friend`
     """)
     
+    story_workspace()
+
+
+@fragment
+def story_workspace():
+    """
+    创作区域：关键词输入、生成按钮和故事结果
+    
+    作为片段运行，点击按钮时只重跑这一块。生成的故事保存在 session_state 中，
+    点击下面的互动按钮后依然显示。
+    """
     # 关键词输入
     col1, col2 = st.columns([3, 1])
     with col1:
@@ -37,53 +54,127 @@ def story_magic_module():
         st.write("")  # 空行对齐
         generate_button = st.button("🎨 开始创作！", type="primary", use_container_width=True)
     
+    streaming = st.checkbox(
+        "⚡ 边写边看",
+        value=STREAMING_OUTPUT,
+        help="故事一边生成一边显示，不用等整篇写完"
+    )
+    
+    # 有离线故事库时可以不等生成，直接挑一个最匹配的故事
+    instant = False
+    if get_story_library() is not None:
+        instant = st.checkbox(
+            "🚀 秒出故事",
+            value=False,
+            help="从故事库里挑一个和关键词最搭的故事，马上就能读"
+        )
+    
     # 生成故事
     if generate_button:
         if not keywords.strip():
             st.warning("😊 请先输入一些关键词哦！")
             return
         
-        # 构建系统提示词
-        system_prompt = """你是一位世界顶级的儿童故事作家，专门为正在学习英语的中国10岁孩子写故事。
-
-你的任务是：
-1. 根据用户提供的关键词，创作一个150-200词的英文小故事
-2. 故事必须情节简单、有趣、充满想象力
-3. 语言地道，但要使用适合小学生水平的词汇和语法
-4. 每个关键词都必须在故事中自然地出现
-5. 在故事结束后，必须用Markdown表格格式列出故事中的5个重点单词，提供中文翻译和简单的英文例句
-
-输出格式要求：
-- 首先输出一个吸引人的故事标题（用### 标记）
-- 然后是故事正文（分段书写，使段落清晰）
-- 最后是词汇表（使用Markdown表格）
-
-词汇表格式：
-| 单词 | 中文意思 | 例句 |
-|------|---------|------|
-| word | 意思 | Example sentence. |
-"""
+        if instant:
+            response = library_story(keywords, "instant")
+            st.markdown("---")
+            st.caption("📚 来自故事库")
+            st.markdown(response)
+            st.session_state.story_result = response
+            return
         
-        # 构建用户提示词
-        prompt = f"请用这些关键词创作一个有趣的英文故事：{keywords}"
+        # 调用生成服务创作故事（提示词和缓存都在服务里）
+        if streaming:
+            # 流式生成：标题、段落和词汇表逐步出现
+            st.markdown("---")
+            response = render_markdown_stream(stream_generation(
+                "story", lambda service, cancel: service.story(keywords, stream=True, cancel=cancel)
+            ))
+        else:
+            response = generate(lambda service: service.story(keywords))
+            if response:
+                # 显示生成的故事
+                st.markdown("---")
+                st.markdown(response)
         
-        # 调用API生成故事
-        response = get_claude_response(prompt, system_prompt)
+        if not response and STORY_LIBRARY_FALLBACK and get_story_library() is not None:
+            # 上游失败、超出额度或被限流时，先读一个故事库里的故事
+            response = library_story(keywords, "fallback")
+            st.info("🌧️ 魔法信号有点弱，先读一个故事库里的故事吧！")
+            st.markdown(response)
         
+        st.session_state.story_result = response
         if response:
-            # 显示生成的故事
-            st.markdown("---")
-            st.markdown(response)
-            
-            # 添加互动按钮
-            st.markdown("---")
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                if st.button("👍 很棒的故事！"):
-                    st.success("谢谢你的喜欢！继续努力学习英语吧！")
-            with col2:
-                if st.button("📖 再来一个"):
-                    st.info("修改关键词或点击'开始创作'按钮生成新故事！")
-            with col3:
-                if st.button("💾 收藏故事"):
-                    st.info("故事已经显示在上方，你可以复制保存哦！")
\ No newline at end of file
+            prefetch_next_story(keywords)
+    elif st.session_state.get('story_result'):
+        # 重跑时显示上一次生成的故事
+        st.markdown("---")
+        st.markdown(st.session_state.story_result)
+    
+    if st.session_state.get('story_result'):
+        # 添加互动按钮
+        st.markdown("---")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("👍 很棒的故事！"):
+                st.success("谢谢你的喜欢！继续努力学习英语吧！")
+        with col2:
+            if st.button("📖 再来一个"):
+                show_next_story(keywords, instant)
+        with col3:
+            if st.button("💾 收藏故事"):
+                st.info("故事已经显示在上方，你可以复制保存哦！")
+
+
+def _prefetch_slot():
+    """当前会话的预取槽"""
+    if 'story_prefetch' not in st.session_state:
+        st.session_state.story_prefetch = PrefetchSlot()
+    return st.session_state.story_prefetch
+
+
+def prefetch_next_story(keywords: str):
+    """故事显示后，在后台为同样的关键词提前生成下一个故事"""
+    if not STORY_PREFETCH_ENABLED:
+        return
+    service = get_generation_service()
+    if service is not None:
+        story_prefetcher.schedule(_prefetch_slot(), service, keywords)
+
+
+def library_story(keywords: str, reason: str) -> str:
+    """
+    从离线故事库取一个与关键词最匹配、本会话还没看过的故事
+    
+    Args:
+        reason: 指标标签，instant 或 fallback
+    """
+    library = get_story_library()
+    if 'story_library_seen' not in st.session_state:
+        st.session_state.story_library_seen = set()
+    seen = st.session_state.story_library_seen
+    found = library.search(keywords, exclude=seen)
+    if found is None:
+        # 整个故事库都看过了，从头再来
+        seen.clear()
+        found = library.search(keywords)
+    story_id, _ = found
+    seen.add(story_id)
+    library_served.inc((reason,))
+    return library.get(story_id)[1]
+
+
+def show_next_story(keywords: str, instant: bool = False):
+    """“再来一个”：有预取好的故事就直接显示，正在生成的就等它完成"""
+    if instant:
+        st.session_state.story_result = library_story(keywords, "instant")
+        rerun_fragment()
+    if STORY_PREFETCH_ENABLED:
+        slot = _prefetch_slot()
+        with st.spinner("下一个故事马上就好...✨"):
+            story = slot.take(keywords, wait=60)
+        if story:
+            st.session_state.story_result = story
+            prefetch_next_story(keywords)
+            rerun_fragment()
+    st.info("修改关键词或点击'开始创作'按钮生成新故事！")
\ No newline at end of file
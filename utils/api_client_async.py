@@ -0,0 +1,331 @@
+"""
+异步API客户端 - 基于asyncio和aiohttp，一个工作进程即可并发处理大量生成请求
+"""
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import aiohttp
+from config.settings import (
+    HTTP_POOL_MAXSIZE, ASYNC_MAX_CONCURRENCY, SSE_READ_SIZE, MAX_RETRIES,
+    LLM_CONNECT_TIMEOUT, LLM_STREAM_IDLE_TIMEOUT
+)
+from utils.transport import (
+    build_request_data, read_stream_event, parse_completion_text, coalesce_completion
+)
+from utils.cancellation import record_cancellation, timeout_error
+from utils.generation_profiles import get_generation_profile, DEFAULT_TIMEOUT
+from utils.metrics import observe_completion
+from utils.rate_limiter import (
+    rate_limiter, retry_budget, estimate_request_tokens,
+    parse_retry_after, backoff_delay, RETRYABLE_STATUS_CODES
+)
+from utils.sse_parser import SSEParser
+
+
+class AsyncAPIClient:
+    """
+    asyncio原生的API客户端
+
+    与 SimpleAPIClient 保持相同的 chat_completion 接口，但它是协程：
+    非流式返回响应字典，流式返回可以 async for 迭代的文本片段。
+    同时在途的请求数由信号量限制。
+    """
+
+    def __init__(self, api_key: str, api_base: str = None,
+                 max_concurrency: int = None, pool_maxsize: int = None):
+        self.api_key = api_key
+        self.api_base = api_base or "https://api.openai.com/v1"
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        self.max_concurrency = max_concurrency or ASYNC_MAX_CONCURRENCY
+        self.pool_maxsize = pool_maxsize or HTTP_POOL_MAXSIZE
+        self.timeout = aiohttp.ClientTimeout(total=60)
+
+        # 会话和信号量必须在事件循环内创建，延迟到第一次请求
+        self._session = None
+        self._semaphore = None
+        self.in_flight = 0
+        self.requests = 0
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    async def _get_session(self):
+        """获取（或创建）带keep-alive连接池的aiohttp会话"""
+        if self._session is None or self._session.closed:
+            trace_config = aiohttp.TraceConfig()
+
+            async def on_create(session, context, params):
+                self.connections_opened += 1
+
+            async def on_reuse(session, context, params):
+                self.connections_reused += 1
+
+            trace_config.on_connection_create_end.append(on_create)
+            trace_config.on_connection_reuseconn.append(on_reuse)
+
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                timeout=self.timeout,
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize),
+                trace_configs=[trace_config]
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def _post(self, session, url, data, observation=None, timeout=None):
+        """
+        发送请求：先经过进程级限流器，遇到429/5xx或连接错误时按退避策略重试
+
+        Args:
+            observation: 请求观测对象（可选），用于记录重试次数
+            timeout: 等待首字节的超时秒数（可选）；建立连接的超时为 LLM_CONNECT_TIMEOUT
+
+        Returns:
+            状态码正常的响应对象（调用方负责释放）
+        """
+        cost = estimate_request_tokens(data)
+        retry_budget.record_request()
+        attempt = 0
+
+        while True:
+            await rate_limiter.acquire_async(cost)
+            try:
+                # 流式响应开始后的读取间隔由 _stream_generator 按 LLM_STREAM_IDLE_TIMEOUT 限制
+                response = await session.post(url, json=data, timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=LLM_CONNECT_TIMEOUT, sock_read=timeout or DEFAULT_TIMEOUT))
+            except aiohttp.ClientConnectionError:
+                if attempt < MAX_RETRIES and retry_budget.try_spend():
+                    attempt += 1
+                    if observation is not None:
+                        observation.retries += 1
+                    await asyncio.sleep(backoff_delay(attempt))
+                    continue
+                raise
+
+            if (response.status in RETRYABLE_STATUS_CODES
+                    and attempt < MAX_RETRIES and retry_budget.try_spend()):
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                response.release()
+                attempt += 1
+                if observation is not None:
+                    observation.retries += 1
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+                continue
+
+            if response.status >= 400:
+                response.release()
+            response.raise_for_status()
+            return response
+
+    async def chat_completion(self, messages, model=None, max_tokens=None, temperature=None, stream=False,
+                              observation=None, stop=None, timeout=None):
+        """调用chat completions API（协程）"""
+        url = f"{self.api_base}/chat/completions"
+
+        # 构建请求数据
+        data = build_request_data(messages, model, max_tokens, temperature, stream, stop)
+        session = await self._get_session()
+
+        if stream:
+            # 流式响应：信号量在整个流的读取期间保持占用
+            return self._stream_generator(session, url, data, observation, timeout)
+
+        async with self._semaphore:
+            self.in_flight += 1
+            self.requests += 1
+            try:
+                async with await self._post(session, url, data, observation, timeout) as response:
+                    response_body = await response.read()
+                return parse_completion_text(response_body)
+            except asyncio.TimeoutError as e:
+                raise timeout_error(_module(observation), timeout_phase(e)) from e
+            except aiohttp.ClientError as e:
+                raise Exception(f"API请求失败: {str(e)}")
+            finally:
+                self.in_flight -= 1
+
+    async def _stream_generator(self, session, url, data, observation=None, timeout=None):
+        """逐个产出流式响应中的文本片段；开始输出后两次收到数据的间隔不超过 LLM_STREAM_IDLE_TIMEOUT"""
+        async with self._semaphore:
+            self.in_flight += 1
+            self.requests += 1
+            received = False
+            try:
+                async with await self._post(session, url, data, observation, timeout) as response:
+                    parser = SSEParser()
+                    chunks = response.content.iter_chunked(SSE_READ_SIZE).__aiter__()
+                    while True:
+                        try:
+                            data = await asyncio.wait_for(
+                                chunks.__anext__(), LLM_STREAM_IDLE_TIMEOUT if received else None)
+                        except StopAsyncIteration:
+                            break
+                        received = True
+                        for event in parser.feed(data):
+                            done, content = read_stream_event(event, observation)
+                            if done:
+                                return
+                            if content:
+                                yield content
+                    for event in parser.flush():
+                        done, content = read_stream_event(event, observation)
+                        if done:
+                            return
+                        if content:
+                            yield content
+            except asyncio.TimeoutError as e:
+                raise timeout_error(_module(observation), "idle" if received else timeout_phase(e)) from e
+            except aiohttp.ClientError as e:
+                raise Exception(f"API请求失败: {str(e)}")
+            finally:
+                self.in_flight -= 1
+
+    def pool_stats(self):
+        """统计连接复用情况（字段与 SimpleAPIClient.pool_stats 一致）"""
+        return {
+            "connections_opened": self.connections_opened,
+            "requests": self.requests,
+            "connection_reuse_hits": self.connections_reused,
+            "connection_reuse_misses": self.connections_opened,
+        }
+
+    async def aclose(self):
+        """关闭aiohttp会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+def _module(observation):
+    return observation.module if observation is not None else None
+
+
+def timeout_phase(error: Exception) -> str:
+    """aiohttp 的超时发生在建立连接还是等待首字节（3.9 只能从异常信息区分）"""
+    return "connect" if str(error).startswith("Connection timeout") else "first_byte"
+
+
+async def close_async_generator(agen):
+    """关闭异步生成器；被取消的读取还没退出时（取消要等事件循环处理）先等它退出"""
+    while agen.ag_running:
+        await asyncio.sleep(0)
+    await agen.aclose()
+
+
+class _BackgroundLoop:
+    """在后台守护线程中运行的进程级事件循环"""
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="async-api-client-loop",
+                    daemon=True
+                )
+                thread.start()
+            return self._loop
+
+    def run(self, coro):
+        """在后台循环中执行协程并阻塞等待结果"""
+        return self.submit(coro).result()
+
+    def submit(self, coro):
+        """在后台循环中执行协程，返回可以跨线程取消的 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+background_loop = _BackgroundLoop()
+
+
+class AsyncClientBridge:
+    """
+    异步客户端的同步外观
+
+    Streamlit脚本线程仍然用同步方式调用 chat_completion，实际请求则由
+    进程级事件循环统一多路复用，因此三个功能模块的调用代码无需改动。
+    """
+
+    def __init__(self, api_key: str, api_base: str = None,
+                 max_concurrency: int = None, pool_maxsize: int = None):
+        self.async_client = AsyncAPIClient(
+            api_key, api_base,
+            max_concurrency=max_concurrency,
+            pool_maxsize=pool_maxsize
+        )
+        self.api_key = self.async_client.api_key
+        self.api_base = self.async_client.api_base
+
+    def chat_completion(self, messages, model=None, max_tokens=None, temperature=None, stream=False,
+                        module=None, cancel=None):
+        """同步调用chat completions API（接口与 SimpleAPIClient 相同）"""
+        profile = get_generation_profile(module)
+        data = build_request_data(
+            messages, model, profile.reserve(max_tokens),
+            profile.temperature if temperature is None else temperature, stream, profile.stop
+        )
+
+        def send(data, cancel=None):
+            return observe_completion(module, data, functools.partial(
+                self._send, timeout=profile.timeout, cancel=cancel))
+
+        return coalesce_completion(self, data, send, cancel)
+
+    def _send(self, data, observation=None, timeout=None, cancel=None):
+        """在后台事件循环中发送一次请求"""
+        result = background_loop.run(self.async_client.chat_completion(
+            data["messages"], model=data["model"], max_tokens=data["max_tokens"],
+            temperature=data["temperature"], stream=data["stream"], observation=observation,
+            stop=data.get("stop"), timeout=timeout
+        ))
+        if data["stream"]:
+            return self._iterate_stream(result, cancel, observation)
+        return result
+
+    def _iterate_stream(self, agen, cancel=None, observation=None):
+        """
+        把异步生成器转换为同步生成器
+
+        取消令牌触发时取消正在等待的读取，异步生成器随即关闭连接并释放信号量。
+        """
+        pending = None
+        remove = None
+        if cancel is not None:
+            remove = cancel.on_cancel(lambda: pending is not None and pending.cancel())
+        completed = False
+        try:
+            while not (cancel is not None and cancel.cancelled):
+                pending = background_loop.submit(agen.__anext__())
+                try:
+                    chunk = pending.result()
+                except StopAsyncIteration:
+                    completed = True
+                    break
+                except concurrent.futures.CancelledError:
+                    break
+                yield chunk
+        finally:
+            if remove is not None:
+                remove()
+            if cancel is not None and cancel.cancelled and not completed:
+                if observation is not None:
+                    observation.cancelled = True
+                record_cancellation(_module(observation), cancel.reason)
+            # 调用方提前停止读取时也要释放连接和信号量
+            background_loop.run(close_async_generator(agen))
+
+    def pool_stats(self):
+        """统计连接复用情况"""
+        return self.async_client.pool_stats()
+
+    def close(self):
+        """关闭底层aiohttp会话"""
+        background_loop.run(self.async_client.aclose())
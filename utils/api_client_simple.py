@@ -1,121 +1,17 @@
 """
-简化的API客户端 - 使用requests库避免OpenAI SDK的兼容性问题
+简化的API客户端 - 页面会话使用的生成接口
+
+客户端保存在 st.session_state 中；传输层（连接池、重试、流式解析等）见 utils.transport。
 """
 import streamlit as st
-import requests
-import json
-from config.settings import OPENAI_MODEL, MAX_TOKENS, TEMPERATURE
-
-
-class SimpleAPIClient:
-    """简单的API客户端"""
-    
-    def __init__(self, api_key: str, api_base: str = None):
-        self.api_key = api_key
-        self.api_base = api_base or "https://api.openai.com/v1"
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-    
-    def chat_completion(self, messages, model=None, max_tokens=None, temperature=None, stream=False):
-        """调用chat completions API"""
-        url = f"{self.api_base}/chat/completions"
-        
-        # 构建请求数据
-        data = {
-            "model": model or OPENAI_MODEL,
-            "messages": messages,
-            "max_tokens": max_tokens or MAX_TOKENS,
-            "temperature": temperature or TEMPERATURE,
-            "stream": stream
-        }
-        
-        try:
-            if stream:
-                # 流式响应处理
-                data["stream"] = True
-                response = requests.post(url, headers=self.headers, json=data, stream=True, timeout=60)
-                response.raise_for_status()
-                
-                # 返回生成器
-                def stream_generator():
-                    for line in response.iter_lines():
-                        if line:
-                            line = line.decode('utf-8')
-                            if line.startswith('data: '):
-                                line = line[6:]  # 移除 "data: " 前缀
-                                if line == '[DONE]':
-                                    break
-                                try:
-                                    chunk = json.loads(line)
-                                    if chunk.get('choices') and len(chunk['choices']) > 0:
-                                        delta = chunk['choices'][0].get('delta', {})
-                                        if delta.get('content'):
-                                            yield delta['content']
-                                except json.JSONDecodeError:
-                                    continue
-                
-                # 返回生成器函数的调用结果
-                return stream_generator()
-                
-            else:
-                # 非流式响应 - 确保返回字典
-                data["stream"] = False
-                response = requests.post(url, headers=self.headers, json=data, timeout=60)
-                response.raise_for_status()
-                
-                # 获取响应文本
-                response_text = response.text
-                
-                # 尝试解析JSON
-                try:
-                    result = json.loads(response_text)
-                except json.JSONDecodeError:
-                    # 如果不是JSON，可能是流式响应格式
-                    # 尝试提取内容
-                    lines = response_text.strip().split('\n')
-                    content_parts = []
-                    
-                    for line in lines:
-                        if line.startswith('data: '):
-                            try:
-                                chunk_data = json.loads(line[6:])
-                                if chunk_data.get('choices') and len(chunk_data['choices']) > 0:
-                                    # 对于流式格式，尝试提取delta或message内容
-                                    choice = chunk_data['choices'][0]
-                                    if 'delta' in choice and 'content' in choice['delta']:
-                                        content_parts.append(choice['delta']['content'])
-                                    elif 'message' in choice and 'content' in choice['message']:
-                                        content_parts.append(choice['message']['content'])
-                            except:
-                                continue
-                    
-                    # 如果成功提取了内容，构造标准响应格式
-                    if content_parts:
-                        result = {
-                            'choices': [{
-                                'message': {
-                                    'content': ''.join(content_parts),
-                                    'role': 'assistant'
-                                },
-                                'finish_reason': 'stop'
-                            }]
-                        }
-                    else:
-                        raise Exception(f"无法解析API响应: {response_text[:500]}")
-                
-                # 确保返回的是字典格式
-                if not isinstance(result, dict):
-                    raise Exception(f"API返回了非预期的格式: {type(result)}")
-                    
-                return result
-                
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"API请求失败: {str(e)}")
+from config.settings import OPENAI_MODEL, GENERATION_SERVICE_URL
+from utils.cancellation import begin_stream
+from utils.generation_client import RemoteGenerationService
+from utils.generation_service import GenerationService
+from utils.transport import client_registry
 
 
-def init_client(api_key: str, api_base: str = None, model: str = None):
+def init_client(api_key: str, api_base: str = None, model: str = None, transport: str = None):
     """
     初始化简单API客户端
     
@@ -123,12 +19,13 @@ def init_client(api_key: str, api_base: str = None, model: str = None):
         api_key: API密钥
         api_base: API端点URL（可选）
         model: 模型名称（可选）
+        transport: 传输方式 "sync" 或 "async"（可选，默认读取 API_TRANSPORT）
     
     Returns:
-        SimpleAPIClient实例
+        客户端实例（同一配置在进程内共享）
     """
     try:
-        client = SimpleAPIClient(api_key, api_base)
+        client = client_registry.get_client(api_key, api_base, transport)
         
         # 保存模型名称到session state
         if model:
@@ -142,147 +39,202 @@ def init_client(api_key: str, api_base: str = None, model: str = None):
         return None
 
 
-def get_claude_response(prompt: str, system_prompt: str) -> str:
+def get_generation_service(local: bool = False):
     """
-    调用API获取响应
+    当前会话使用的生成服务
+    
+    配置了 GENERATION_SERVICE_URL 时把生成请求发给独立运行的生成服务，
+    否则用侧边栏连接的客户端在本进程内生成。
     
     Args:
-        prompt: 用户输入的提示词
-        system_prompt: 系统级提示词，定义AI的角色和行为
+        local: 只使用本进程内的生成服务（提示词由调用方组装时）
     
     Returns:
-        AI生成的响应文本
+        GenerationService 或 RemoteGenerationService；还没有连接时返回None
     """
-    # 检查客户端是否已初始化
-    if 'client' not in st.session_state or st.session_state.client is None:
-        st.error("❌ 请先在侧边栏输入您的API配置信息")
+    model = st.session_state.get('model')
+    if GENERATION_SERVICE_URL and not local:
+        return RemoteGenerationService(GENERATION_SERVICE_URL, model)
+    client = st.session_state.get('client')
+    if client is None:
         return None
+    return GenerationService(client, model or OPENAI_MODEL)
+
+
+def generate(request, local: bool = False):
+    """
+    在页面上调用生成服务，返回完整文本
     
-    # 获取模型名称
-    model = st.session_state.get('model', OPENAI_MODEL)
+    Args:
+        request: 接收生成服务、返回文本的函数，例如 lambda service: service.story(keywords)
+        local: 只使用本进程内的生成服务
+    
+    Returns:
+        生成的文本；出错时显示错误提示并返回None
+    """
+    service = get_generation_service(local)
+    if service is None:
+        st.error("❌ 请先在侧边栏输入您的API配置信息")
+        return None
     
     try:
         # 显示加载动画
         with st.spinner("克劳德正在思考中...✨"):
-            # 构建消息列表
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
-            
-            # 调用API
-            client = st.session_state.client
-            response = client.chat_completion(
-                messages=messages,
-                model=model,
-                max_tokens=MAX_TOKENS,
-                temperature=TEMPERATURE,
-                stream=False
-            )
-            
-            # 检查响应是否有效
-            if response:
-                # 确保是字典响应
-                if not isinstance(response, dict):
-                    st.error(f"❌ API返回了非预期的格式: {type(response)}")
-                    return None
-                    
-                # 检查是否有选择项
-                if response.get('choices') and len(response['choices']) > 0:
-                    # 获取消息内容
-                    choice = response['choices'][0]
-                    if 'message' in choice and 'content' in choice['message']:
-                        return choice['message']['content']
-                    else:
-                        st.error(f"❌ 响应格式不正确: {choice}")
-                        return None
-                else:
-                    # 检查是否有错误信息
-                    if 'error' in response:
-                        st.error(f"❌ API错误: {response['error']}")
-                    else:
-                        st.error(f"❌ API返回了空响应: {response}")
-                    return None
-            else:
-                st.error("❌ 未收到API响应")
-                return None
-            
+            return request(service)
     except Exception as e:
-        error_msg = str(e)
-        if "401" in error_msg or "api" in error_msg.lower() and "key" in error_msg.lower():
-            st.error("❌ API密钥无效，请检查您的密钥是否正确")
-        elif "429" in error_msg or "rate" in error_msg.lower():
-            st.error("⏳ 请求太频繁，请稍后再试")
-        elif "404" in error_msg or "model" in error_msg.lower():
-            st.error(f"❌ 模型 {model} 不可用，请检查模型名称")
-        else:
-            st.error(f"❌ 调用API时出错: {error_msg}")
+        show_api_error(str(e), service.model or OPENAI_MODEL)
         return None
 
 
-def get_streaming_response(prompt: str, system_prompt: str):
+def stream_generation(scope: str, request, local: bool = False, outcome: dict = None):
+    """
+    在页面上以流式方式调用生成服务
+    
+    Args:
+        scope: 页面区域名（story/writer/...），同一区域上一次还没结束的生成会被取消
+        request: 接收生成服务和取消令牌、返回文本片段迭代器的函数，
+                 例如 lambda service, cancel: service.story(keywords, stream=True, cancel=cancel)
+        local: 只使用本进程内的生成服务
+        outcome: 字典（可选），生成完整结束时写入 outcome["completed"] = True；
+                 中途出错、超时或被取消时为False（已经产出的只是部分文本）
+    
+    Yields:
+        响应文本片段；出错时显示错误提示并结束
+    
+    页面重跑让调用方提前停止读取时立即断开上游连接。
+    """
+    service = get_generation_service(local)
+    if service is None:
+        st.error("❌ 请先在侧边栏输入您的API配置信息")
+        return
+    
+    cancel = begin_stream(st.session_state, scope)
+    finished = False
+    if outcome is not None:
+        outcome["completed"] = False
+    try:
+        yield from request(service, cancel)
+        finished = True
+        if outcome is not None:
+            # 被取消的流也会安静地结束
+            outcome["completed"] = not cancel.cancelled
+    except Exception as e:
+        finished = True
+        show_api_error(str(e), service.model or OPENAI_MODEL)
+    finally:
+        if not finished:
+            cancel.cancel("rerun")
+
+
+def get_claude_response(prompt: str, system_prompt: str, module: str = None,
+                        cache_prompt: str = None) -> str:
     """
-    获取流式响应（用于聊天功能）
+    调用API获取响应（提示词由调用方组装，只在本进程内生成）
+    
+    Args:
+        prompt: 用户输入的提示词
+        system_prompt: 系统级提示词，定义AI的角色和行为
+        module: 调用方模块名（story/chat/writer），用于按模块开启缓存
+        cache_prompt: 计算缓存键时代替prompt使用的规范化文本（可选）
+    
+    Returns:
+        AI生成的响应文本
+    """
+    return generate(lambda service: service.complete(module, system_prompt, prompt, cache_prompt), local=True)
+
+
+def show_api_error(error_msg: str, model: str):
+    """把API异常转换为友好的错误提示"""
+    if "401" in error_msg or "api" in error_msg.lower() and "key" in error_msg.lower():
+        st.error("❌ API密钥无效，请检查您的密钥是否正确")
+    elif "429" in error_msg or "rate" in error_msg.lower():
+        st.error("⏳ 请求太频繁，请稍后再试")
+    elif "404" in error_msg or "model" in error_msg.lower():
+        st.error(f"❌ 模型 {model} 不可用，请检查模型名称")
+    else:
+        st.error(f"❌ 调用API时出错: {error_msg}")
+
+
+def stream_claude_response(prompt: str, system_prompt: str, module: str = None,
+                           cache_prompt: str = None):
+    """
+    以流式方式获取单轮响应（提示词由调用方组装，只在本进程内生成）
+    
+    参数同 get_claude_response。
+    
+    Yields:
+        响应文本片段；出错时显示错误提示并结束
+    """
+    yield from stream_generation(
+        module or "other",
+        lambda service, cancel: service.stream(module, system_prompt, prompt, cache_prompt, cancel),
+        local=True
+    )
+
+
+def stream_chat_reply(role: str, prompt: str, history):
+    """
+    角色聊天的流式回复（聊天室使用）
+    
+    Args:
+        role: 角色名
+        prompt: 当前输入
+        history: 聊天历史对象（见 utils.chat_history），已经包含当前输入
+    
+    Yields:
+        响应文本片段；出错时最后一段是错误提示
+    """
+    yield from _stream_chat(lambda service, cancel, summary_cache: service.chat(
+        role, history.messages, prompt, summary_cache, history.earlier_summary(), cancel
+    ))
+
+
+def get_streaming_response(prompt: str, system_prompt: str, history=None):
+    """
+    获取流式响应（提示词由调用方组装，只在本进程内生成）
     
     Args:
         prompt: 用户输入的提示词
         system_prompt: 系统级提示词
+        history: 聊天历史对象（可选，见 utils.chat_history），默认使用 st.session_state.messages
     
     Yields:
         响应文本片段
     """
-    # 检查客户端是否已初始化
-    if 'client' not in st.session_state or st.session_state.client is None:
+    if history is not None:
+        messages, earlier = history.messages, history.earlier_summary()
+    else:
+        messages, earlier = st.session_state.get('messages', []), None
+    yield from _stream_chat(lambda service, cancel, summary_cache: service.reply(
+        system_prompt, messages, prompt, summary_cache, earlier, cancel
+    ), local=True)
+
+
+def _stream_chat(request, local: bool = False):
+    """
+    按token预算组装上下文并流式生成聊天回复
+    
+    上一条还没结束的回复会被取消；页面重跑让调用方提前停止读取时立即断开上游连接。
+    """
+    service = get_generation_service(local)
+    if service is None:
         yield "❌ 请先在侧边栏输入您的API配置信息"
         return
     
-    # 获取模型名称
-    model = st.session_state.get('model', OPENAI_MODEL)
-    
+    cancel = begin_stream(st.session_state, "chat")
+    finished = False
     try:
-        # 构建消息列表
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
-        
-        # 如果有历史消息，添加到消息列表中
-        if 'messages' in st.session_state and len(st.session_state.messages) > 0:
-            # 只添加最近的几轮对话，避免超出token限制
-            history_messages = []
-            for msg in st.session_state.messages[-6:]:  # 最多保留最近3轮对话
-                if msg["role"] != "system":
-                    history_messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-            
-            # 重构消息列表：system + history + current
-            messages = [
-                {"role": "system", "content": system_prompt}
-            ] + history_messages + [
-                {"role": "user", "content": prompt}
-            ]
-        
-        # 调用API获取流式响应
-        client = st.session_state.client
-        response = client.chat_completion(
-            messages=messages,
-            model=model,
-            max_tokens=MAX_TOKENS,
-            temperature=TEMPERATURE,
-            stream=True
-        )
-        
-        # 检查返回值是否为生成器
-        if hasattr(response, '__iter__') and not isinstance(response, (str, dict)):
-            # 是生成器，直接迭代
-            for chunk in response:
-                yield chunk
-        else:
-            # 不是生成器，可能是错误或其他格式
-            yield f"❌ 意外的响应格式: {type(response)}"
-                
+        # 滚动摘要缓存在会话里，只有新的对话被挤出窗口时才增量更新
+        if 'chat_context_summary' not in st.session_state:
+            st.session_state.chat_context_summary = {}
+        prompt_tokens, response = request(service, cancel, st.session_state.chat_context_summary)
+        st.session_state.last_prompt_tokens = prompt_tokens
+        yield from response
+        finished = True
     except Exception as e:
         error_msg = str(e)
-        yield f"\n\n❌ 错误: {error_msg}"
\ No newline at end of file
+        yield f"\n\n❌ 错误: {error_msg}"
+        finished = True
+    finally:
+        if not finished:
+            cancel.cancel("rerun")
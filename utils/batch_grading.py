@@ -0,0 +1,181 @@
+"""
+批量批改工具 - 解析老师上传的作文、并发批改、导出结果
+"""
+import csv
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config.settings import BATCH_GRADING_WORKERS
+
+
+# CSV中可能的列名（小写比较）
+NAME_COLUMNS = ("name", "student", "姓名", "学生", "id", "学号")
+TEXT_COLUMNS = ("essay", "text", "content", "作文", "内容", "正文")
+
+
+def _decode(raw: bytes) -> str:
+    """按常见编码解码上传的文本文件"""
+    for encoding in ("utf-8-sig", "gb18030"):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode("utf-8", "replace")
+
+
+def _essays_from_csv(filename: str, text: str):
+    """从CSV中读取作文：优先按列名识别，否则第一列为姓名、最后一列为作文"""
+    rows = list(csv.reader(io.StringIO(text)))
+    rows = [row for row in rows if any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    name_index = next((i for i, h in enumerate(header) if h in NAME_COLUMNS), None)
+    text_index = next((i for i, h in enumerate(header) if h in TEXT_COLUMNS), None)
+    if text_index is None:
+        # 没有可识别的表头：所有行都是数据
+        text_index = len(rows[0]) - 1
+        name_index = 0 if len(rows[0]) > 1 else None
+    else:
+        rows = rows[1:]
+
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    essays = []
+    for number, row in enumerate(rows, start=1):
+        if text_index >= len(row) or not row[text_index].strip():
+            continue
+        name = row[name_index].strip() if name_index is not None and name_index < len(row) else ""
+        essays.append({"name": name or f"{stem}-{number}", "text": row[text_index].strip()})
+    return essays
+
+
+def _essays_from_file(filename: str, raw: bytes):
+    """根据扩展名解析单个文件"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".zip":
+        essays = []
+        with zipfile.ZipFile(io.BytesIO(raw)) as archive:
+            for info in archive.infolist():
+                # 跳过目录和macOS生成的元数据文件
+                if info.is_dir() or "__MACOSX" in info.filename or os.path.basename(info.filename).startswith("."):
+                    continue
+                essays.extend(_essays_from_file(info.filename, archive.read(info)))
+        return essays
+    if extension == ".csv":
+        return _essays_from_csv(filename, _decode(raw))
+    if extension == ".txt":
+        text = _decode(raw).strip()
+        if not text:
+            return []
+        return [{"name": os.path.splitext(os.path.basename(filename))[0], "text": text}]
+    return []
+
+
+def parse_uploaded_essays(files):
+    """
+    解析上传的作文文件
+
+    Args:
+        files: (文件名, 字节内容) 列表，支持 .csv、.txt 和包含它们的 .zip
+
+    Returns:
+        作文列表，每项为 {"name": 学生/文件名, "text": 作文内容}
+    """
+    essays = []
+    for filename, raw in files:
+        essays.extend(_essays_from_file(filename, raw))
+    return essays
+
+
+def extract_completion_content(response) -> str:
+    """
+    从chat completion响应中取出文本
+
+    Raises:
+        Exception: 响应格式不正确或包含错误
+    """
+    if not isinstance(response, dict):
+        raise Exception(f"API返回了非预期的格式: {type(response)}")
+    if response.get("choices"):
+        choice = response["choices"][0]
+        if "message" in choice and "content" in choice["message"]:
+            return choice["message"]["content"]
+        raise Exception(f"响应格式不正确: {choice}")
+    if "error" in response:
+        raise Exception(f"API错误: {response['error']}")
+    raise Exception(f"API返回了空响应: {response}")
+
+
+def grade_essays(service, essays, max_workers: int = None):
+    """
+    在有界线程池上并发批改作文
+
+    不使用 st.session_state，可以在工作线程中运行。单篇失败不影响其它作文。
+
+    Args:
+        service: 生成服务（GenerationService 或 RemoteGenerationService），每篇调用一次 grade
+        essays: parse_uploaded_essays 返回的作文列表
+        max_workers: 最大并发数
+
+    Yields:
+        每完成一篇产出一个结果字典：index、name、status、latency、feedback、error
+    """
+    def grade(index, essay):
+        start = time.perf_counter()
+        try:
+            feedback = service.grade(essay["text"])
+            status, error = "ok", ""
+        except Exception as e:
+            feedback, status, error = "", "failed", str(e)
+        return {
+            "index": index,
+            "name": essay["name"],
+            "text": essay["text"],
+            "status": status,
+            "latency": time.perf_counter() - start,
+            "feedback": feedback,
+            "error": error,
+        }
+
+    with ThreadPoolExecutor(max_workers=max_workers or BATCH_GRADING_WORKERS) as pool:
+        futures = [pool.submit(grade, index, essay) for index, essay in enumerate(essays)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def build_export_bundle(results) -> bytes:
+    """
+    把批改结果打包成zip：一个汇总Markdown文件和一个CSV表格
+
+    Returns:
+        zip文件的字节内容
+    """
+    results = sorted(results, key=lambda r: r["index"])
+
+    markdown = ["# 作文批改结果", ""]
+    for result in results:
+        markdown += [f"## {result['name']}", "", "**原文：**", "", result["text"], ""]
+        if result["status"] == "ok":
+            markdown += [result["feedback"], ""]
+        else:
+            markdown += [f"> ❌ 批改失败：{result['error']}", ""]
+        markdown += ["---", ""]
+
+    table = io.StringIO()
+    writer = csv.writer(table)
+    writer.writerow(["name", "status", "latency_seconds", "essay", "feedback", "error"])
+    for result in results:
+        writer.writerow([
+            result["name"], result["status"], f"{result['latency']:.2f}",
+            result["text"], result["feedback"], result["error"]
+        ])
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("feedback.md", "\n".join(markdown))
+        # 带BOM，Excel打开中文不乱码
+        archive.writestr("results.csv", "\ufeff" + table.getvalue())
+    return buffer.getvalue()
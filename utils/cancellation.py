@@ -0,0 +1,145 @@
+"""
+流式生成的取消和超时
+
+孩子点了“开始新对话”、切换角色，或者页面因为别的操作重跑时，还在生成的回复已经没人看了。
+CancelToken 由页面持有、传给客户端；取消时立即断开上游连接（关闭socket），
+不必等上游把回复写完或等到读取超时。
+
+流式请求的超时分三段：
+  connect     建立连接（LLM_CONNECT_TIMEOUT）
+  first_byte  等待首字节（按模块的生成参数 <模块>_TIMEOUT）
+  idle        开始输出后两次收到数据之间的间隔（LLM_STREAM_IDLE_TIMEOUT）
+被取消和超时的流都计入指标。
+
+本模块不依赖Streamlit；页面侧的令牌保存在调用方传入的状态字典（如 st.session_state）里。
+"""
+import itertools
+import threading
+from utils.metrics import registry as metrics_registry
+
+
+stream_cancellations = metrics_registry.counter(
+    "llm_stream_cancellations_total", "因取消而提前断开上游连接的流式响应数", ("module", "reason"))
+request_timeouts = metrics_registry.counter(
+    "llm_request_timeouts_total", "上游请求超时次数（connect/first_byte/idle）", ("module", "phase"))
+
+TIMEOUT_PHASES = {"connect": "建立连接", "first_byte": "等待首字节", "idle": "等待下一段数据"}
+
+
+class CancelToken:
+    """
+    可以跨线程触发的取消令牌
+
+    客户端用 on_cancel 登记断开连接的回调；cancel() 在任意线程调用，
+    依次执行已登记的回调，之后登记的回调会立即执行。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._ids = itertools.count()
+        self.cancelled = False
+        self.reason = None
+
+    def cancel(self, reason: str = "cancelled"):
+        """取消（重复调用只有第一次生效）"""
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            self.reason = reason
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # 回调只负责释放资源，出错不影响其它回调
+                pass
+
+    def on_cancel(self, callback):
+        """
+        登记取消时执行的回调
+
+        Returns:
+            注销回调的函数（流正常结束时调用）
+        """
+        with self._lock:
+            if not self.cancelled:
+                callback_id = next(self._ids)
+                self._callbacks[callback_id] = callback
+                return lambda: self._remove(callback_id)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback_id):
+        with self._lock:
+            self._callbacks.pop(callback_id, None)
+
+
+def record_cancellation(module: str, reason: str = None):
+    """记录一次因取消而断开的流"""
+    stream_cancellations.inc((module or "other", reason or "cancelled"))
+
+
+def timeout_error(module: str, phase: str) -> Exception:
+    """
+    记录一次超时并返回对应的异常
+
+    异常信息带有“超时”，指标中的请求结果归为 timeout。
+    """
+    request_timeouts.inc((module or "other", phase))
+    return Exception(f"API请求失败: {TIMEOUT_PHASES.get(phase, phase)}超时")
+
+
+def stream_stats():
+    """
+    取消和超时的累计次数（所有模块合计）
+
+    Returns:
+        {"cancelled": {原因: 次数}, "timeouts": {阶段: 次数}}
+    """
+    result = {"cancelled": {}, "timeouts": {}}
+    for name, counter in (("cancelled", stream_cancellations), ("timeouts", request_timeouts)):
+        with counter._lock:
+            items = list(counter.values.items())
+        for (_, label), value in items:
+            result[name][label] = result[name].get(label, 0) + int(value)
+    return result
+
+
+def begin_stream(state, scope: str) -> CancelToken:
+    """
+    为页面上的一个区域（如 chat、story、writer）开始新的流式生成
+
+    同一区域还没结束的上一次生成会被取消。
+
+    Args:
+        state: 保存令牌的字典（如 st.session_state）
+        scope: 区域名
+
+    Returns:
+        这次生成的取消令牌
+    """
+    tokens = state.setdefault("stream_tokens", {})
+    previous = tokens.get(scope)
+    if previous is not None:
+        previous.cancel("superseded")
+    token = tokens[scope] = CancelToken()
+    return token
+
+
+def cancel_streams(state, scope: str = None, reason: str = "navigation"):
+    """
+    取消页面上正在进行的流式生成
+
+    Args:
+        state: 保存令牌的字典（如 st.session_state）
+        scope: 区域名（可选，默认取消所有区域）
+        reason: 取消原因，用作指标标签
+    """
+    tokens = state.get("stream_tokens") or {}
+    for name in ([scope] if scope else list(tokens)):
+        token = tokens.pop(name, None)
+        if token is not None:
+            token.cancel(reason)
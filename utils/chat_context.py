@@ -0,0 +1,143 @@
+"""
+对话上下文管理 - 按token预算组装聊天历史，较早的对话折叠成滚动摘要
+"""
+import hashlib
+import re
+from config.settings import CHAT_CONTEXT_TOKEN_BUDGET, CHAT_SUMMARY_MAX_TOKENS
+
+
+# 中日韩字符大约一个字一个token，其余文本大约4个字符一个token
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+")
+
+# 每条消息的角色标记等额外开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """快速估算文本的token数（不依赖分词器）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: dict) -> int:
+    """估算一条消息占用的token数"""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def dedupe_turns(history):
+    """去掉连续重复的消息（例如重复提交的同一句话）"""
+    result = []
+    for message in history:
+        if result and result[-1]["role"] == message["role"] and result[-1]["content"] == message["content"]:
+            continue
+        result.append(message)
+    return result
+
+
+def _summary_line(message: dict) -> str:
+    """把一条消息压缩成一行摘要：取第一句话，最多20个词"""
+    speaker = "Kid" if message["role"] == "user" else "You"
+    first_sentence = _SENTENCE_END.split(message["content"].strip(), maxsplit=1)[0]
+    words = first_sentence.split()
+    if len(words) > 20:
+        first_sentence = " ".join(words[:20]) + " ..."
+    return f"- {speaker}: {first_sentence}"
+
+
+def _fingerprint(messages) -> str:
+    """已折叠部分的指纹，用于判断缓存的摘要是否仍然有效"""
+    if not messages:
+        return ""
+    last = messages[-1]
+    raw = f"{len(messages)}\x1f{last['role']}\x1f{last['content']}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def fold_summary(summary_lines, messages, max_tokens):
+    """把新折叠的消息追加到摘要中，超出上限时丢弃最早的行"""
+    lines = list(summary_lines) + [_summary_line(m) for m in messages]
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return lines
+
+
+def build_chat_messages(system_prompt: str, history, prompt: str, summary_cache: dict,
+                        budget: int = None, summary_max_tokens: int = None, earlier=None):
+    """
+    按token预算组装发送给API的消息列表
+
+    最近的对话尽量完整保留；放不进预算的较早对话折叠成滚动摘要。
+    摘要缓存在 summary_cache 中，只有当新的对话被挤出窗口时才增量更新。
+
+    Args:
+        system_prompt: 系统提示词
+        history: 历史消息列表（可以已经包含当前这句用户输入）
+        prompt: 当前用户输入
+        summary_cache: 用于保存滚动摘要的字典（例如 st.session_state 中的一项）
+        budget: 每次请求的输入token预算
+        summary_max_tokens: 摘要最多占用的token数
+        earlier: history 之前已经移出内存的对话 (条数, 摘要行列表)（可选），摘要接在它们后面
+
+    Returns:
+        (消息列表, 估算的输入token数)
+    """
+    budget = budget or CHAT_CONTEXT_TOKEN_BUDGET
+    summary_max_tokens = summary_max_tokens or CHAT_SUMMARY_MAX_TOKENS
+    earlier_count, earlier_lines = earlier or (0, [])
+
+    turns = dedupe_turns([m for m in history if m["role"] != "system"])
+    # 当前输入已经被模块加入了历史，避免重复发送
+    if turns and turns[-1]["role"] == "user" and turns[-1]["content"] == prompt:
+        turns = turns[:-1]
+
+    system_message = {"role": "system", "content": system_prompt}
+    current_message = {"role": "user", "content": prompt}
+    fixed_tokens = message_tokens(system_message) + message_tokens(current_message)
+
+    # 从最新的消息往前装，装不下的部分需要折叠
+    available = budget - fixed_tokens - summary_max_tokens
+    window_start = len(turns)
+    used = 0
+    while window_start > 0:
+        cost = message_tokens(turns[window_start - 1])
+        if used + cost > available:
+            break
+        used += cost
+        window_start -= 1
+
+    folded = turns[:window_start]
+    window = turns[window_start:]
+
+    summary_message = None
+    if folded or earlier_lines:
+        cached_upto = summary_cache.get("upto", 0)
+        if (summary_cache.get("earlier", 0) == earlier_count and 0 < cached_upto <= len(folded)
+                and summary_cache.get("fingerprint") == _fingerprint(folded[:cached_upto])):
+            # 只折叠新挤出窗口的消息
+            lines = fold_summary(summary_cache["lines"], folded[cached_upto:], summary_max_tokens)
+        else:
+            lines = fold_summary(earlier_lines, folded, summary_max_tokens)
+        summary_cache.update({
+            "earlier": earlier_count,
+            "upto": len(folded),
+            "fingerprint": _fingerprint(folded),
+            "lines": lines,
+        })
+        summary_message = {
+            "role": "system",
+            "content": "Summary of the earlier conversation:\n" + "\n".join(lines)
+        }
+    else:
+        summary_cache.clear()
+
+    messages = [system_message]
+    if summary_message:
+        messages.append(summary_message)
+    messages += [{"role": m["role"], "content": m["content"]} for m in window]
+    messages.append(current_message)
+
+    total_tokens = sum(message_tokens(m) for m in messages)
+    return messages, total_tokens
@@ -0,0 +1,365 @@
+"""
+聊天历史存储 - 内存里只保留每个会话最近的消息，更早的写入SQLite（WAL）文件
+
+每个 (会话, 角色) 的历史是一个定长的环形队列，超出的最早消息写入磁盘，
+同时折叠进一段滚动摘要，让对话上下文仍然知道前面聊过什么。
+闲置超过 CHAT_SESSION_IDLE_TIMEOUT 秒的会话整个写入磁盘并移出内存，
+回来时再从文件读取最近的消息，所以进程内存只与活跃会话数有关。
+
+历史对象保存在进程级的注册表里，st.session_state 中只保存会话编号，
+这样闲置会话即使浏览器标签一直开着，也会被后台线程定期清理移出内存。
+本模块不依赖Streamlit。
+"""
+import collections
+import os
+import sqlite3
+import sys
+import threading
+import time
+from config.settings import (
+    CHAT_HISTORY_RING_SIZE, CHAT_HISTORY_PATH, CHAT_SESSION_IDLE_TIMEOUT,
+    CHAT_HISTORY_RETENTION, CHAT_SUMMARY_MAX_TOKENS
+)
+from utils.chat_context import fold_summary
+from utils.metrics import registry as metrics_registry
+
+
+history_events = metrics_registry.counter(
+    "app_chat_history_events_total",
+    "聊天历史：spilled为写入磁盘移出内存的消息数，evicted为闲置移出内存的会话数，restored为从磁盘恢复的会话数",
+    ("event",)
+)
+
+# 恢复会话时用来重建滚动摘要的最近已落盘消息数
+SUMMARY_REBUILD_TURNS = 50
+# 后台闲置清理的间隔（秒）
+SWEEP_INTERVAL = 60
+# 每条消息除文本外的内存开销估算：元组、序号、时间戳
+TURN_OVERHEAD_BYTES = sys.getsizeof((0, "", "", 0.0)) + sys.getsizeof(0) + sys.getsizeof(0.0)
+
+
+class ChatHistoryStore:
+    """已落盘的聊天消息，按 (会话, 角色, 序号) 存放"""
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or CHAT_HISTORY_PATH
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _get_conn(self):
+        """延迟打开SQLite连接（调用方需持有锁）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chat_turns ("
+                "session TEXT NOT NULL, role TEXT NOT NULL, seq INTEGER NOT NULL, "
+                "speaker TEXT NOT NULL, content TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (session, role, seq))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_turns_created ON chat_turns (created)")
+        return self._conn
+
+    def write(self, session: str, role: str, turns):
+        """写入消息，turns 为 (序号, 说话人, 内容, 时间) 的列表"""
+        if not turns:
+            return
+        with self._lock:
+            conn = self._get_conn()
+            conn.executemany(
+                "INSERT OR REPLACE INTO chat_turns (session, role, seq, speaker, content, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(session, role, seq, speaker, content, created) for seq, speaker, content, created in turns]
+            )
+            conn.commit()
+
+    def load(self, session: str, role: str, before: int = None, limit: int = None):
+        """
+        读取序号小于 before 的最近 limit 条消息
+
+        Returns:
+            按序号从早到晚排列的 (序号, 说话人, 内容, 时间) 列表
+        """
+        query = "SELECT seq, speaker, content, created FROM chat_turns WHERE session = ? AND role = ?"
+        params = [session, role]
+        if before is not None:
+            query += " AND seq < ?"
+            params.append(before)
+        query += " ORDER BY seq DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._get_conn().execute(query, params).fetchall()
+        rows.reverse()
+        return rows
+
+    def next_seq(self, session: str, role: str) -> int:
+        """下一条消息的序号（即已落盘的最大序号加一）"""
+        with self._lock:
+            row = self._get_conn().execute(
+                "SELECT MAX(seq) FROM chat_turns WHERE session = ? AND role = ?", (session, role)
+            ).fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def delete(self, session: str, role: str):
+        with self._lock:
+            conn = self._get_conn()
+            conn.execute("DELETE FROM chat_turns WHERE session = ? AND role = ?", (session, role))
+            conn.commit()
+
+    def prune(self, before: float) -> int:
+        """删除早于 before 的消息，返回删除数"""
+        with self._lock:
+            conn = self._get_conn()
+            deleted = conn.execute("DELETE FROM chat_turns WHERE created < ?", (before,)).rowcount
+            conn.commit()
+        return deleted
+
+
+class ChatHistory:
+    """
+    一个 (会话, 角色) 的聊天历史：最近 ring_size 条在内存，更早的在磁盘
+
+    消息在内存里是 (序号, 说话人, 内容, 时间) 元组，messages 属性按需生成消息字典。
+    """
+
+    def __init__(self, store: ChatHistoryStore, session: str, role: str, ring_size: int = None):
+        self.store = store
+        self.session = session
+        self.role = role
+        self.ring = collections.deque(maxlen=ring_size or CHAT_HISTORY_RING_SIZE)
+        self.next_seq = 0
+        self.persisted_upto = 0  # 序号小于它的消息都已经在磁盘上
+        self.earlier_lines = []  # 已移出内存的消息的滚动摘要
+        self.last_access = time.time()
+        self.evicted = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def restore(cls, store: ChatHistoryStore, session: str, role: str, ring_size: int = None):
+        """从磁盘恢复被移出内存的历史：最近的消息放回内存，更早的重建摘要"""
+        history = cls(store, session, role, ring_size)
+        turns = store.load(session, role, limit=history.ring.maxlen + SUMMARY_REBUILD_TURNS)
+        if turns:
+            split = max(len(turns) - history.ring.maxlen, 0)
+            history.ring.extend(turns[split:])
+            history.earlier_lines = fold_summary(
+                [], [_as_message(turn) for turn in turns[:split]], CHAT_SUMMARY_MAX_TOKENS
+            )
+            history.next_seq = history.persisted_upto = turns[-1][0] + 1
+            history_events.inc(("restored",))
+        return history
+
+    def __len__(self):
+        return self.next_seq
+
+    @property
+    def messages(self):
+        """内存中的最近消息（消息字典列表）"""
+        with self._lock:
+            return [_as_message(turn) for turn in self.ring]
+
+    @property
+    def earlier_count(self) -> int:
+        """已移出内存、只在磁盘上的消息数"""
+        with self._lock:
+            return self.next_seq - len(self.ring)
+
+    def earlier_summary(self):
+        """(已移出内存的消息数, 摘要行列表)，用于组装对话上下文"""
+        with self._lock:
+            return self.next_seq - len(self.ring), list(self.earlier_lines)
+
+    def append(self, speaker: str, content: str):
+        """追加一条消息；内存已满时最早的一条写入磁盘"""
+        now = time.time()
+        with self._lock:
+            self.last_access = now
+            turn = (self.next_seq, speaker, content, now)
+            self.next_seq += 1
+            if self.evicted:
+                # 已经被移出注册表（闲置清理与本次访问同时发生），直接落盘
+                self.store.write(self.session, self.role, [turn])
+                self.persisted_upto = self.next_seq
+                return
+            if len(self.ring) == self.ring.maxlen:
+                oldest = self.ring[0]
+                if oldest[0] >= self.persisted_upto:
+                    self.store.write(self.session, self.role, [oldest])
+                    self.persisted_upto = oldest[0] + 1
+                self.earlier_lines = fold_summary(self.earlier_lines, [_as_message(oldest)], CHAT_SUMMARY_MAX_TOKENS)
+                history_events.inc(("spilled",))
+            self.ring.append(turn)
+
+    def load_earlier(self, limit: int = None):
+        """从磁盘读取已移出内存的消息（消息字典列表，从早到晚）"""
+        with self._lock:
+            before = self.ring[0][0] if self.ring else self.next_seq
+        return [_as_message(turn) for turn in self.store.load(self.session, self.role, before, limit)]
+
+    def clear(self):
+        """清空历史（内存和磁盘）"""
+        with self._lock:
+            self.ring.clear()
+            self.earlier_lines = []
+            self.next_seq = self.persisted_upto = 0
+            self.last_access = time.time()
+        self.store.delete(self.session, self.role)
+
+    def evict(self):
+        """把内存中还没落盘的消息写入磁盘，并释放内存"""
+        with self._lock:
+            self.evicted = True
+            pending = [turn for turn in self.ring if turn[0] >= self.persisted_upto]
+            self.store.write(self.session, self.role, pending)
+            self.persisted_upto = self.next_seq
+            self.ring.clear()
+            self.earlier_lines = []
+
+    def memory_bytes(self) -> int:
+        """内存中消息占用的字节数估算"""
+        with self._lock:
+            return (sum(sys.getsizeof(turn[2]) + TURN_OVERHEAD_BYTES for turn in self.ring)
+                    + sum(sys.getsizeof(line) for line in self.earlier_lines))
+
+
+def _as_message(turn) -> dict:
+    return {"role": turn[1], "content": turn[2]}
+
+
+class ChatSessions:
+    """
+    进程级的聊天历史注册表：按 (会话, 角色) 保存历史，并定期把闲置的会话移出内存
+    """
+
+    def __init__(self, store: ChatHistoryStore = None, ring_size: int = None,
+                 idle_timeout: float = None, retention: float = None):
+        self.store = store or ChatHistoryStore()
+        self.ring_size = ring_size or CHAT_HISTORY_RING_SIZE
+        self.idle_timeout = CHAT_SESSION_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.retention = CHAT_HISTORY_RETENTION if retention is None else retention
+        self._histories = {}
+        self._lock = threading.Lock()
+        self._sweep_thread = None
+        self._stop = threading.Event()
+        self.evictions = 0
+
+    def get(self, session: str, role: str) -> ChatHistory:
+        """获取一个会话在某个角色下的历史，被移出内存的会从磁盘恢复"""
+        key = (session, role)
+        with self._lock:
+            history = self._histories.get(key)
+        if history is None:
+            history = ChatHistory.restore(self.store, session, role, self.ring_size)
+            with self._lock:
+                history = self._histories.setdefault(key, history)
+        history.last_access = time.time()
+        return history
+
+    def discard(self, session: str, role: str):
+        """丢弃一个历史：从内存中移除并删除磁盘上的消息，还没落盘的消息不再写入"""
+        with self._lock:
+            self._histories.pop((session, role), None)
+        self.store.delete(session, role)
+
+    def start_sweeping(self, interval: float = None):
+        """
+        启动后台线程，每隔 interval 秒（默认 SWEEP_INTERVAL）清理一次
+
+        没有聊天流量时闲置的会话也会按时移出内存。
+        """
+        if self._sweep_thread is not None:
+            return
+        with self._lock:
+            if self._sweep_thread is not None:
+                return
+            self._sweep_thread = threading.Thread(
+                target=self._sweep_loop, args=(interval or SWEEP_INTERVAL,), name="chat-history-sweep", daemon=True
+            )
+            self._sweep_thread.start()
+
+    def stop_sweeping(self):
+        """停止后台清理线程"""
+        self._stop.set()
+
+    def _sweep_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                # 磁盘暂时不可写时下一轮再试，不能让线程退出
+                continue
+
+    def sweep(self, now: float = None) -> int:
+        """
+        把闲置超时的历史写入磁盘并移出内存，删除超过保留期的落盘消息
+
+        Returns:
+            移出内存的历史数
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            idle = [key for key, history in self._histories.items()
+                    if now - history.last_access > self.idle_timeout]
+            evicted = [self._histories.pop(key) for key in idle]
+            self.evictions += len(evicted)
+        for history in evicted:
+            history.evict()
+        if evicted:
+            history_events.inc(("evicted",), len(evicted))
+        if self.retention:
+            self.store.prune(now - self.retention)
+        return len(evicted)
+
+    def memory_report(self):
+        """
+        每个会话的内存占用
+
+        Returns:
+            按内存占用从大到小排列的字典列表：session、role、turns_in_memory、turns_on_disk、bytes、idle_s
+        """
+        now = time.time()
+        with self._lock:
+            histories = list(self._histories.values())
+        rows = []
+        for history in histories:
+            rows.append({
+                "session": history.session,
+                "role": history.role,
+                "turns_in_memory": len(history.ring),
+                "turns_on_disk": history.earlier_count,
+                "bytes": history.memory_bytes(),
+                "idle_s": round(now - history.last_access, 1),
+            })
+        rows.sort(key=lambda row: row["bytes"], reverse=True)
+        return rows
+
+    def stats(self):
+        rows = self.memory_report()
+        return {
+            "sessions": len(rows),
+            "turns_in_memory": sum(row["turns_in_memory"] for row in rows),
+            "bytes": sum(row["bytes"] for row in rows),
+            "evictions": self.evictions,
+        }
+
+
+# 进程内唯一的聊天历史注册表，所有Streamlit会话共享
+chat_sessions = ChatSessions()
+chat_sessions.start_sweeping()
+
+
+def _collect_history_gauges():
+    stats = chat_sessions.stats()
+    return {
+        "app_chat_sessions_in_memory": ("内存中的聊天历史数", stats["sessions"]),
+        "app_chat_history_memory_bytes": ("内存中聊天消息占用的字节数估算", stats["bytes"]),
+    }
+
+
+metrics_registry.register_collector(_collect_history_gauges)
@@ -0,0 +1,272 @@
+"""
+多端点路由 - 按加权端点列表和观测到的首token延迟（EWMA）选择上游，带健康探测和熔断
+
+配置示例（OPENAI_API_ENDPOINTS，逗号分隔，每项为 URL|密钥|权重，密钥和权重可省略）：
+    https://us.example.com/v1|sk-us|3, https://eu.example.com/v1||1
+
+省略密钥时使用客户端自己的密钥。每个请求在可用端点中选择延迟最低的一组，
+再按权重随机分配；连续失败的端点熔断一段时间，之后放行一个试探请求（半开），
+成功则恢复，失败则继续熔断。
+"""
+import random
+import threading
+import time
+import requests
+from config.settings import (
+    OPENAI_API_ENDPOINTS, ROUTER_EWMA_ALPHA, ROUTER_LATENCY_SLACK, ROUTER_HEALTH_INTERVAL,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT
+)
+
+
+class NoHealthyEndpoint(Exception):
+    """所有端点都处于熔断状态"""
+
+
+class CircuitBreaker:
+    """
+    单个端点的熔断器：closed -> open -> half_open -> closed
+
+    连续失败达到阈值后打开；打开超过 reset_timeout 秒后进入半开，
+    只放行一个试探请求。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = None, reset_timeout: float = None):
+        self.failure_threshold = failure_threshold or BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    def available(self, now: float) -> bool:
+        """是否可以把请求发到这个端点（不改变状态）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return now - self.opened_at >= self.reset_timeout
+        return not self.trial_in_flight
+
+    def acquire(self, now: float):
+        """选中端点时调用：打开时间已到则进入半开，并占用唯一的试探名额"""
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = now
+
+    def probe_succeeded(self, now: float):
+        """健康探测成功：打开状态的端点提前进入可试探状态"""
+        if self.state == self.OPEN:
+            self.opened_at = now - self.reset_timeout
+
+
+class Endpoint:
+    """一个上游端点"""
+
+    def __init__(self, url: str, api_key: str = None, weight: float = 1.0):
+        self.url = url.rstrip("/")
+        self.api_key = api_key or None
+        self.weight = weight if weight > 0 else 1.0
+        self.ewma_ttft = None  # 秒；还没有观测值时为None
+        self.breaker = CircuitBreaker()
+        self.requests = 0
+        self.failures = 0
+        self.last_probe_ok = None
+
+    def observe_ttft(self, seconds: float, alpha: float):
+        if self.ewma_ttft is None:
+            self.ewma_ttft = seconds
+        else:
+            self.ewma_ttft = alpha * seconds + (1 - alpha) * self.ewma_ttft
+
+
+def parse_endpoints(spec: str):
+    """
+    解析端点配置字符串
+
+    Returns:
+        Endpoint 列表（配置为空时为空列表）
+    """
+    endpoints = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        parts = [p.strip() for p in item.split("|")]
+        url = parts[0]
+        api_key = parts[1] if len(parts) > 1 else None
+        try:
+            weight = float(parts[2]) if len(parts) > 2 and parts[2] else 1.0
+        except ValueError:
+            raise ValueError(f"端点权重不是数字: {item}")
+        endpoints.append(Endpoint(url, api_key, weight))
+    return endpoints
+
+
+class EndpointRouter:
+    """
+    进程级端点路由器
+
+    所有会话共享同一份延迟和熔断状态，一个区域变慢或出错时，
+    新请求会自动转到其它端点。
+    """
+
+    def __init__(self, endpoints, alpha: float = None, latency_slack: float = None,
+                 health_interval: float = None):
+        if not endpoints:
+            raise ValueError("至少需要一个端点")
+        self.endpoints = list(endpoints)
+        self.alpha = alpha or ROUTER_EWMA_ALPHA
+        self.latency_slack = latency_slack or ROUTER_LATENCY_SLACK
+        self.health_interval = ROUTER_HEALTH_INTERVAL if health_interval is None else health_interval
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._probe_thread = None
+        self._stop = threading.Event()
+        self.failovers = 0
+
+    def serves(self, api_base: str) -> bool:
+        """api_base 是否是配置的端点之一"""
+        return api_base.rstrip("/") in {e.url for e in self.endpoints}
+
+    def pick(self, exclude=(), in_use=()):
+        """
+        为一次请求选择端点
+
+        Args:
+            exclude: 本次请求已经失败过的端点，重试时尽量避开（计为一次故障转移）
+            in_use: 同一请求的对冲请求正在使用的端点，也尽量避开
+
+        Raises:
+            NoHealthyEndpoint: 所有端点都在熔断中
+        """
+        self._ensure_probing()
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e.breaker.available(now)]
+            preferred = [e for e in candidates if e not in exclude and e not in in_use]
+            candidates = preferred or candidates
+            if not candidates:
+                raise NoHealthyEndpoint("503 所有API端点暂时不可用，请稍后再试")
+
+            # 没有观测值的端点按当前最快的算，保证新端点能被试到
+            known = [e.ewma_ttft for e in candidates if e.ewma_ttft is not None]
+            best = min(known) if known else 0.0
+            limit = best * self.latency_slack
+            fast = [e for e in candidates if e.ewma_ttft is None or e.ewma_ttft <= limit]
+
+            endpoint = self._random.choices(fast, weights=[e.weight for e in fast])[0]
+            endpoint.breaker.acquire(now)
+            endpoint.requests += 1
+            if exclude:
+                self.failovers += 1
+            return endpoint
+
+    def record_success(self, endpoint: Endpoint, ttft: float = None):
+        """请求成功；ttft 为首token（非流式为响应头）到达的秒数"""
+        with self._lock:
+            endpoint.breaker.record_success()
+            if ttft is not None:
+                endpoint.observe_ttft(ttft, self.alpha)
+
+    def record_failure(self, endpoint: Endpoint):
+        """连接错误、超时、429或5xx"""
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.breaker.record_failure(time.monotonic())
+
+    def release(self, endpoint: Endpoint):
+        """请求在有结果之前被放弃（例如流在首token前被关闭），归还半开的试探名额"""
+        with self._lock:
+            endpoint.breaker.trial_in_flight = False
+
+    def _ensure_probing(self):
+        if self.health_interval <= 0 or self._probe_thread is not None:
+            return
+        with self._lock:
+            if self._probe_thread is not None:
+                return
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop, name="endpoint-health", daemon=True
+            )
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        session = requests.Session()
+        while not self._stop.wait(self.health_interval):
+            for endpoint in list(self.endpoints):
+                self.probe(endpoint, session)
+
+    def probe(self, endpoint: Endpoint, session=None):
+        """
+        探测一次端点（GET /models）
+
+        只影响熔断状态，不计入延迟：列模型接口的耗时和首token延迟不是一回事。
+        """
+        headers = {"Authorization": f"Bearer {endpoint.api_key}"} if endpoint.api_key else {}
+        try:
+            response = (session or requests).get(f"{endpoint.url}/models", headers=headers, timeout=5)
+            ok = response.status_code < 500
+            response.close()
+        except requests.exceptions.RequestException:
+            ok = False
+        with self._lock:
+            endpoint.last_probe_ok = ok
+            now = time.monotonic()
+            if ok:
+                endpoint.breaker.probe_succeeded(now)
+            else:
+                endpoint.failures += 1
+                endpoint.breaker.record_failure(now)
+        return ok
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """每个端点的状态，用于指标面板"""
+        with self._lock:
+            return [{
+                "url": e.url,
+                "weight": e.weight,
+                "state": e.breaker.state,
+                "ewma_ttft_s": e.ewma_ttft,
+                "requests": e.requests,
+                "failures": e.failures,
+                "times_opened": e.breaker.times_opened,
+            } for e in self.endpoints]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_endpoint_router():
+    """
+    获取进程级路由器；没有配置 OPENAI_API_ENDPOINTS 时返回None
+    """
+    global _router
+    if not OPENAI_API_ENDPOINTS:
+        return None
+    with _router_lock:
+        if _router is None:
+            _router = EndpointRouter(parse_endpoints(OPENAI_API_ENDPOINTS))
+        return _router
@@ -0,0 +1,189 @@
+"""
+作文修改后的增量批改 - 按句子比较两次提交，只把改动过的句子发给AI
+
+上一次的批改结果按“修改建议”表格拆成一条条批注，每条批注对应原文里的一个句子或词组：
+  - 原文还出现在没改动的句子里：沿用这条批注，不再重新批改
+  - 原文已经不在作文里：算作已经改正
+改动过或新写的句子连同上次批改的简要回顾一起发给AI，
+最后把AI的新批改和沿用的批注合成一份完整的批改结果。
+
+本模块不依赖Streamlit。
+"""
+import difflib
+import re
+from config.settings import WRITER_REVISION_MIN_SIMILARITY
+from utils.chat_context import estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+from utils.metrics import registry as metrics_registry
+from utils.prompts import (
+    WRITER_SYSTEM_PROMPT, WRITER_REVISION_SYSTEM_PROMPT, build_writer_prompt, build_writer_revision_prompt
+)
+
+
+revisions_total = metrics_registry.counter(
+    "app_writer_revisions_total",
+    "作文重新提交：incremental为只批改改动的句子，unchanged为没有改动直接沿用"
+    "（改动太大、相当于一篇新作文时按新作文完整批改，不计入）",
+    ("mode",)
+)
+revision_tokens_saved = metrics_registry.counter(
+    "app_writer_revision_tokens_saved_total", "增量批改相对完整重新批改少用的token数（估算）", ("type",))
+
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+TABLE_ROW_PATTERN = re.compile(r"^\s*\|(.+)\|\s*$", re.MULTILINE)
+SECTION_PATTERN = re.compile(r"^###\s", re.MULTILINE)
+SPACES_PATTERN = re.compile(r"\s+")
+TABLE_HEADER = "| 原文 | 修改后 | 小贴士 |\n|------|--------|---------|"
+REUSED_HEADING = "### 📌 没有改动的句子"
+REMOVED_ONLY_FEEDBACK = "### ✅ 修改建议\n\n有问题的句子已经删掉了，留下的句子都写得很好！"
+
+
+def split_sentences(text: str):
+    """把作文切成句子（按句末标点和换行）"""
+    return [sentence.strip() for sentence in SENTENCE_SPLIT_PATTERN.split(text or "") if sentence.strip()]
+
+
+def _normalize(text: str) -> str:
+    return SPACES_PATTERN.sub(" ", text).strip()
+
+
+def parse_annotations(feedback: str):
+    """
+    取出批改结果中所有“原文 | 修改后 | 小贴士”表格行
+
+    Returns:
+        (原文, 修改后, 小贴士) 列表
+    """
+    rows = []
+    for match in TABLE_ROW_PATTERN.finditer(feedback or ""):
+        cells = [cell.strip() for cell in match.group(1).split("|")]
+        if len(cells) != 3 or cells[0] in ("原文", "原句或词组") or set(cells[0]) <= set("-: "):
+            continue
+        rows.append(tuple(cells))
+    return rows
+
+
+def extract_section(feedback: str, title: str) -> str:
+    """取出标题包含 title 的小节（含标题行），没有时返回空字符串"""
+    starts = [match.start() for match in SECTION_PATTERN.finditer(feedback or "")] + [len(feedback or "")]
+    for start, end in zip(starts, starts[1:]):
+        section = feedback[start:end]
+        if title in section.split("\n", 1)[0]:
+            return section.strip()
+    return ""
+
+
+def summarize_feedback(feedback: str, max_items: int = 4) -> str:
+    """上次批改的简要回顾：总体评价的第一句和前几条修改建议"""
+    lines = []
+    overall = extract_section(feedback, "总体评价").split("\n", 1)[-1].strip()
+    if overall:
+        lines.append("- 评价：" + re.split(r"(?<=[。！!.])", overall, maxsplit=1)[0])
+    for original, revised, _ in parse_annotations(feedback)[:max_items]:
+        lines.append(f"- {original} → {revised}")
+    return "\n".join(lines) or "- （无）"
+
+
+class RevisionPlan:
+    """一次重新提交与上次提交的句子级比较结果"""
+
+    def __init__(self, previous_text: str, previous_feedback: str, text: str):
+        self.previous_text = previous_text
+        self.previous_feedback = previous_feedback
+        self.text = text
+        old = split_sentences(previous_text)
+        new = split_sentences(text)
+        matcher = difflib.SequenceMatcher(None, [_normalize(s) for s in old], [_normalize(s) for s in new],
+                                          autojunk=False)
+        kept = set()
+        kept_old = set()
+        for block in matcher.get_matching_blocks():
+            kept.update(range(block.b, block.b + block.size))
+            kept_old.update(range(block.a, block.a + block.size))
+        self.similarity = matcher.ratio()
+        self.unchanged = [sentence for i, sentence in enumerate(new) if i in kept]
+        self.changed = [sentence for i, sentence in enumerate(new) if i not in kept]
+        self.removed = [sentence for i, sentence in enumerate(old) if i not in kept_old]
+
+        unchanged_text = _normalize(" ".join(self.unchanged))
+        self.reused = []
+        self.resolved = []
+        for row in parse_annotations(previous_feedback):
+            original = _normalize(row[0])
+            if original and original in unchanged_text:
+                self.reused.append(row)
+            elif original and original not in _normalize(text):
+                self.resolved.append(row)
+
+    @property
+    def mode(self) -> str:
+        """
+        unchanged：句子完全相同；incremental：只批改改动的句子（只删了句子时不用再调用AI）；
+        full：改动太大，相当于一篇新作文
+        """
+        if not self.changed and not self.removed:
+            return "unchanged"
+        if self.similarity < WRITER_REVISION_MIN_SIMILARITY:
+            return "full"
+        return "incremental"
+
+    def prompt(self) -> str:
+        """增量批改的用户提示词"""
+        return build_writer_revision_prompt(self.changed, summarize_feedback(self.previous_feedback))
+
+    def appendix(self, revision_feedback: str = "") -> str:
+        """接在增量批改结果后面的部分：沿用的批注表格，以及新回复里没有的“新知识”小节"""
+        parts = []
+        if self.reused:
+            rows = "\n".join(f"| {original} | {revised} | {tip} |" for original, revised, tip in self.reused)
+            parts.append(f"{REUSED_HEADING}（之前的建议）\n\n{TABLE_HEADER}\n{rows}")
+        knowledge = extract_section(self.previous_feedback, "新知识")
+        if knowledge and "新知识" not in (revision_feedback or ""):
+            parts.append(knowledge)
+        return "\n\n".join(parts)
+
+    def merge(self, revision_feedback: str) -> str:
+        """把增量批改的结果和沿用的批注合成完整的批改结果"""
+        parts = [(revision_feedback or "").strip(), self.appendix(revision_feedback)]
+        merged = "\n\n".join(part for part in parts if part)
+        if not merged and not self.changed:
+            # 只删掉了句子，留下的句子上次就没有需要修改的地方
+            return REMOVED_ONLY_FEEDBACK
+        return merged
+
+    def savings(self, revision_feedback: str = ""):
+        """
+        相对把整篇作文重新完整批改少用的token数（估算）
+
+        Returns:
+            字典：prompt_full、prompt_sent、prompt_saved、completion_full、completion_sent、completion_saved
+        """
+        prompt_full = _prompt_tokens(WRITER_SYSTEM_PROMPT, build_writer_prompt(self.text))
+        # 完整批改的输出长度按上次的批改结果估算
+        completion_full = estimate_tokens(self.previous_feedback)
+        if self.mode == "incremental" and self.changed:
+            prompt_sent = _prompt_tokens(WRITER_REVISION_SYSTEM_PROMPT, self.prompt())
+            completion_sent = estimate_tokens(revision_feedback)
+        elif self.mode == "full":
+            prompt_sent, completion_sent = prompt_full, completion_full
+        else:
+            prompt_sent = completion_sent = 0
+        return {
+            "prompt_full": prompt_full,
+            "prompt_sent": prompt_sent,
+            "prompt_saved": max(prompt_full - prompt_sent, 0),
+            "completion_full": completion_full,
+            "completion_sent": completion_sent,
+            "completion_saved": max(completion_full - completion_sent, 0),
+        }
+
+    def record(self, revision_feedback: str = ""):
+        """计入指标并返回 savings()"""
+        revisions_total.inc((self.mode,))
+        savings = self.savings(revision_feedback)
+        revision_tokens_saved.inc(("prompt",), savings["prompt_saved"])
+        revision_tokens_saved.inc(("completion",), savings["completion_saved"])
+        return savings
+
+
+def _prompt_tokens(system_prompt: str, prompt: str) -> int:
+    return estimate_tokens(system_prompt) + estimate_tokens(prompt) + 2 * MESSAGE_OVERHEAD_TOKENS
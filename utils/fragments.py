@@ -0,0 +1,31 @@
+"""
+局部重跑（fragment）兼容层 - 交互时只重跑所在的区域，而不是整个 app.py
+
+Streamlit 1.37 起提供 st.fragment（1.33-1.36 为 st.experimental_fragment）。
+更老的版本没有片段，装饰器原样返回函数，交互时照旧整页重跑。
+"""
+import streamlit as st
+from streamlit.errors import StreamlitAPIException
+
+
+def _whole_script(func=None, **kwargs):
+    """没有片段支持时的替代装饰器"""
+    if func is None:
+        return lambda f: f
+    return func
+
+
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or _whole_script
+FRAGMENTS_SUPPORTED = fragment is not _whole_script
+
+
+def rerun_fragment():
+    """重跑当前片段；不支持按片段重跑时重跑整页"""
+    try:
+        st.rerun(scope="fragment")
+    except TypeError:
+        # 1.37之前的 st.rerun 没有 scope 参数
+        st.rerun()
+    except StreamlitAPIException:
+        # 片段是随整页运行的，这时只能整页重跑
+        st.rerun()
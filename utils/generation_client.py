@@ -0,0 +1,160 @@
+"""
+生成服务的HTTP客户端 - 与 utils.generation_service.GenerationService 相同的接口，
+生成请求发给独立运行的 generation_server.py
+
+配置 GENERATION_SERVICE_URL 后页面使用这个客户端，页面进程里不再组装提示词、也不直接连接上游。
+取消令牌触发时立即关闭到生成服务的连接，生成服务随即断开上游请求。
+"""
+import contextlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config.settings import (
+    HTTP_POOL_MAXSIZE, SSE_READ_SIZE, LLM_CONNECT_TIMEOUT, GENERATION_SERVICE_TIMEOUT
+)
+from utils.transport import abort_response
+from utils.cancellation import record_cancellation
+from utils.sse_parser import iter_sse_events, iter_response_bytes, json_loads
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _shared_session() -> requests.Session:
+    """进程内共享的HTTP会话（keep-alive连接池）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_MAXSIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+class RemoteGenerationService:
+    """
+    调用远程生成服务
+
+    Args:
+        base_url: 生成服务地址，例如 http://127.0.0.1:8600
+        model: 模型名称（可选，默认使用生成服务配置的模型）
+        session: requests 会话（可选，默认进程内共享）
+    """
+
+    def __init__(self, base_url: str, model: str = None, session: requests.Session = None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.session = session or _shared_session()
+
+    def story(self, keywords: str, stream: bool = False, cancel=None, variant: int = 0):
+        """按关键词创作故事，见 GenerationService.story"""
+        body = {"keywords": keywords, "variant": variant} if variant else {"keywords": keywords}
+        return self._generate("story", body, stream, cancel, module="story_prefetch" if variant else None)
+
+    def grade(self, text: str, stream: bool = False, cancel=None):
+        """完整批改一篇作文，见 GenerationService.grade"""
+        return self._generate("writer", {"text": text}, stream, cancel)
+
+    def revise(self, previous_text: str, previous_feedback: str, text: str, stream: bool = False, cancel=None):
+        """只批改改动过的句子，见 GenerationService.revise"""
+        body = {"previous_text": previous_text, "previous_feedback": previous_feedback, "text": text}
+        return self._generate("writer/revision", body, stream, cancel, module="writer_revision")
+
+    def chat(self, role: str, history, prompt: str, summary_cache: dict = None, earlier=None, cancel=None):
+        """
+        角色聊天的一轮回复，见 GenerationService.chat
+
+        滚动摘要由生成服务每次重新折叠，summary_cache 不使用。
+        发出请求并读到输入token数后才返回。
+        """
+        body = {
+            "role": role,
+            "history": [{"role": m["role"], "content": m["content"]} for m in history],
+            "prompt": prompt,
+            "earlier": list(earlier) if earlier else None,
+        }
+        events = self._events(self._open("chat", body, True), "chat", cancel)
+        meta = next(events, None)
+        prompt_tokens = meta.get("prompt_tokens", 0) if isinstance(meta, dict) else 0
+        return prompt_tokens, events
+
+    def _generate(self, path, body, stream, cancel, module=None):
+        module = module or path
+        response = self._open(path, dict(body, stream=stream), stream)
+        if stream:
+            return self._texts(self._events(response, module, cancel))
+        with response:
+            payload = _payload(response)
+        if "text" not in payload:
+            raise Exception(payload.get("error") or "生成服务返回了空响应")
+        return payload["text"]
+
+    def _open(self, path, body, stream):
+        if self.model:
+            body["model"] = self.model
+        try:
+            response = self.session.post(
+                f"{self.base_url}/v1/{path}", json=body, stream=stream,
+                timeout=(LLM_CONNECT_TIMEOUT, GENERATION_SERVICE_TIMEOUT)
+            )
+        except requests.Timeout:
+            raise Exception("生成服务请求超时")
+        except requests.RequestException as e:
+            raise Exception(f"无法连接生成服务: {e}")
+        if response.status_code != 200:
+            with response:
+                error = _payload(response).get("error")
+            raise Exception(error or f"生成服务返回 {response.status_code}")
+        return response
+
+    def _events(self, response, module, cancel):
+        """
+        逐个产出流式响应的事件：meta 事件产出字典，文本片段产出字符串
+
+        取消时关闭连接并安静地结束。
+        """
+        remove = cancel.on_cancel(lambda: abort_response(response)) if cancel is not None else None
+        ended = False
+        try:
+            for event in iter_sse_events(iter_response_bytes(response, SSE_READ_SIZE)):
+                if event.data == b"[DONE]":
+                    ended = True
+                    return
+                payload = json_loads(event.data)
+                if event.event == "error":
+                    raise Exception(payload.get("error") or "生成服务出错")
+                yield payload if event.event == "meta" else payload["text"]
+            raise Exception("生成服务的响应提前结束")
+        except Exception:
+            if cancel is not None and cancel.cancelled:
+                return
+            ended = True
+            raise
+        finally:
+            if remove is not None:
+                remove()
+            if not ended:
+                # 被取消或调用方提前停止读取
+                record_cancellation(module, cancel.reason if cancel is not None else None)
+            response.close()
+
+    @staticmethod
+    def _texts(events):
+        """只保留文本片段；提前停止读取时一起关闭事件流"""
+        with contextlib.closing(events):
+            for item in events:
+                if isinstance(item, str):
+                    yield item
+
+
+def _payload(response) -> dict:
+    """非流式响应的JSON（不是JSON对象时按出错处理）"""
+    try:
+        payload = json_loads(response.content)
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict):
+        return {"error": f"生成服务返回了非预期的格式（状态码 {response.status_code}）"}
+    return payload
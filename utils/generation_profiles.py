@@ -0,0 +1,153 @@
+"""
+按模块的生成参数 - max_tokens、temperature、停止词和超时
+
+max_tokens 是预留的输出额度：上游网关按它排队调度，进程级限流器也按它计算token额度。
+角色聊天的几句回复不必和完整的作文批改预留一样多。
+
+开启自适应模式后，每个模块按最近实际的输出token数（响应中的 usage.completion_tokens，
+没有时为本地估算）的分位乘以余量设置 max_tokens，不超过模块配置的上限。
+因上限被截断（finish_reason 为 length）的响应按两倍上限记录，让上限尽快回升。
+
+每次请求预留的token数和相对全局 MAX_TOKENS 节省的token数都计入指标。
+"""
+import collections
+import math
+import threading
+from config.settings import (
+    MAX_TOKENS, TEMPERATURE, GENERATION_PROFILES, GENERATION_PROFILE_ALIASES,
+    ADAPTIVE_MAX_TOKENS, ADAPTIVE_MAX_TOKENS_PERCENTILE, ADAPTIVE_MAX_TOKENS_HEADROOM,
+    ADAPTIVE_MAX_TOKENS_MIN_SAMPLES, ADAPTIVE_MAX_TOKENS_FLOOR
+)
+from utils.latency import percentile
+from utils.metrics import register_completion_listener, registry as metrics_registry
+
+
+reserved_tokens = metrics_registry.counter(
+    "llm_max_tokens_reserved_total", "请求中预留的输出token数（max_tokens之和）", ("module",))
+saved_tokens = metrics_registry.counter(
+    "llm_max_tokens_saved_total", "相对全局 MAX_TOKENS 少预留的输出token数", ("module",))
+truncated_completions = metrics_registry.counter(
+    "llm_truncated_completions_total", "因达到 max_tokens 被截断的响应数", ("module",))
+
+DEFAULT_TIMEOUT = 60
+
+
+class GenerationProfile:
+    """
+    单个模块的生成参数；开启自适应模式时记录最近的输出token数并据此计算 max_tokens
+    """
+
+    def __init__(self, module: str, max_tokens: int = None, temperature: float = None, stop=None,
+                 timeout: float = None, adaptive: bool = None, quantile: float = None,
+                 headroom: float = None, min_samples: int = None, floor: int = None, window: int = 500):
+        self.module = module
+        self.max_tokens = max_tokens or MAX_TOKENS
+        self.temperature = TEMPERATURE if temperature is None else temperature
+        self.stop = list(stop or [])
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.adaptive = ADAPTIVE_MAX_TOKENS if adaptive is None else adaptive
+        self.quantile = ADAPTIVE_MAX_TOKENS_PERCENTILE if quantile is None else quantile
+        self.headroom = ADAPTIVE_MAX_TOKENS_HEADROOM if headroom is None else headroom
+        self.min_samples = ADAPTIVE_MAX_TOKENS_MIN_SAMPLES if min_samples is None else min_samples
+        self.floor = ADAPTIVE_MAX_TOKENS_FLOOR if floor is None else floor
+        self.samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.reserved = 0
+        self.truncated = 0
+
+    def current_max_tokens(self) -> int:
+        """当前应预留的输出token数"""
+        if not self.adaptive:
+            return self.max_tokens
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return self.max_tokens
+            samples = list(self.samples)
+        limit = math.ceil(percentile(samples, self.quantile) * self.headroom)
+        return min(max(limit, self.floor), self.max_tokens)
+
+    def reserve(self, max_tokens: int = None) -> int:
+        """
+        确定一次请求的 max_tokens 并计入预留统计
+
+        Args:
+            max_tokens: 调用方显式指定的上限（可选），指定时不做自适应
+        """
+        max_tokens = max_tokens or self.current_max_tokens()
+        with self._lock:
+            self.requests += 1
+            self.reserved += max_tokens
+        reserved_tokens.inc((self.module,), max_tokens)
+        saved_tokens.inc((self.module,), max(MAX_TOKENS - max_tokens, 0))
+        return max_tokens
+
+    def record_completion(self, completion_tokens: int, max_tokens: int = None, truncated: bool = False):
+        """记录一次成功响应实际输出的token数"""
+        if truncated:
+            truncated_completions.inc((self.module,))
+            # 被截断时真实长度未知，按两倍上限记录
+            completion_tokens = min(max(completion_tokens, (max_tokens or 0) * 2), self.max_tokens)
+        with self._lock:
+            if truncated:
+                self.truncated += 1
+            if completion_tokens > 0:
+                self.samples.append(completion_tokens)
+
+    def stats(self):
+        with self._lock:
+            samples = list(self.samples)
+            requests, reserved, truncated = self.requests, self.reserved, self.truncated
+        return {
+            "module": self.module,
+            "max_tokens": self.max_tokens,
+            "current_max_tokens": self.current_max_tokens(),
+            "adaptive": self.adaptive,
+            "temperature": self.temperature,
+            "timeout": self.timeout,
+            "requests": requests,
+            "reserved": reserved,
+            "saved": max(MAX_TOKENS * requests - reserved, 0),
+            "completion_p50": percentile(samples, 50) if samples else 0,
+            "completion_p99": percentile(samples, 99) if samples else 0,
+            "samples": len(samples),
+            "truncated": truncated,
+        }
+
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def get_generation_profile(module: str = None) -> GenerationProfile:
+    """获取模块的生成参数（进程内共享，自适应的样本在所有会话间累积）"""
+    name = GENERATION_PROFILE_ALIASES.get(module, module) or "other"
+    with _profiles_lock:
+        profile = _profiles.get(name)
+        if profile is None:
+            config = GENERATION_PROFILES.get(name)
+            if config is None:
+                # 未配置的调用方沿用全局参数，不做自适应
+                profile = GenerationProfile(name, adaptive=False)
+            else:
+                profile = GenerationProfile(
+                    name, config["max_tokens"], config["temperature"], config["stop"], config["timeout"]
+                )
+            _profiles[name] = profile
+        return profile
+
+
+def generation_stats():
+    """各模块的预留token、节省的token和当前的自适应上限"""
+    with _profiles_lock:
+        profiles = list(_profiles.values())
+    return [profile.stats() for profile in sorted(profiles, key=lambda p: p.module)]
+
+
+def _on_completion(observation, completion_tokens: int):
+    get_generation_profile(observation.module).record_completion(
+        completion_tokens, observation.max_tokens, observation.finish_reason == "length"
+    )
+
+
+register_completion_listener(_on_completion)
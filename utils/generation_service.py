@@ -0,0 +1,179 @@
+"""
+生成服务 - 故事、角色聊天和作文批改的提示词组装与调用
+
+页面（modules/*）和独立运行的生成服务（generation_server.py）都通过这里生成内容：
+提示词、响应缓存和聊天上下文的组装都在这一层，页面只负责输入和显示。
+所有方法只使用传入的参数，不保存会话状态，可以在任意线程、多个进程里使用。
+
+出错时直接抛出异常（信息可以显示给用户），由调用方决定怎么提示。
+本模块不依赖Streamlit。
+"""
+from config.settings import OPENAI_MODEL, RESPONSE_CACHE_MODULES
+from utils.batch_grading import extract_completion_content
+from utils.chat_context import build_chat_messages
+from utils.essay_revision import RevisionPlan
+from utils.generation_profiles import get_generation_profile
+from utils.metrics import record_cache_hit
+from utils.prompts import (
+    STORY_SYSTEM_PROMPT, WRITER_SYSTEM_PROMPT, WRITER_REVISION_SYSTEM_PROMPT,
+    build_story_prompt, build_next_story_prompt, build_writer_prompt, build_role_chat_system_prompt
+)
+from utils.response_cache import get_response_cache, make_cache_key, normalize_keywords
+
+
+class GenerationService:
+    """
+    在一个LLM客户端上生成内容
+
+    Args:
+        client: 拥有 chat_completion 方法的客户端（见 utils.transport.client_registry）
+        model: 模型名称（可选，默认 OPENAI_MODEL）
+    """
+
+    def __init__(self, client, model: str = None):
+        self.client = client
+        self.model = model or OPENAI_MODEL
+
+    def story(self, keywords: str, stream: bool = False, cancel=None, variant: int = 0):
+        """
+        按关键词创作故事（关键词的顺序和大小写不影响缓存命中）
+
+        Args:
+            variant: 大于0时为同样关键词的第几个新故事，情节与之前的不同（“再来一个”的预取，见 utils.story_prefetch）
+
+        Returns:
+            stream 为False时返回故事全文，否则返回文本片段迭代器
+        """
+        if variant:
+            return self._generate("story_prefetch", STORY_SYSTEM_PROMPT, build_next_story_prompt(keywords, variant),
+                                  stream, cancel)
+        cache_prompt = f"story-keywords: {normalize_keywords(keywords)}"
+        return self._generate("story", STORY_SYSTEM_PROMPT, build_story_prompt(keywords), stream, cancel,
+                              cache_prompt)
+
+    def grade(self, text: str, stream: bool = False, cancel=None):
+        """
+        完整批改一篇作文
+
+        Returns:
+            stream 为False时返回批改结果，否则返回文本片段迭代器
+        """
+        return self._generate("writer", WRITER_SYSTEM_PROMPT, build_writer_prompt(text), stream, cancel)
+
+    def revise(self, previous_text: str, previous_feedback: str, text: str, stream: bool = False, cancel=None):
+        """
+        修改后重新提交的作文：只批改改动过的句子（见 utils.essay_revision）
+
+        返回的只是改动句子的批改，调用方用同样参数的 RevisionPlan.merge 合成完整的批改结果。
+        """
+        plan = RevisionPlan(previous_text, previous_feedback, text)
+        return self._generate("writer_revision", WRITER_REVISION_SYSTEM_PROMPT, plan.prompt(), stream, cancel)
+
+    def chat(self, role: str, history, prompt: str, summary_cache: dict = None, earlier=None, cancel=None):
+        """
+        角色聊天的一轮回复（流式）
+
+        Args:
+            role: 角色名（见 CHAT_ROLES）
+            history: 之前的消息列表 [{"role": ..., "content": ...}]（可以已经包含当前输入）
+            prompt: 当前输入
+            summary_cache: 保存滚动摘要的字典（可选，不传时每次重新折叠）
+            earlier: history 之前已经移出内存的对话 (条数, 摘要行列表)（可选）
+            cancel: 取消令牌（可选）
+
+        Returns:
+            (估算的输入token数, 文本片段迭代器)
+        """
+        return self.reply(build_role_chat_system_prompt(role), history, prompt, summary_cache, earlier, cancel)
+
+    def reply(self, system_prompt: str, history, prompt: str, summary_cache: dict = None, earlier=None,
+              cancel=None):
+        """按token预算组装多轮对话并流式生成回复，参数和返回值同 chat"""
+        messages, prompt_tokens = build_chat_messages(
+            system_prompt, history, prompt, {} if summary_cache is None else summary_cache, earlier=earlier
+        )
+        return prompt_tokens, self._stream_messages("chat", messages, cancel)
+
+    def complete(self, module: str, system_prompt: str, prompt: str, cache_prompt: str = None) -> str:
+        """
+        单轮生成，返回完整文本
+
+        Args:
+            module: 调用方模块名，决定生成参数和是否使用响应缓存
+            cache_prompt: 计算缓存键时代替prompt使用的规范化文本（可选）
+        """
+        cache_key = self._cache_key(module, system_prompt, prompt, cache_prompt)
+        if cache_key is not None:
+            cached = get_response_cache().get(cache_key)
+            if cached is not None:
+                record_cache_hit(module)
+                return cached
+
+        response = self.client.chat_completion(
+            messages=_single_turn(system_prompt, prompt),
+            model=self.model,
+            stream=False,
+            module=module
+        )
+        if not response:
+            raise Exception("未收到API响应")
+        content = extract_completion_content(response)
+        if cache_key is not None:
+            get_response_cache().set(cache_key, content)
+        return content
+
+    def stream(self, module: str, system_prompt: str, prompt: str, cache_prompt: str = None, cancel=None):
+        """
+        单轮流式生成，参数同 complete
+
+        Yields:
+            响应文本片段；缓存命中时一次性产出完整文本
+        """
+        cache_key = self._cache_key(module, system_prompt, prompt, cache_prompt)
+        if cache_key is not None:
+            cached = get_response_cache().get(cache_key)
+            if cached is not None:
+                record_cache_hit(module)
+                yield cached
+                return
+
+        parts = []
+        for chunk in self._stream_messages(module, _single_turn(system_prompt, prompt), cancel):
+            parts.append(chunk)
+            yield chunk
+
+        # 只缓存完整结束的响应（被取消的流也会正常结束）
+        if cache_key is not None and parts and not (cancel is not None and cancel.cancelled):
+            get_response_cache().set(cache_key, "".join(parts))
+
+    def _generate(self, module, system_prompt, prompt, stream, cancel, cache_prompt=None):
+        if stream:
+            return self.stream(module, system_prompt, prompt, cache_prompt, cancel)
+        return self.complete(module, system_prompt, prompt, cache_prompt)
+
+    def _cache_key(self, module, system_prompt, prompt, cache_prompt):
+        """已开启缓存的模块返回缓存键，否则返回None"""
+        if module not in RESPONSE_CACHE_MODULES:
+            return None
+        return make_cache_key(self.model, get_generation_profile(module).temperature, system_prompt,
+                              cache_prompt or prompt)
+
+    def _stream_messages(self, module, messages, cancel=None):
+        """调用客户端的流式接口；生成器在第一次读取时才发出请求"""
+        response = self.client.chat_completion(
+            messages=messages,
+            model=self.model,
+            stream=True,
+            module=module,
+            cancel=cancel
+        )
+        if not hasattr(response, "__iter__") or isinstance(response, (str, dict)):
+            raise Exception(f"意外的响应格式: {type(response)}")
+        yield from response
+
+
+def _single_turn(system_prompt: str, prompt: str):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
@@ -0,0 +1,242 @@
+"""
+本地语法预检查 - 不调用API，瞬间找出小学生作文里最常见的几类错误
+
+检查的规则：
+  - tense         句子里有 yesterday / last week / ago 等过去时间词，动词却用了现在时
+                  （过去时间词对同一段里后面没有新时间词的句子同样有效）
+  - to_or_ing     like / want / enjoy 等词后面直接跟动词原形（I like read）
+  - agreement     主谓不一致（he go、she don't、they is）
+  - capital       句首小写、单独的 i、星期/月份/语言名称小写
+
+所有正则在导入模块时编译一次；结果只是提示，完整的批改仍由AI完成。
+"""
+import re
+
+
+# 一个提示：rule、start、end（在原文中的字符位置）、text（原文片段）、suggestion、message
+def _hint(rule: str, start: int, end: int, text: str, suggestion: str, message: str):
+    return {
+        "rule": rule,
+        "start": start,
+        "end": end,
+        "text": text,
+        "suggestion": suggestion,
+        "message": message,
+    }
+
+
+PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]+[.!?]*")
+WORD_PATTERN = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+
+PAST_MARKER_PATTERN = re.compile(
+    r"\b(?:yesterday|ago|last\s+(?:night|week|weekend|month|year|summer|winter|spring|autumn|time|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday)|"
+    r"this\s+morning|in\s+(?:19|20)\d\d|when\s+i\s+was)\b",
+    re.IGNORECASE
+)
+# 出现这些词说明不再是过去的语境
+NON_PAST_MARKER_PATTERN = re.compile(
+    r"\b(?:today|now|every\s+(?:day|morning|week|weekend|year)|usually|always|often|sometimes|"
+    r"tomorrow|next\s+\w+|will|going\s+to)\b",
+    re.IGNORECASE
+)
+
+IRREGULAR_PAST = {
+    "go": "went", "goes": "went", "eat": "ate", "eats": "ate", "see": "saw", "sees": "saw",
+    "have": "had", "has": "had", "do": "did", "does": "did", "come": "came", "comes": "came",
+    "get": "got", "gets": "got", "make": "made", "makes": "made", "take": "took", "takes": "took",
+    "buy": "bought", "buys": "bought", "swim": "swam", "swims": "swam", "run": "ran", "runs": "ran",
+    "ride": "rode", "rides": "rode", "fly": "flew", "flies": "flew", "drink": "drank", "drinks": "drank",
+    "sing": "sang", "sings": "sang", "read": "read", "write": "wrote", "writes": "wrote",
+    "draw": "drew", "draws": "drew", "give": "gave", "gives": "gave", "find": "found", "finds": "found",
+    "think": "thought", "thinks": "thought", "feel": "felt", "feels": "felt", "meet": "met",
+    "meets": "met", "sleep": "slept", "sleeps": "slept", "tell": "told", "tells": "told",
+    "say": "said", "says": "said", "sit": "sat", "sits": "sat", "win": "won", "wins": "won",
+    "am": "was", "is": "was", "are": "were", "can": "could", "catch": "caught", "catches": "caught",
+    "teach": "taught", "teaches": "taught", "bring": "brought", "brings": "brought",
+    "leave": "left", "leaves": "left", "lose": "lost", "loses": "lost", "put": "put",
+}
+REGULAR_VERBS = (
+    "play watch visit walk like want help clean cook jump stay talk start finish open dance "
+    "live love look wash climb listen learn paint plant call rain visit enjoy kick laugh"
+).split()
+STUDY_LIKE = {"study": "studied", "studies": "studied", "cry": "cried", "cries": "cried",
+              "try": "tried", "tries": "tried", "carry": "carried", "carries": "carried"}
+
+
+def _regular_past(verb: str) -> str:
+    return verb + "d" if verb.endswith("e") else verb + "ed"
+
+
+def _third_person(verb: str) -> str:
+    if verb in ("have",):
+        return "has"
+    if verb in ("do", "go"):
+        return verb + "es"
+    if verb.endswith(("s", "sh", "ch", "x", "z")):
+        return verb + "es"
+    if verb.endswith("y") and verb[-2:-1] not in "aeiou":
+        return verb[:-1] + "ies"
+    return verb + "s"
+
+
+PRESENT_TO_PAST = dict(IRREGULAR_PAST)
+PRESENT_TO_PAST.update(STUDY_LIKE)
+for _verb in REGULAR_VERBS:
+    PRESENT_TO_PAST.setdefault(_verb, _regular_past(_verb))
+    PRESENT_TO_PAST.setdefault(_third_person(_verb), _regular_past(_verb))
+
+# 可以跟在 like / want 等词后面的常见动词原形
+# 不收也常作名词的词（fish、paint、drink、dance、help、sleep 等），"It likes fish." 本来就是对的，宁可漏报
+BASE_VERBS = frozenset(
+    "read play swim eat go watch draw sing run ride write make learn visit "
+    "walk jump fly see have climb listen talk study buy do take".split()
+)
+# 后面应该接 to do 的词、接 doing 的词、两者都可以的词
+TO_ONLY = frozenset("want wants wanted need needs needed decide decides decided hope hopes hoped "
+                    "plan plans planned".split())
+ING_ONLY = frozenset("enjoy enjoys enjoyed finish finishes finished practise practice practices "
+                     "practised practiced".split())
+TO_OR_ING = frozenset("like likes liked love loves loved hate hates hated start starts started "
+                      "begin begins began".split())
+
+THIRD_PERSON_SUBJECTS = frozenset("he she it".split())
+# 主语和动词之间出现这些词时，动词用原形是对的（he can go、did she like）
+AUXILIARIES = frozenset("can could will would should must may might did does do to don't doesn't "
+                        "didn't can't won't let make".split())
+# 代词前面是这些词时是并列主语（Tom and I），主谓一致不按代词判断
+COMPOUND_JOINERS = frozenset(("and", "or", "with"))
+# 主谓一致只检查这些常用动词，避免把名词当成动词
+AGREEMENT_VERBS = frozenset(
+    "go like have do play want eat read watch live love swim run ride make help need "
+    "walk come get see think know".split()
+)
+BE_FOR_SUBJECT = {"i": "am", "he": "is", "she": "is", "it": "is", "we": "are", "they": "are", "you": "are"}
+BE_FORMS = frozenset("am is are".split())
+PAST_BE_FOR_SUBJECT = {"i": "was", "he": "was", "she": "was", "it": "was", "we": "were", "they": "were",
+                       "you": "were"}
+PAST_BE_FORMS = frozenset(("was", "were"))
+
+SUBJECT_PRONOUNS = frozenset("i you he she it we they".split())
+# 时态检查时也当作主语看待的词（I go with my friend → my friend and I ...）
+TENSE_SUBJECTS = SUBJECT_PRONOUNS | {"friend", "friends", "family", "mother", "father", "mom", "dad"}
+
+CAPITALIZED_WORDS = {
+    word.lower(): word for word in (
+        "Monday Tuesday Wednesday Thursday Friday Saturday Sunday January February March April "
+        "June July August September October November December English Chinese China Beijing "
+        "Shanghai America American".split()
+    )
+}
+
+
+def _check_sentence(sentence: str, offset: int, past_context: bool, hints: list):
+    """检查一个句子，把提示追加到 hints"""
+    words = [(m.group(), m.start() + offset, m.end() + offset) for m in WORD_PATTERN.finditer(sentence)]
+    if not words:
+        return
+    flagged = set()
+
+    def add(index, rule, suggestion, message):
+        if index in flagged:
+            return
+        flagged.add(index)
+        word, start, end = words[index]
+        hints.append(_hint(rule, start, end, word, suggestion, message))
+
+    lowered = [w.lower() for w, _, _ in words]
+
+    # 时态：过去的语境里，主语后面的动词用了现在时
+    if past_context:
+        for i in range(1, len(words)):
+            past = PRESENT_TO_PAST.get(lowered[i])
+            if past is None or lowered[i - 1] not in TENSE_SUBJECTS:
+                continue
+            if lowered[i] == "read":
+                continue  # read 的过去式拼写相同
+            if lowered[i] in BE_FORMS:
+                past = PAST_BE_FOR_SUBJECT.get(lowered[i - 1], past)
+            add(i, "tense", past, f"说的是过去发生的事，{words[i][0]} 要用过去式 {past}")
+
+    # like read → like to read / like reading
+    for i in range(len(words) - 1):
+        first, verb = lowered[i], lowered[i + 1]
+        if verb not in BASE_VERBS or i + 1 in flagged:
+            continue
+        ing = verb[:-1] + "ing" if verb.endswith("e") and verb not in ("see",) else verb + "ing"
+        if verb in ("swim", "run"):
+            ing = verb + verb[-1] + "ing"
+        if first in TO_ONLY:
+            add(i + 1, "to_or_ing", f"to {verb}", f"{words[i][0]} 后面要加 to：{words[i][0]} to {verb}")
+        elif first in ING_ONLY:
+            add(i + 1, "to_or_ing", ing, f"{words[i][0]} 后面的动词要加 -ing：{words[i][0]} {ing}")
+        elif first in TO_OR_ING:
+            add(i + 1, "to_or_ing", f"to {verb} / {ing}",
+                f"{words[i][0]} 后面不能直接跟动词原形，可以说 {words[i][0]} to {verb} 或 {words[i][0]} {ing}")
+
+    # 主谓一致
+    for i in range(len(words) - 1):
+        subject, verb = lowered[i], lowered[i + 1]
+        if subject not in SUBJECT_PRONOUNS or i + 1 in flagged:
+            continue
+        if i > 0 and lowered[i - 1] in AUXILIARIES:
+            continue  # did he go / can she swim
+        if i > 0 and lowered[i - 1] in COMPOUND_JOINERS:
+            continue  # Tom and I are / my friend and I were：主语是复数，不能只看代词
+        if verb in BE_FORMS and verb != BE_FOR_SUBJECT[subject]:
+            right = BE_FOR_SUBJECT[subject]
+            add(i + 1, "agreement", right, f"{words[i][0]} 后面要用 {right}")
+        elif verb in PAST_BE_FORMS and verb != PAST_BE_FOR_SUBJECT[subject]:
+            right = PAST_BE_FOR_SUBJECT[subject]
+            add(i + 1, "agreement", right, f"{words[i][0]} 后面要用 {right}")
+        elif subject in THIRD_PERSON_SUBJECTS:
+            if verb == "don't":
+                add(i + 1, "agreement", "doesn't", f"{words[i][0]} 后面要用 doesn't")
+            elif verb in AGREEMENT_VERBS and not past_context:
+                right = _third_person(verb)
+                add(i + 1, "agreement", right, f"{words[i][0]} 是第三人称单数，动词要加 s：{right}")
+        elif verb == "doesn't" or (verb.endswith("s") and verb[:-1] in AGREEMENT_VERBS) or verb == "has":
+            right = "don't" if verb == "doesn't" else ("have" if verb == "has" else verb[:-1])
+            if verb == "goes":
+                right = "go"
+            add(i + 1, "agreement", right, f"{words[i][0]} 后面的动词用原形：{right}")
+
+    # 大小写
+    first_word, first_start, first_end = words[0]
+    if first_word[0].islower() and sentence[:first_start - offset].strip() == "":
+        add(0, "capital", first_word.capitalize(), "句子的第一个字母要大写")
+    for i, (word, start, end) in enumerate(words):
+        if word == "i":
+            add(i, "capital", "I", "“我” I 永远大写")
+        elif word.islower() and word in CAPITALIZED_WORDS:
+            right = CAPITALIZED_WORDS[word]
+            add(i, "capital", right, f"{right} 的首字母要大写")
+
+
+def check_grammar(text: str):
+    """
+    检查一篇作文
+
+    Args:
+        text: 作文原文
+
+    Returns:
+        按出现位置排序的提示列表，每个提示是包含 rule、start、end、text、suggestion、message 的字典
+    """
+    hints = []
+    paragraph_start = 0
+    for paragraph in PARAGRAPH_PATTERN.split(text or ""):
+        paragraph_start = text.index(paragraph, paragraph_start) if paragraph else paragraph_start
+        past_context = False
+        for match in SENTENCE_PATTERN.finditer(paragraph):
+            sentence = match.group()
+            # 新的时间词决定这句及后面句子的时态语境
+            if PAST_MARKER_PATTERN.search(sentence):
+                past_context = True
+            elif NON_PAST_MARKER_PATTERN.search(sentence):
+                past_context = False
+            _check_sentence(sentence, paragraph_start + match.start(), past_context, hints)
+        paragraph_start += len(paragraph)
+    hints.sort(key=lambda hint: hint["start"])
+    return hints
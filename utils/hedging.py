@@ -0,0 +1,215 @@
+"""
+对冲请求 - 首字节迟迟不到时再发一个相同的请求，谁先到用谁
+
+故事生成和作文批改对孩子来说是幂等的：同一个请求发两次，只要用先回来的那个就行。
+偶尔一个上游响应卡住30多秒时，对冲请求可以把页面从长尾里救出来。
+
+等待多久再对冲取最近首token延迟的某个分位（例如p95），这样正常请求几乎不会被对冲；
+对冲比例另有上限，避免上游整体变慢时请求量翻倍。
+"""
+import collections
+import queue
+import threading
+import time
+from config.settings import (
+    HEDGE_MODULES, HEDGE_PERCENTILE, HEDGE_INITIAL_DELAY, HEDGE_MIN_DELAY,
+    HEDGE_MAX_RATE, HEDGE_MIN_SAMPLES
+)
+from utils.latency import percentile
+from utils.metrics import registry as metrics_registry
+
+
+hedged_requests = metrics_registry.counter(
+    "llm_hedged_requests_total", "发出了对冲请求的上游请求数，winner为先到达首字节的一方", ("module", "winner"))
+
+
+class HedgePolicy:
+    """
+    单个模块的对冲策略：记录最近的首字节延迟，决定何时对冲以及是否还有对冲额度
+    """
+
+    def __init__(self, module: str, quantile: float = None, initial_delay: float = None,
+                 min_delay: float = None, max_rate: float = None, min_samples: int = None,
+                 window: int = 200):
+        self.module = module
+        self.quantile = HEDGE_PERCENTILE if quantile is None else quantile
+        self.initial_delay = HEDGE_INITIAL_DELAY if initial_delay is None else initial_delay
+        self.min_delay = HEDGE_MIN_DELAY if min_delay is None else min_delay
+        self.max_rate = HEDGE_MAX_RATE if max_rate is None else max_rate
+        self.min_samples = HEDGE_MIN_SAMPLES if min_samples is None else min_samples
+        self.samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rate_capped = 0
+
+    def delay(self) -> float:
+        """发出对冲请求前等待首字节的秒数"""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return self.initial_delay
+            samples = list(self.samples)
+        return max(percentile(samples, self.quantile), self.min_delay)
+
+    def record_ttft(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def start_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def try_hedge(self) -> bool:
+        """占用一次对冲额度；对冲数已达到请求数的 max_rate 时返回False"""
+        with self._lock:
+            if self.hedges + 1 > self.max_rate * self.requests:
+                self.rate_capped += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def record_winner(self, hedge_won: bool):
+        with self._lock:
+            if hedge_won:
+                self.hedge_wins += 1
+        hedged_requests.inc((self.module, "hedge" if hedge_won else "primary"))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "module": self.module,
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "rate_capped": self.rate_capped,
+                "samples": len(self.samples),
+            }
+
+
+class _Attempt:
+    """一次尝试：记录关闭它的函数（例如关闭流式响应），被取消时立即调用"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.closer = None
+        self.cancelled = threading.Event()
+
+
+def run_hedged(attempt, policy: HedgePolicy, cancel=None):
+    """
+    发出主请求，首字节超时则再发一个对冲请求，返回先到达首字节的结果
+
+    Args:
+        attempt: attempt(index, register, cancelled)，阻塞到首字节到达并返回结果；
+                 拿到响应后应调用 register(关闭函数)，输掉时会调用它关闭连接；
+                 cancelled 是 threading.Event，输掉后被设置
+        policy: 对冲策略
+        cancel: 取消令牌（可选，见 utils.cancellation），取消后不再发出对冲请求；
+                已经发出的尝试由 attempt 自己在令牌上登记断开
+
+    Returns:
+        赢家的结果
+
+    Raises:
+        所有尝试都失败时抛出第一个异常
+    """
+    policy.start_request()
+    started = time.perf_counter()
+    delay = policy.delay()
+    results = queue.Queue()
+    lock = threading.Lock()
+    attempts = []
+    winner = []
+
+    def register(current, closer):
+        with lock:
+            current.closer = closer
+            lost = bool(winner) and winner[0] is not current
+        if lost:
+            closer()
+
+    def runner(current):
+        try:
+            result, error = attempt(current.index, lambda r: register(current, r), current.cancelled), None
+        except Exception as e:
+            result, error = None, e
+        with lock:
+            lost = bool(winner) and winner[0] is not current
+        if lost:
+            # 赢家已经产生，输掉的一方拿到响应后立即关闭
+            if current.closer is not None:
+                current.closer()
+            return
+        results.put((current, result, error))
+
+    def launch():
+        current = _Attempt(len(attempts))
+        attempts.append(current)
+        threading.Thread(target=runner, args=(current,), name=f"hedge-{current.index}", daemon=True).start()
+
+    launch()
+    hedged = False
+    errors = []
+    pending = 1
+    while True:
+        try:
+            current, result, error = results.get(timeout=None if hedged else delay)
+        except queue.Empty:
+            # 首字节超时：额度允许就对冲，否则继续等主请求
+            hedged = True
+            if cancel is not None and cancel.cancelled:
+                continue
+            if policy.try_hedge():
+                launch()
+                pending += 1
+            continue
+
+        pending -= 1
+        if error is not None:
+            # 另一方还在进行就继续等它
+            errors.append(error)
+            if pending == 0:
+                raise errors[0]
+            continue
+
+        with lock:
+            winner.append(current)
+            losers = [a for a in attempts if a is not current]
+        for loser in losers:
+            loser.cancelled.set()
+            if loser.closer is not None:
+                loser.closer()
+        if hedged:
+            # 主请求的首字节时间只知道不短于等待时间，按等待时间记，
+            # 否则被对冲的请求会把分位越推越高，对冲越来越晚
+            policy.record_ttft(delay)
+        else:
+            policy.record_ttft(time.perf_counter() - started)
+        if len(attempts) > 1:
+            policy.record_winner(hedge_won=current.index > 0)
+        return result
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_hedge_policy(module: str):
+    """
+    获取模块的对冲策略；模块没有在 HEDGE_MODULES 中开启时返回None
+    """
+    if module not in HEDGE_MODULES:
+        return None
+    with _policies_lock:
+        policy = _policies.get(module)
+        if policy is None:
+            policy = _policies[module] = HedgePolicy(module)
+        return policy
+
+
+def hedge_stats():
+    """所有已开启对冲的模块的统计"""
+    with _policies_lock:
+        policies = list(_policies.values())
+    return [policy.stats() for policy in policies]
@@ -0,0 +1,39 @@
+"""
+延迟统计工具 - 命令行批量生成和基准测试共用
+"""
+
+
+def percentile(values, q: float) -> float:
+    """
+    计算百分位数（线性插值）
+
+    Args:
+        values: 数值列表
+        q: 百分位（0-100）
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_latencies(values):
+    """
+    汇总一组延迟（秒）
+
+    Returns:
+        包含 count、mean、p50、p95、p99、max 的字典
+    """
+    if not values:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
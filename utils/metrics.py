@@ -0,0 +1,464 @@
+"""
+运行指标 - 按模块/模型/是否流式/结果统计请求数、耗时、首token时间、token用量和重试次数
+
+指标保存在进程内，可以通过Prometheus文本格式的HTTP端点导出，
+也可以在侧边栏管理面板查看；另可按比例把单个请求写入JSONL日志。
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config.settings import METRICS_LOG_PATH, METRICS_LOG_SAMPLE_RATE
+from utils.chat_context import estimate_tokens
+
+
+# 请求耗时和首token时间的直方图分桶（秒）
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+
+REQUEST_LABELS = ("module", "model", "stream", "outcome")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """带标签的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount: float = 1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def get(self, label_values) -> float:
+        with self._lock:
+            return self.values.get(label_values, 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    """带标签的直方图（累积分桶，与Prometheus一致）"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels, buckets):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}  # 标签值 -> [每个桶的计数..., +Inf计数, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value: float):
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def quantile(self, label_values, q: float) -> float:
+        """
+        按分桶估算分位数（与PromQL的histogram_quantile相同的线性插值）
+
+        Args:
+            label_values: 标签值元组
+            q: 分位（0-1）
+        """
+        with self._lock:
+            series = self.series.get(label_values)
+            if not series or not series[len(self.buckets)]:
+                return 0.0
+            series = list(series)
+        total = series[len(self.buckets)]
+        rank = q * total
+        lower_bound, lower_count = 0.0, 0
+        for i, bound in enumerate(self.buckets):
+            if series[i] >= rank:
+                if series[i] == lower_count:
+                    return bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / (series[i] - lower_count)
+            lower_bound, lower_count = bound, series[i]
+        # 落在最后一个有限分桶之外
+        return self.buckets[-1]
+
+    def count(self, label_values) -> int:
+        with self._lock:
+            series = self.series.get(label_values)
+            return series[len(self.buckets)] if series else 0
+
+    def total(self, label_values) -> float:
+        with self._lock:
+            series = self.series.get(label_values)
+            return series[-1] if series else 0.0
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self.series.items())
+        lines = []
+        for key, series in items:
+            for i, bound in enumerate(self.buckets):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {series[i]}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, inf)} {series[len(self.buckets)]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[len(self.buckets)]}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表，负责导出Prometheus文本格式"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name: str, help_text: str, labels) -> Counter:
+        metric = Counter(name, help_text, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labels, buckets) -> Histogram:
+        metric = Histogram(name, help_text, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect, kind: str = "gauge"):
+        """
+        注册导出时才读取的值（例如连接池、限流排队深度）
+
+        Args:
+            collect: 无参函数，返回 {指标名: (说明, 数值)}
+            kind: "gauge" 为可增可减的瞬时值；"counter" 为只增不减的累计值（由其它组件自己计数，
+                  指标名以 _total 结尾）
+        """
+        self.collectors.append((collect, kind))
+
+    def render_prometheus(self) -> str:
+        """生成Prometheus文本格式"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        for collect, kind in self.collectors:
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for name, (help_text, value) in sorted(values.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+requests_total = registry.counter(
+    "llm_requests_total", "上游chat completions请求数", REQUEST_LABELS)
+request_duration = registry.histogram(
+    "llm_request_duration_seconds", "请求总耗时（流式为读完整个流）", REQUEST_LABELS, DURATION_BUCKETS)
+time_to_first_token = registry.histogram(
+    "llm_time_to_first_token_seconds", "流式请求的首个文本片段到达时间", ("module", "model"), TTFT_BUCKETS)
+tokens_total = registry.counter(
+    "llm_tokens_total", "token用量（优先使用响应中的usage，流式响应为本地估算）",
+    ("module", "model", "stream", "type"))
+retries_total = registry.counter(
+    "llm_retries_total", "429/5xx和连接错误导致的重试次数", ("module", "model", "stream"))
+cache_hits_total = registry.counter(
+    "app_response_cache_hits_total", "命中响应缓存、没有调用上游的请求数", ("module",))
+
+
+class RequestLog:
+    """
+    请求日志（JSONL）
+
+    成功的请求按 sample_rate 抽样记录，失败的请求全部记录。
+    """
+
+    def __init__(self, path: str = None, sample_rate: float = None):
+        self.path = METRICS_LOG_PATH if path is None else path
+        self.sample_rate = METRICS_LOG_SAMPLE_RATE if sample_rate is None else sample_rate
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, record: dict):
+        if not self.path:
+            return
+        if record.get("outcome") == "ok" and random.random() >= self.sample_rate:
+            return
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+
+request_log = RequestLog()
+
+
+def classify_error(error: Exception) -> str:
+    """把异常归类为请求结果标签"""
+    message = str(error)
+    if "429" in message:
+        return "rate_limited"
+    if "timed out" in message.lower() or "超时" in message:
+        return "timeout"
+    return "error"
+
+
+_completion_listeners = []
+
+
+def register_completion_listener(listener):
+    """
+    注册成功响应的回调（例如按实际输出token数调整 max_tokens）
+
+    Args:
+        listener: 参数为 (观测对象, 输出token数) 的函数
+    """
+    _completion_listeners.append(listener)
+
+
+class RequestObservation:
+    """一次上游请求的观测：由客户端在发送前创建，结束时写入指标"""
+
+    def __init__(self, module: str, data: dict):
+        self.module = module or "other"
+        self.model = data.get("model", "")
+        self.stream = "true" if data.get("stream") else "false"
+        self.max_tokens = data.get("max_tokens")
+        # 流式响应的 usage 和 finish_reason 由客户端从最后的事件中填入
+        self.usage = None
+        self.finish_reason = None
+        self.prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in data.get("messages", []))
+        self.start = time.perf_counter()
+        self.ttft = None
+        self.retries = 0
+        # 客户端因取消令牌提前断开上游连接时置为True
+        self.cancelled = False
+        self.finished = False
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+
+    def finish(self, outcome: str, usage: dict = None, completion_text: str = None, error: str = None):
+        """记录请求结果（重复调用只记录第一次）"""
+        if self.finished:
+            return
+        self.finished = True
+        duration = time.perf_counter() - self.start
+
+        prompt_tokens, completion_tokens, usage_source = self.prompt_tokens, 0, "estimate"
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens") or 0
+            completion_tokens = usage.get("completion_tokens") or 0
+            usage_source = "api"
+        elif completion_text:
+            completion_tokens = estimate_tokens(completion_text)
+
+        labels = (self.module, self.model, self.stream, outcome)
+        requests_total.inc(labels)
+        request_duration.observe(labels, duration)
+        if self.ttft is not None:
+            time_to_first_token.observe((self.module, self.model), self.ttft)
+        if outcome == "ok":
+            tokens_total.inc((self.module, self.model, self.stream, "prompt"), prompt_tokens)
+            tokens_total.inc((self.module, self.model, self.stream, "completion"), completion_tokens)
+        if self.retries:
+            retries_total.inc((self.module, self.model, self.stream), self.retries)
+        if outcome == "ok":
+            for listener in _completion_listeners:
+                listener(self, completion_tokens)
+
+        request_log.write({
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "module": self.module,
+            "model": self.model,
+            "stream": self.stream == "true",
+            "outcome": outcome,
+            "duration": round(duration, 4),
+            "ttft": round(self.ttft, 4) if self.ttft is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "usage_source": usage_source,
+            "retries": self.retries,
+            "error": error,
+        })
+
+    def wrap_stream(self, chunks):
+        """包装文本片段迭代器：记录首token时间，流结束、出错或被提前关闭时写入指标"""
+        parts = []
+        outcome, error = "cancelled", None
+        try:
+            for chunk in chunks:
+                self.first_token()
+                parts.append(chunk)
+                yield chunk
+            outcome = "cancelled" if self.cancelled else "ok"
+        except Exception as e:
+            outcome, error = classify_error(e), str(e)
+            raise
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self.finish(outcome, usage=self.usage, completion_text="".join(parts), error=error)
+
+
+def observe_completion(module: str, data: dict, send):
+    """
+    发送请求并记录指标（同步和异步客户端共用）
+
+    Args:
+        module: 调用方模块名
+        data: 请求体
+        send: 实际发送请求的函数，参数为 (请求体, 观测对象)
+
+    Returns:
+        与 send 相同：非流式为响应字典，流式为文本片段迭代器
+    """
+    observation = RequestObservation(module, data)
+    try:
+        result = send(data, observation)
+    except Exception as e:
+        observation.finish(classify_error(e), error=str(e))
+        raise
+    if data.get("stream"):
+        return observation.wrap_stream(result)
+    usage = None
+    if isinstance(result, dict):
+        usage = result.get("usage")
+        choices = result.get("choices") or [{}]
+        observation.finish_reason = choices[0].get("finish_reason")
+    observation.finish("ok", usage=usage)
+    return result
+
+
+def record_cache_hit(module: str):
+    """记录一次响应缓存命中"""
+    cache_hits_total.inc((module or "other",))
+
+
+def module_summary():
+    """
+    按 模块/模型/是否流式 汇总指标，供管理面板显示
+
+    Returns:
+        行字典列表
+    """
+    groups = {}
+    with requests_total._lock:
+        keys = list(requests_total.values.keys())
+    for module, model, stream, outcome in keys:
+        row = groups.setdefault((module, model, stream), {
+            "module": module, "model": model, "stream": stream == "true",
+            "requests": 0, "errors": 0, "p50_s": 0.0, "p95_s": 0.0, "ttft_p50_s": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0, "retries": 0,
+        })
+        count = requests_total.get((module, model, stream, outcome))
+        row["requests"] += count
+        if outcome not in ("ok", "cancelled"):
+            row["errors"] += count
+
+    for (module, model, stream), row in groups.items():
+        ok_labels = (module, model, stream, "ok")
+        row["p50_s"] = round(request_duration.quantile(ok_labels, 0.5), 3)
+        row["p95_s"] = round(request_duration.quantile(ok_labels, 0.95), 3)
+        if stream == "true":
+            row["ttft_p50_s"] = round(time_to_first_token.quantile((module, model), 0.5), 3)
+        row["prompt_tokens"] = int(tokens_total.get((module, model, stream, "prompt")))
+        row["completion_tokens"] = int(tokens_total.get((module, model, stream, "completion")))
+        row["retries"] = int(retries_total.get((module, model, stream)))
+    return sorted(groups.values(), key=lambda r: (r["module"], r["model"], r["stream"]))
+
+
+def process_rss_bytes() -> int:
+    """当前进程的常驻内存（RSS）字节数；不是Linux时退回到峰值RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+registry.register_collector(lambda: {
+    "process_resident_memory_bytes": ("进程常驻内存字节数", process_rss_bytes()),
+})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1"):
+    """
+    在后台线程启动 /metrics 端点（每个进程只启动一次，重复调用直接返回）
+
+    Returns:
+        HTTP服务实例；端口被占用时返回None
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError:
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
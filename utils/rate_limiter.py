@@ -0,0 +1,229 @@
+"""
+进程级限流与重试 - 令牌桶限流器、重试预算和带抖动的指数退避
+"""
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from config.settings import (
+    RATE_LIMIT_RPM, RATE_LIMIT_TPM, RATE_LIMIT_MAX_WAIT,
+    RETRY_BASE_DELAY, RETRY_MAX_DELAY, RETRY_BUDGET_RATIO
+)
+from utils.chat_context import estimate_tokens
+
+
+# 值得重试的HTTP状态码：限流和网关暂时不可用
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class RateLimitTimeout(Exception):
+    """排队等待时间超过上限"""
+
+
+class TokenBucket:
+    """
+    允许透支的令牌桶
+
+    取令牌时直接扣减（可以变成负数），返回需要等待多久才能把透支补回来，
+    这样并发的调用方自然按到达顺序排队。
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """扣减令牌，返回需要等待的秒数"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def refund(self, amount: float):
+        """归还预留但没有使用的令牌"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    请求数/分钟 + token数/分钟 的双令牌桶限流器
+
+    同一进程内的所有会话共享一个实例。上限为0表示不限制该维度。
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None,
+                 max_wait: float = None):
+        rpm = RATE_LIMIT_RPM if requests_per_minute is None else requests_per_minute
+        tpm = RATE_LIMIT_TPM if tokens_per_minute is None else tokens_per_minute
+        self.request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.token_bucket = TokenBucket(tpm) if tpm > 0 else None
+        self.max_wait = RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.request_bucket is not None or self.token_bucket is not None
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        预留一次请求的额度
+
+        Returns:
+            调用方在发送前需要等待的秒数
+
+        Raises:
+            RateLimitTimeout: 需要等待的时间超过 max_wait
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self.request_bucket is not None:
+                wait = max(wait, self.request_bucket.reserve(1, now))
+            if self.token_bucket is not None and tokens:
+                # 单次请求超过桶容量时按容量计，避免永远等不到
+                wait = max(wait, self.token_bucket.reserve(min(tokens, self.token_bucket.capacity), now))
+
+            if wait > self.max_wait:
+                if self.request_bucket is not None:
+                    self.request_bucket.refund(1)
+                if self.token_bucket is not None and tokens:
+                    self.token_bucket.refund(min(tokens, self.token_bucket.capacity))
+                self.rejected += 1
+                raise RateLimitTimeout(f"429 本地限流：需要排队 {wait:.1f} 秒，超过上限 {self.max_wait:.0f} 秒")
+
+            self.admitted += 1
+            if wait > 0:
+                self.delayed += 1
+                self.total_wait += wait
+            return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """预留额度并阻塞等待，返回实际等待的秒数"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            self._enter_queue()
+            try:
+                time.sleep(wait)
+            finally:
+                self._leave_queue()
+        return wait
+
+    async def acquire_async(self, tokens: int = 0) -> float:
+        """acquire 的协程版本，排队时不阻塞事件循环"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            self._enter_queue()
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._leave_queue()
+        return wait
+
+    def _enter_queue(self):
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def _leave_queue(self):
+        with self._lock:
+            self.queue_depth -= 1
+
+    def stats(self):
+        """限流器状态，包括当前排队深度"""
+        with self._lock:
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "delayed": self.delayed,
+                "rejected": self.rejected,
+                "avg_wait": self.total_wait / self.delayed if self.delayed else 0.0,
+            }
+
+
+class RetryBudget:
+    """
+    重试预算
+
+    每个请求存入 ratio 个重试额度，每次重试消耗1个，额度有上限。
+    上游整体故障时重试会很快被耗尽，不会把故障放大成几倍的流量。
+    """
+
+    def __init__(self, ratio: float = None, max_tokens: float = 10.0):
+        self.ratio = RETRY_BUDGET_RATIO if ratio is None else ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.exhausted = 0
+
+    def record_request(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """尝试消耗一次重试额度"""
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.retries += 1
+                return True
+            self.exhausted += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {"retries": self.retries, "exhausted": self.exhausted, "available": self.tokens}
+
+
+def estimate_request_tokens(data: dict) -> int:
+    """估算一次请求占用的token额度：输入token + 预留的输出上限"""
+    prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in data.get("messages", []))
+    return prompt_tokens + int(data.get("max_tokens") or 0)
+
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 响应头（秒数或HTTP日期）
+
+    Returns:
+        需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after=None) -> float:
+    """
+    计算第 attempt 次重试前的等待时间（attempt从1开始）
+
+    优先遵守服务端的 Retry-After，否则使用带完全抖动的指数退避。
+    """
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1))))
+
+
+# 进程内共享的限流器和重试预算
+rate_limiter = RateLimiter()
+retry_budget = RetryBudget()
@@ -0,0 +1,185 @@
+"""
+分级响应缓存 - 内存LRU(带TTL) + 磁盘SQLite
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config.settings import (
+    RESPONSE_CACHE_PATH, RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_MEMORY_ENTRIES, RESPONSE_CACHE_DISK_ENTRIES
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """规范化用户提示词：去掉首尾空白并合并连续空白"""
+    return re.sub(r"\s+", " ", prompt or "").strip()
+
+
+def normalize_keywords(keywords: str) -> str:
+    """
+    规范化故事关键词，使顺序和大小写不影响缓存命中
+
+    例如 "Magic, dragon,castle" 和 "dragon, castle, magic" 得到相同结果
+    """
+    words = {normalize_prompt(word).lower() for word in re.split(r"[,，]", keywords or "")}
+    return ", ".join(sorted(word for word in words if word))
+
+
+def make_cache_key(model: str, temperature: float, system_prompt: str, prompt: str) -> str:
+    """根据 (模型, 温度, 系统提示词哈希, 规范化后的用户提示词) 计算缓存键"""
+    system_hash = hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest()
+    raw = "\x1f".join([model or "", repr(temperature), system_hash, normalize_prompt(prompt)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    两级响应缓存
+
+    第一级是进程内的LRU字典，第二级是SQLite文件，两级都有TTL和容量上限。
+    磁盘命中会回填到内存，超过容量时淘汰最久未访问的条目。
+    """
+
+    def __init__(self, db_path: str = None, ttl: float = None,
+                 memory_entries: int = None, disk_entries: int = None):
+        self.db_path = db_path or RESPONSE_CACHE_PATH
+        self.ttl = ttl if ttl is not None else RESPONSE_CACHE_TTL
+        self.memory_entries = memory_entries or RESPONSE_CACHE_MEMORY_ENTRIES
+        self.disk_entries = disk_entries or RESPONSE_CACHE_DISK_ENTRIES
+
+        self._memory = OrderedDict()  # key -> (写入时间, 响应文本)
+        self._lock = threading.Lock()
+        self._conn = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_conn(self):
+        """延迟打开SQLite连接（调用方需持有锁）"""
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)"
+            )
+        return self._conn
+
+    def get(self, key: str):
+        """
+        查找缓存
+
+        Returns:
+            缓存的响应文本，未命中或已过期时返回None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            conn = self._get_conn()
+            row = conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                value, created = row
+                if now - created <= self.ttl:
+                    conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    conn.commit()
+                    self._remember(key, created, value)
+                    self.disk_hits += 1
+                    return value
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str):
+        """写入两级缓存，并在超过容量时淘汰旧条目"""
+        if not value:
+            return
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            overflow = count - self.disk_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+            conn.commit()
+
+    def _remember(self, key, created, value):
+        """放入内存LRU（调用方需持有锁）"""
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """
+        缓存命中统计
+
+        Returns:
+            包含各级命中数、未命中数、命中率和条目数的字典
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_evictions": self.evictions,
+            }
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            self._memory.clear()
+            conn = self._get_conn()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """获取进程级共享的响应缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
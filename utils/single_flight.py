@@ -0,0 +1,286 @@
+"""
+单飞（single-flight）请求合并 - 同时发出的相同请求只调用一次上游
+"""
+import hashlib
+import itertools
+import json
+import threading
+from config.settings import SINGLE_FLIGHT_MAX_FANOUT_BYTES
+from utils.cancellation import CancelToken
+
+
+def request_key(api_base: str, api_key: str, data: dict) -> str:
+    """根据端点、密钥和完整请求体计算合并键"""
+    raw = json.dumps([api_base, api_key, data], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """一次进行中的非流式调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 1
+
+
+class _StreamFlight:
+    """
+    一次进行中的流式调用及其扇出缓冲区
+
+    没有单独的后台线程：哪个等待者先读到缓冲区末尾，就由它去上游取下一个
+    片段，其余等待者在条件变量上等候。缓冲区超过上限后不再接受新的等待者，
+    并丢弃所有等待者都已经读过的片段。
+
+    上游请求使用流自己的取消令牌，只有所有等待者都取消或离开后才触发。
+    """
+
+    def __init__(self, upstream, max_bytes: int):
+        self.upstream = upstream
+        self.max_bytes = max_bytes
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.offset = 0  # chunks[0] 在整个序列中的下标
+        self.buffered_bytes = 0
+        self.cursors = {}  # 等待者ID -> 下一个要读的下标
+        self.waiters = 0
+        self.pumping = False
+        self.done = False
+        self.error = None
+        self.joinable = True
+        self.cancel = CancelToken()
+
+    def append(self, chunk: str):
+        """追加上游片段（调用方需持有条件变量的锁）"""
+        self.chunks.append(chunk)
+        self.buffered_bytes += len(chunk.encode("utf-8"))
+        if self.buffered_bytes > self.max_bytes:
+            self.joinable = False
+        self.trim()
+
+    def trim(self):
+        """不再接受新等待者后，丢弃所有等待者都读过的片段（调用方需持有锁）"""
+        if self.joinable or not self.cursors:
+            return
+        drop = min(self.cursors.values()) - self.offset
+        if drop > 0:
+            self.buffered_bytes -= sum(len(c.encode("utf-8")) for c in self.chunks[:drop])
+            del self.chunks[:drop]
+            self.offset += drop
+
+
+class SingleFlight:
+    """
+    合并同时发出的相同请求
+
+    非流式请求：后来者等待第一个请求的结果并共享同一个响应。
+    流式请求：所有等待者通过扇出缓冲区拿到完全相同的片段序列。
+    """
+
+    def __init__(self, max_fanout_bytes: int = None):
+        self.max_fanout_bytes = max_fanout_bytes or SINGLE_FLIGHT_MAX_FANOUT_BYTES
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+        self._ids = itertools.count()
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def call(self, key: str, fn):
+        """执行非流式调用，相同key的并发调用共享一次上游请求"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.upstream_calls += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.event.set()
+
+    def stream(self, key: str, fn, cancel=None):
+        """
+        执行流式调用，相同key的并发调用共享一条上游流
+
+        Args:
+            key: 合并键
+            fn: 发起上游请求并返回片段迭代器的函数，参数为上游请求的取消令牌
+            cancel: 本调用方的取消令牌（可选）；取消时本调用方离开，最后一个调用方离开时断开上游
+
+        Returns:
+            片段生成器
+        """
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is not None:
+                with flight.cond:
+                    if flight.joinable and not flight.done and flight.cursors:
+                        waiter_id = next(self._ids)
+                        flight.cursors[waiter_id] = 0
+                        flight.waiters += 1
+                        self.coalesced += 1
+                        return self._consume(key, flight, waiter_id, cancel)
+
+            # 没有可加入的请求：先登记，再由本调用方发起上游请求
+            flight = _StreamFlight(None, self.max_fanout_bytes)
+            flight.pumping = True  # 建立连接期间，后来者等待
+            waiter_id = next(self._ids)
+            flight.cursors[waiter_id] = 0
+            flight.waiters = 1
+            self._streams[key] = flight
+            self.upstream_calls += 1
+
+        try:
+            upstream = fn(flight.cancel)
+        except Exception as e:
+            # 建立连接失败：通知已加入的等待者，并把异常抛给发起者
+            with flight.cond:
+                flight.done = True
+                flight.error = e
+                flight.pumping = False
+                flight.cursors.pop(waiter_id, None)
+                flight.cond.notify_all()
+            self._forget(key, flight)
+            raise
+
+        with flight.cond:
+            flight.upstream = upstream
+            flight.pumping = False
+            flight.cond.notify_all()
+        return self._consume(key, flight, waiter_id, cancel)
+
+    def _consume(self, key, flight, waiter_id, cancel=None):
+        """按顺序读取扇出缓冲区，必要时从上游取下一个片段"""
+        index = 0
+        remove = None
+        if cancel is not None:
+            remove = cancel.on_cancel(lambda: self._cancel_waiter(flight, waiter_id, cancel.reason))
+        try:
+            while True:
+                chunk = None
+                with flight.cond:
+                    while True:
+                        if waiter_id not in flight.cursors:
+                            # 本调用方已取消
+                            return
+                        position = index - flight.offset
+                        if position < len(flight.chunks):
+                            chunk = flight.chunks[position]
+                            index += 1
+                            flight.cursors[waiter_id] = index
+                            flight.trim()
+                            break
+                        if flight.done:
+                            if flight.error is not None:
+                                raise flight.error
+                            return
+                        if not flight.pumping:
+                            flight.pumping = True
+                            break
+                        flight.cond.wait()
+
+                if chunk is not None:
+                    yield chunk
+                    continue
+
+                # 由当前等待者从上游取下一个片段
+                finished = False
+                error = None
+                try:
+                    item = next(flight.upstream)
+                except StopIteration:
+                    finished = True
+                except Exception as e:
+                    error = e
+
+                with flight.cond:
+                    flight.pumping = False
+                    if finished or error is not None:
+                        flight.done = True
+                        flight.error = error
+                    else:
+                        flight.append(item)
+                    flight.cond.notify_all()
+                if flight.done:
+                    self._forget(key, flight)
+        finally:
+            if remove is not None:
+                remove()
+            self._leave(key, flight, waiter_id)
+
+    def _cancel_waiter(self, flight, waiter_id, reason):
+        """等待者取消（可能在其它线程）：让它离开；最后一个等待者取消时立即断开上游连接"""
+        with flight.cond:
+            if flight.cursors.pop(waiter_id, None) is None:
+                return
+            abandoned = not flight.cursors and not flight.done
+            if abandoned:
+                flight.joinable = False
+            flight.trim()
+            flight.cond.notify_all()
+        if abandoned:
+            flight.cancel.cancel(reason)
+
+    def _leave(self, key, flight, waiter_id):
+        """等待者离开；最后一个等待者离开且上游未结束时关闭上游连接"""
+        with flight.cond:
+            flight.cursors.pop(waiter_id, None)
+            abandoned = not flight.cursors and not flight.done
+            if abandoned:
+                flight.done = True
+                flight.joinable = False
+            flight.trim()
+        if abandoned:
+            close = getattr(flight.upstream, "close", None)
+            if close is not None:
+                close()
+            self._forget(key, flight)
+
+    def _forget(self, key, flight):
+        with self._lock:
+            if self._streams.get(key) is flight:
+                del self._streams[key]
+
+    def stats(self):
+        """
+        合并统计
+
+        Returns:
+            上游调用数、被合并的请求数，以及每个进行中请求的等待者数
+        """
+        with self._lock:
+            waiters = {key[:12]: call.waiters for key, call in self._calls.items()}
+            for key, flight in self._streams.items():
+                waiters[key[:12]] = len(flight.cursors)
+            return {
+                "upstream_calls": self.upstream_calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + len(self._streams),
+                "waiters": waiters,
+                "fanout_bytes": sum(f.buffered_bytes for f in self._streams.values()),
+            }
+
+
+# 进程内共享的请求合并器
+single_flight = SingleFlight()
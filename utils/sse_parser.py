@@ -0,0 +1,151 @@
+"""
+增量SSE解析器 - 直接在字节缓冲区上解析 Server-Sent Events
+"""
+import json
+from collections import namedtuple
+
+try:
+    # 安装了orjson时使用更快的JSON解码器
+    import orjson
+
+    json_loads = orjson.loads
+    JSON_DECODER = "orjson"
+except ImportError:
+    json_loads = json.loads
+    JSON_DECODER = "json"
+
+
+SSEEvent = namedtuple("SSEEvent", ["event", "data", "id"])
+SSEEvent.__doc__ = "一个完整的SSE事件，data为多行data字段用换行连接后的字节串"
+
+
+class SSEParser:
+    """
+    增量SSE解析器
+
+    按任意大小的字节块喂入数据，解析出完整的事件。支持多行 data 字段、
+    event / id 字段、注释行以及 \\n 和 \\r\\n 两种换行。整个过程不把数据
+    解码成str，事件数据保持为bytes，可以直接交给JSON解码器。
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data = []
+        self._event = None
+        self._id = None
+        self.last_event_id = None
+
+    def feed(self, chunk: bytes):
+        """
+        喂入一个字节块
+
+        Returns:
+            本次解析出的完整事件列表
+        """
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line_end = end - 1 if end > start and buffer[end - 1] == 0x0D else end
+            if line_end == start:
+                # 空行表示一个事件结束
+                event = self._dispatch()
+                if event is not None:
+                    events.append(event)
+            else:
+                self._process_line(buffer, start, line_end)
+            start = end + 1
+
+        if start:
+            del buffer[:start]
+        return events
+
+    def flush(self):
+        """
+        数据流结束时调用，处理没有以空行结尾的最后一个事件
+
+        Returns:
+            剩余的事件列表
+        """
+        if self._buffer:
+            line = bytes(self._buffer).rstrip(b"\r")
+            self._buffer.clear()
+            if line:
+                self._process_line(line, 0, len(line))
+        event = self._dispatch()
+        return [event] if event is not None else []
+
+    def _process_line(self, buffer, start, end):
+        """处理一行字段"""
+        if buffer[start] == 0x3A:  # 以 ":" 开头的注释行
+            return
+        colon = buffer.find(b":", start, end)
+        if colon < 0:
+            field = bytes(buffer[start:end])
+            value = b""
+        else:
+            field = bytes(buffer[start:colon])
+            value_start = colon + 1
+            if value_start < end and buffer[value_start] == 0x20:
+                value_start += 1
+            value = bytes(buffer[value_start:end])
+
+        if field == b"data":
+            self._data.append(value)
+        elif field == b"event":
+            self._event = value.decode("utf-8", "replace")
+        elif field == b"id":
+            self._id = value.decode("utf-8", "replace")
+
+    def _dispatch(self):
+        """根据已收集的字段生成事件"""
+        if self._id is not None:
+            self.last_event_id = self._id
+        if not self._data:
+            self._event = None
+            self._id = None
+            return None
+        data = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+        event = SSEEvent(self._event or "message", data, self._id)
+        self._data = []
+        self._event = None
+        self._id = None
+        return event
+
+
+def iter_sse_events(byte_chunks):
+    """从字节块迭代器中逐个产出SSE事件"""
+    parser = SSEParser()
+    for chunk in byte_chunks:
+        if chunk:
+            yield from parser.feed(chunk)
+    yield from parser.flush()
+
+
+def parse_sse_bytes(body: bytes):
+    """一次性解析完整的SSE响应体"""
+    parser = SSEParser()
+    return parser.feed(body) + parser.flush()
+
+
+def iter_response_bytes(response, read_size: int):
+    """
+    从requests响应中按到达顺序读取字节块
+
+    优先使用 urllib3 的 read1：有多少数据就返回多少（最多 read_size），
+    不会为了凑满一个块而等待后续的token。
+    """
+    raw = response.raw
+    if hasattr(raw, "read1"):
+        while True:
+            data = raw.read1(read_size, decode_content=True)
+            if not data:
+                break
+            yield data
+    else:
+        yield from response.iter_content(chunk_size=read_size)
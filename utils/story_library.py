@@ -0,0 +1,291 @@
+"""
+离线故事库 - 预先生成的故事紧凑地保存在一个文件里，带关键词倒排索引
+
+上游API不可用、超出额度或被限流时，故事魔法屋从这里挑一个关键词重合最多的故事；
+“秒出故事”模式也直接从这里取。
+
+文件格式（小端序，整个文件用mmap打开，启动时不读取内容；倒排表直接作为numpy数组使用）：
+    文件头    魔数、故事数、词条数和各段的起始偏移
+    词条表    按词条字节序排好的定长记录 (词条偏移, 词条长度, 倒排起点, 倒排长度)，查询时二分查找
+    词条文本  所有词条的UTF-8字节
+    倒排表    uint32 数组，每项为 故事编号 << 2 | 权重
+    故事表    定长记录 (压缩数据偏移, 压缩数据长度)
+    故事数据  每个故事 zlib 压缩的 "关键词\\0故事正文"
+
+权重：生成时使用的关键词为3，词汇表中的单词为2，正文中的其它实词为1。
+"""
+import array
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import zlib
+import numpy as np
+from config.settings import STORY_LIBRARY_PATH
+from utils.metrics import registry as metrics_registry
+
+
+MAGIC = b"STORYLB1"
+HEADER = struct.Struct("<8sIIQQQQQ")
+TERM_RECORD = struct.Struct("<IHxxII")
+STORY_RECORD = struct.Struct("<QI")
+
+KEYWORD_WEIGHT = 3
+VOCABULARY_WEIGHT = 2
+BODY_WEIGHT = 1
+
+library_served = metrics_registry.counter(
+    "app_story_library_served_total", "从离线故事库提供的故事数，reason为instant（秒出模式）或fallback（上游失败）",
+    ("reason",))
+
+WORD_PATTERN = re.compile(r"[a-z][a-z'-]*[a-z]|[a-z]")
+# 词汇表的行：| word | 中文意思 | 例句 |
+VOCABULARY_ROW_PATTERN = re.compile(r"^\|\s*([A-Za-z][A-Za-z' -]*?)\s*\|", re.MULTILINE)
+KEYWORD_SPLIT_PATTERN = re.compile(r"[,，、;；\s]+")
+
+STOPWORDS = frozenset("""
+a an the and or but so if then than that this these those there here it its it's is am are was were be been
+being to of in on at by for with from up down out over under into onto about as he she they we you i me him
+her them us my your his our their what who whom which when where why how all any some no not very can could
+will would shall should may might must do does did done have has had one two day said says say just also too
+again once upon time very much many more most other such only own same each few both after before while
+word example sentence
+""".split())
+
+
+def normalize_term(word: str) -> str:
+    return word.strip().lower()
+
+
+def term_variants(term: str):
+    """查询时同时尝试单复数形式"""
+    yield term
+    if len(term) > 3 and term.endswith("s"):
+        yield term[:-1]
+    else:
+        yield term + "s"
+
+
+def extract_terms(keywords: str, story: str):
+    """
+    提取一个故事的索引词条
+
+    Returns:
+        {词条: 权重}，同一个词条取最高的权重
+    """
+    terms = {}
+    for word in WORD_PATTERN.findall(story.lower()):
+        if word not in STOPWORDS and len(word) > 2:
+            terms[word] = BODY_WEIGHT
+    for word in VOCABULARY_ROW_PATTERN.findall(story):
+        term = normalize_term(word)
+        if term and term not in ("word", "单词"):
+            terms[term] = VOCABULARY_WEIGHT
+    for word in KEYWORD_SPLIT_PATTERN.split(keywords or ""):
+        term = normalize_term(word)
+        if term:
+            terms[term] = KEYWORD_WEIGHT
+    return terms
+
+
+def _to_little_endian(values: array.array) -> bytes:
+    if sys.byteorder == "big":
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def build_library(stories, path: str):
+    """
+    把故事批量写成故事库文件（先写临时文件再替换，正在读取的进程不受影响）
+
+    Args:
+        stories: (关键词, 故事正文) 的可迭代对象
+        path: 输出文件路径
+
+    Returns:
+        统计信息字典：stories、terms、postings、bytes
+    """
+    postings = {}
+    story_blob = bytearray()
+    story_table = bytearray()
+    count = 0
+    for keywords, story in stories:
+        for term, weight in extract_terms(keywords, story).items():
+            postings.setdefault(term.encode("utf-8"), array.array("I")).append(count << 2 | weight)
+        data = zlib.compress(f"{keywords}\0{story}".encode("utf-8"), 9)
+        story_table += STORY_RECORD.pack(len(story_blob), len(data))
+        story_blob += data
+        count += 1
+
+    term_table = bytearray()
+    term_blob = bytearray()
+    posting_data = array.array("I")
+    for term in sorted(postings):
+        entries = postings[term]
+        term_table += TERM_RECORD.pack(len(term_blob), len(term), len(posting_data), len(entries))
+        term_blob += term
+        posting_data.extend(entries)
+    posting_bytes = _to_little_endian(posting_data)
+
+    terms_offset = HEADER.size
+    term_blob_offset = terms_offset + len(term_table)
+    postings_offset = term_blob_offset + len(term_blob)
+    # 倒排表按4字节对齐，方便直接按uint32读取
+    padding = (-postings_offset) % 4
+    postings_offset += padding
+    stories_offset = postings_offset + len(posting_bytes)
+    story_blob_offset = stories_offset + len(story_table)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, count, len(postings), terms_offset, term_blob_offset,
+                            postings_offset, stories_offset, story_blob_offset))
+        f.write(term_table)
+        f.write(term_blob)
+        f.write(b"\0" * padding)
+        f.write(posting_bytes)
+        f.write(story_table)
+        f.write(story_blob)
+    os.replace(temp_path, path)
+    return {
+        "stories": count,
+        "terms": len(postings),
+        "postings": len(posting_data),
+        "bytes": os.path.getsize(path),
+    }
+
+
+class StoryLibrary:
+    """只读的故事库，用mmap打开，查询时只访问用到的词条和倒排"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.story_count, self.term_count, self._terms_offset, self._term_blob_offset,
+         self._postings_offset, self._stories_offset, self._story_blob_offset) = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"不是故事库文件: {path}")
+        # 倒排表直接映射成numpy数组，不复制
+        self._postings = np.frombuffer(
+            self._mmap, dtype="<u4",
+            count=(self._stories_offset - self._postings_offset) // 4, offset=self._postings_offset
+        )
+        self._random = random.Random()
+
+    def __len__(self):
+        return self.story_count
+
+    def close(self):
+        self._postings = None
+        self._mmap.close()
+
+    def _term_at(self, index: int):
+        return TERM_RECORD.unpack_from(self._mmap, self._terms_offset + index * TERM_RECORD.size)
+
+    def _lookup(self, term: bytes):
+        """二分查找词条，返回倒排表的切片（找不到时为None）"""
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length, start, count = self._term_at(middle)
+            position = self._term_blob_offset + offset
+            current = self._mmap[position:position + length]
+            if current < term:
+                low = middle + 1
+            elif current > term:
+                high = middle
+            else:
+                return self._postings[start:start + count]
+        return None
+
+    def search(self, keywords: str, exclude=()):
+        """
+        找出与关键词重合最多的故事
+
+        Args:
+            keywords: 用户输入的关键词
+            exclude: 不要返回的故事编号（例如本会话已经看过的）
+
+        Returns:
+            (故事编号, 得分)；没有任何词条命中时随机返回一个故事，得分为0；故事库为空时返回None
+        """
+        exclude = [story_id for story_id in exclude if 0 <= story_id < self.story_count]
+        segments = []
+        for word in KEYWORD_SPLIT_PATTERN.split(keywords or ""):
+            term = normalize_term(word)
+            if not term:
+                continue
+            for variant in term_variants(term):
+                entries = self._lookup(variant.encode("utf-8"))
+                if entries is not None:
+                    segments.append(entries)
+                    break
+
+        if segments:
+            entries = np.concatenate(segments) if len(segments) > 1 else segments[0]
+            # 每个故事的得分 = 命中词条的权重之和
+            scores = np.bincount(entries >> 2, weights=entries & 3, minlength=self.story_count)
+            if exclude:
+                scores[exclude] = 0
+            best = scores.max()
+            if best > 0:
+                # 同分的故事随机挑一个，反复查询同一组关键词时不总是同一篇
+                candidates = np.flatnonzero(scores == best)
+                return int(candidates[self._random.randrange(len(candidates))]), int(best)
+
+        if self.story_count - len(exclude) <= 0:
+            return None
+        excluded = set(exclude)
+        while True:
+            story_id = self._random.randrange(self.story_count)
+            if story_id not in excluded:
+                return story_id, 0
+
+    def get(self, story_id: int):
+        """
+        读取一个故事
+
+        Returns:
+            (生成时的关键词, 故事正文)
+        """
+        offset, length = STORY_RECORD.unpack_from(self._mmap, self._stories_offset + story_id * STORY_RECORD.size)
+        start = self._story_blob_offset + offset
+        keywords, _, story = zlib.decompress(self._mmap[start:start + length]).decode("utf-8").partition("\0")
+        return keywords, story
+
+
+_library = None
+_library_mtime = None
+_library_lock = threading.Lock()
+
+
+def get_story_library():
+    """
+    获取进程级故事库；文件不存在或没有故事时返回None，文件被重新生成后自动重新打开
+    """
+    global _library, _library_mtime
+    if not STORY_LIBRARY_PATH:
+        return None
+    try:
+        mtime = os.stat(STORY_LIBRARY_PATH).st_mtime
+    except OSError:
+        return None
+    with _library_lock:
+        if _library is None or mtime != _library_mtime:
+            try:
+                _library = StoryLibrary(STORY_LIBRARY_PATH)
+            except (OSError, ValueError):
+                _library = None
+            if _library is not None and not len(_library):
+                _library = None
+            _library_mtime = mtime
+        return _library
@@ -0,0 +1,201 @@
+"""
+故事预取 - 孩子读当前故事时，在后台线程里提前生成下一个故事
+
+每个会话有一个预取槽（保存在 session_state 中），存放为当前关键词提前生成好的故事，
+超过有效期就作废。点击“📖 再来一个”时直接从槽里取，不用再等一次完整生成。
+
+预取是投机性的开销，所以有三道上限：每个会话最多预取的篇数、整个进程每小时最多
+预取的篇数、同时在后台生成的篇数。命中和浪费（过期、换了关键词）都计入指标。
+
+本模块不依赖Streamlit，工作线程里不访问 st.session_state。
+"""
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import (
+    STORY_PREFETCH_COUNT, STORY_PREFETCH_TTL, STORY_PREFETCH_SESSION_LIMIT,
+    STORY_PREFETCH_HOURLY_LIMIT, STORY_PREFETCH_WORKERS
+)
+from utils.metrics import registry as metrics_registry
+from utils.response_cache import normalize_keywords
+
+
+prefetch_events = metrics_registry.counter(
+    "app_story_prefetch_total",
+    "故事预取：generated为生成成功，hit为被“再来一个”用上，wasted为过期或换关键词后作废，"
+    "skipped为超出预取上限，failed为生成失败",
+    ("outcome",)
+)
+
+
+class PrefetchSlot:
+    """一个会话的预取槽"""
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self.keywords = None  # 规范化后的关键词
+        self.stories = collections.deque()  # (故事, 生成时间)
+        self.pending = 0
+        self.generation = 0  # 换关键词时加一，旧的后台任务结果直接作废
+        self.variant = 0  # 同一组关键词已经请求过的第几个故事
+        self.spent = 0  # 本会话已经发出的预取请求数
+
+    def _expire(self, now: float) -> int:
+        """丢弃过期的故事，返回丢弃数（调用方持有锁）"""
+        expired = 0
+        while self.stories and now - self.stories[0][1] > STORY_PREFETCH_TTL:
+            self.stories.popleft()
+            expired += 1
+        return expired
+
+    def take(self, keywords: str, wait: float = 0.0):
+        """
+        取出一个为这组关键词预取的故事
+
+        Args:
+            wait: 槽里还没有但有正在生成的故事时，最多等待的秒数
+
+        Returns:
+            故事文本；没有可用的故事时返回None
+        """
+        keywords = normalize_keywords(keywords)
+        deadline = time.monotonic() + wait
+        with self._lock:
+            while True:
+                wasted = self._expire(time.time())
+                if wasted:
+                    prefetch_events.inc(("wasted",), wasted)
+                if self.keywords != keywords:
+                    return None
+                if self.stories:
+                    prefetch_events.inc(("hit",))
+                    return self.stories.popleft()[0]
+                remaining = deadline - time.monotonic()
+                if not self.pending or remaining <= 0:
+                    return None
+                self._lock.wait(remaining)
+
+    def available(self, keywords: str) -> int:
+        """槽里可直接使用的故事数"""
+        with self._lock:
+            self._expire(time.time())
+            return len(self.stories) if self.keywords == normalize_keywords(keywords) else 0
+
+    def reset(self, keywords: str) -> int:
+        """
+        切换到新的关键词，作废旧关键词的故事
+
+        Returns:
+            这次作废的故事数
+        """
+        keywords = normalize_keywords(keywords)
+        with self._lock:
+            if keywords == self.keywords:
+                return 0
+            wasted = len(self.stories)
+            self.stories.clear()
+            self.keywords = keywords
+            self.generation += 1
+            self.variant = 0
+        if wasted:
+            prefetch_events.inc(("wasted",), wasted)
+        return wasted
+
+
+class StoryPrefetcher:
+    """
+    进程级后台预取器，所有会话共享一个小线程池和每小时上限
+    """
+
+    def __init__(self, workers: int = None, hourly_limit: int = None, session_limit: int = None):
+        self.workers = workers or STORY_PREFETCH_WORKERS
+        self.hourly_limit = STORY_PREFETCH_HOURLY_LIMIT if hourly_limit is None else hourly_limit
+        self.session_limit = STORY_PREFETCH_SESSION_LIMIT if session_limit is None else session_limit
+        self._executor = None
+        self._lock = threading.Lock()
+        self._recent = collections.deque()  # 最近一小时发出的预取请求时间
+        self.in_flight = 0
+
+    def _admit(self, slot: PrefetchSlot) -> bool:
+        """检查各项上限并占用一次预取额度（调用方持有 slot 的锁）"""
+        if slot.spent >= self.session_limit:
+            return False
+        with self._lock:
+            now = time.time()
+            while self._recent and now - self._recent[0] > 3600:
+                self._recent.popleft()
+            if len(self._recent) >= self.hourly_limit or self.in_flight >= self.workers:
+                return False
+            self._recent.append(now)
+            self.in_flight += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="story-prefetch")
+        slot.spent += 1
+        return True
+
+    def schedule(self, slot: PrefetchSlot, service, keywords: str, count: int = None):
+        """
+        为关键词补足预取的故事（已有的和正在生成的都算在内）
+
+        Args:
+            service: 生成服务（GenerationService 或 RemoteGenerationService），用 story 的 variant 生成新故事
+
+        Returns:
+            这次新提交的后台任务数
+        """
+        slot.reset(keywords)
+        count = STORY_PREFETCH_COUNT if count is None else count
+        submitted = 0
+        with slot._lock:
+            while len(slot.stories) + slot.pending < count:
+                if not self._admit(slot):
+                    prefetch_events.inc(("skipped",))
+                    break
+                slot.pending += 1
+                slot.variant += 1
+                self._executor.submit(self._generate, slot, slot.generation, service, keywords, slot.variant)
+                submitted += 1
+        return submitted
+
+    def _generate(self, slot: PrefetchSlot, generation: int, service, keywords: str, variant: int):
+        story = None
+        try:
+            story = service.story(keywords, variant=variant)
+            prefetch_events.inc(("generated",))
+        except Exception:
+            prefetch_events.inc(("failed",))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        with slot._lock:
+            slot.pending -= 1
+            if story and generation == slot.generation:
+                slot.stories.append((story, time.time()))
+            elif story:
+                # 生成期间换了关键词
+                prefetch_events.inc(("wasted",))
+            slot._lock.notify_all()
+
+    def stats(self):
+        """预取命中率和浪费情况"""
+        generated = prefetch_events.get(("generated",))
+        hits = prefetch_events.get(("hit",))
+        with self._lock:
+            in_flight = self.in_flight
+            last_hour = len(self._recent)
+        return {
+            "generated": generated,
+            "hits": hits,
+            "wasted": prefetch_events.get(("wasted",)),
+            "skipped": prefetch_events.get(("skipped",)),
+            "failed": prefetch_events.get(("failed",)),
+            "hit_rate": hits / generated if generated else 0.0,
+            "in_flight": in_flight,
+            "last_hour": last_hour,
+        }
+
+
+# 进程内唯一的预取器
+story_prefetcher = StoryPrefetcher()
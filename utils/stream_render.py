@@ -0,0 +1,126 @@
+"""
+流式Markdown渲染工具
+"""
+import time
+import streamlit as st
+from config.settings import STREAM_RENDER_FPS, STREAM_RENDER_MAX_CHARS
+
+
+CURSOR = "▌"
+
+
+def visible_markdown(text: str) -> str:
+    """
+    计算流式过程中可以安全显示的Markdown
+
+    未写完的表格行会被暂时隐藏，避免半行的表格语法在页面上闪烁；
+    标题和段落则逐字显示。
+    """
+    line_start = text.rfind("\n") + 1
+    if text[line_start:].lstrip().startswith("|"):
+        return text[:line_start]
+    return text
+
+
+class RenderCoalescer:
+    """
+    合并流式文本片段的渲染
+
+    每个SSE片段都调用一次 placeholder.markdown 会把不断变长的整段文本
+    一遍遍通过websocket发给浏览器，总开销与回复长度成平方关系。
+    这里把片段先放进列表，只在达到帧间隔或积累了足够多字符时才刷新一次，
+    结束时再做一次最终刷新。
+    """
+
+    def __init__(self, placeholder, fps: float = None, max_pending_chars: int = None,
+                 transform=None, clock=time.monotonic):
+        """
+        Args:
+            placeholder: 用于渲染的占位容器（如 st.empty()）
+            fps: 每秒最多刷新的次数
+            max_pending_chars: 未刷新的字符数达到该值时立即刷新
+            transform: 渲染前对完整文本的处理函数（可选，如 visible_markdown）
+            clock: 时钟函数，便于基准测试中使用模拟时间
+        """
+        self.placeholder = placeholder
+        fps = fps or STREAM_RENDER_FPS
+        self.min_interval = 1.0 / fps if fps > 0 else 0.0
+        self.max_pending_chars = max_pending_chars or STREAM_RENDER_MAX_CHARS
+        self.transform = transform
+        self.clock = clock
+
+        self._parts = []
+        self._pending_chars = 0
+        self._last_flush = None
+        self._shown = ""
+        self.flush_count = 0
+        self.chunk_count = 0
+
+    @property
+    def text(self) -> str:
+        """目前收到的完整文本"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def append(self, chunk: str):
+        """追加一个片段，到达帧间隔或字符阈值时刷新"""
+        if not chunk:
+            return
+        self._parts.append(chunk)
+        self._pending_chars += len(chunk)
+        self.chunk_count += 1
+
+        now = self.clock()
+        if (self._last_flush is None
+                or now - self._last_flush >= self.min_interval
+                or self._pending_chars >= self.max_pending_chars):
+            self.flush()
+
+    def flush(self, final: bool = False):
+        """把缓冲的文本渲染到占位容器"""
+        text = self.text
+        self._pending_chars = 0
+        self._last_flush = self.clock()
+
+        if final:
+            if text:
+                self.placeholder.markdown(text)
+            else:
+                self.placeholder.empty()
+            self.flush_count += 1
+            return
+
+        visible = self.transform(text) if self.transform else text
+        if visible and visible != self._shown:
+            self.placeholder.markdown(visible + CURSOR)
+            self._shown = visible
+            self.flush_count += 1
+
+    def close(self) -> str:
+        """最终刷新（去掉光标），返回完整文本"""
+        self.flush(final=True)
+        return self.text
+
+
+def render_markdown_stream(chunks, placeholder=None) -> str:
+    """
+    边接收边渲染Markdown（标题、段落和词汇表逐步出现）
+
+    Args:
+        chunks: 文本片段迭代器
+        placeholder: 用于渲染的占位容器（可选，默认新建 st.empty()）
+
+    Returns:
+        完整的响应文本
+    """
+    coalescer = RenderCoalescer(placeholder or st.empty(), transform=visible_markdown)
+    try:
+        for chunk in chunks:
+            coalescer.append(chunk)
+    finally:
+        # 页面重跑时渲染会抛出异常，立即关闭片段迭代器以断开上游连接，不等垃圾回收
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return coalescer.close()
@@ -0,0 +1,748 @@
+"""
+LLM传输层 - 使用requests库调用OpenAI兼容接口（避免OpenAI SDK的兼容性问题）
+
+连接池、多端点路由、限流重试、对冲请求、流式解析和进程级客户端注册表都在这里。
+本模块不依赖Streamlit，页面、独立运行的生成服务（generation_server.py）和命令行工具共用；
+页面会话相关的封装见 utils.api_client_simple。
+"""
+import requests
+import functools
+import itertools
+import socket
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from config.settings import (
+    OPENAI_API_BASE, OPENAI_MODEL, MAX_TOKENS, TEMPERATURE,
+    HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, API_TRANSPORT,
+    SSE_READ_SIZE, MAX_RETRIES, SINGLE_FLIGHT_ENABLED, STREAM_INCLUDE_USAGE,
+    LLM_CONNECT_TIMEOUT, LLM_STREAM_IDLE_TIMEOUT, HEDGE_MODULES
+)
+from utils.cancellation import record_cancellation, timeout_error, stream_stats
+from utils.single_flight import single_flight, request_key
+from utils.metrics import observe_completion, registry as metrics_registry
+from utils.sse_parser import iter_sse_events, iter_response_bytes, json_loads, parse_sse_bytes
+from utils.endpoint_router import get_endpoint_router
+from utils.generation_profiles import get_generation_profile, generation_stats, DEFAULT_TIMEOUT
+from utils.hedging import get_hedge_policy, hedge_stats, run_hedged
+from utils.rate_limiter import (
+    rate_limiter, retry_budget, estimate_request_tokens,
+    parse_retry_after, backoff_delay, RETRYABLE_STATUS_CODES
+)
+
+
+class SimpleAPIClient:
+    """简单的API客户端"""
+    
+    def __init__(self, api_key: str, api_base: str = None,
+                 pool_connections: int = None, pool_maxsize: int = None, router=None):
+        self.api_key = api_key
+        self.api_base = api_base or "https://api.openai.com/v1"
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        # 使用带keep-alive连接池的Session，复用TCP+TLS连接
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections or HTTP_POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize or HTTP_POOL_MAXSIZE
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        
+        # 配置了多个端点时每个请求由路由器选择端点，否则固定使用 api_base
+        self.router = router
+    
+    def pool_stats(self):
+        """
+        统计底层连接池的使用情况
+        
+        Returns:
+            包含新建连接数、请求数和复用命中数的字典
+        """
+        new_connections = 0
+        total_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            new_connections += pool.num_connections
+            total_requests += pool.num_requests
+        
+        return {
+            "connections_opened": new_connections,
+            "requests": total_requests,
+            # 没有新建连接的请求即为复用了已有的keep-alive连接
+            "connection_reuse_hits": max(total_requests - new_connections, 0),
+            "connection_reuse_misses": new_connections,
+        }
+    
+    def close(self):
+        """关闭连接池中的所有连接"""
+        self.session.close()
+    
+    def _target(self, endpoint):
+        """端点对应的请求URL和请求头"""
+        if endpoint is None:
+            return f"{self.api_base}/chat/completions", self.headers
+        headers = self.headers
+        if endpoint.api_key:
+            headers = {**self.headers, "Authorization": f"Bearer {endpoint.api_key}"}
+        return f"{endpoint.url}/chat/completions", headers
+    
+    def _post(self, data, stream=False, observation=None, in_use=None, timeout=None, cancel=None):
+        """
+        发送请求：先经过进程级限流器，遇到429/5xx或连接错误时按退避策略重试
+        
+        配置了多端点路由时，每次尝试都重新选择端点，重试会避开已经失败的端点。
+        
+        Args:
+            observation: 请求观测对象（可选），用于记录重试次数
+            in_use: 同一请求的对冲请求正在使用的端点列表（可选），选中的端点会加入其中
+            timeout: 等待首字节的超时秒数（可选，默认按模块的生成参数）；建立连接的超时为 LLM_CONNECT_TIMEOUT
+            cancel: 取消令牌（可选），取消后不再发起或重试请求，退避等待立即结束
+        
+        Returns:
+            (状态码正常的响应对象, 使用的端点) 元组；没有路由器时端点为None
+        
+        Raises:
+            _Cancelled: 请求在拿到响应之前被取消
+        """
+        cost = estimate_request_tokens(data)
+        retry_budget.record_request()
+        attempt = 0
+        failed = []
+        # 取消时结束退避等待
+        stop = threading.Event()
+        remove = cancel.on_cancel(stop.set) if cancel is not None else None
+        
+        try:
+            while True:
+                if stop.is_set():
+                    raise _Cancelled()
+                rate_limiter.acquire(cost)
+                endpoint = None
+                if self.router is not None:
+                    endpoint = self.router.pick(exclude=failed, in_use=in_use or ())
+                    if in_use is not None:
+                        in_use.append(endpoint)
+                url, headers = self._target(endpoint)
+                try:
+                    response = self.session.post(url, headers=headers, json=data, stream=stream,
+                                                 timeout=(LLM_CONNECT_TIMEOUT, timeout or DEFAULT_TIMEOUT))
+                except requests.exceptions.ConnectionError:
+                    if endpoint is not None:
+                        self.router.record_failure(endpoint)
+                        failed.append(endpoint)
+                    if attempt < MAX_RETRIES and not stop.is_set() and retry_budget.try_spend():
+                        attempt += 1
+                        if observation is not None:
+                            observation.retries += 1
+                        stop.wait(backoff_delay(attempt))
+                        continue
+                    raise
+                
+                if stop.is_set():
+                    # 连接建立期间被取消：拿到响应头就断开
+                    abort_response(response)
+                    if endpoint is not None:
+                        self.router.release(endpoint)
+                    raise _Cancelled()
+                
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    if endpoint is not None:
+                        self.router.record_failure(endpoint)
+                        failed.append(endpoint)
+                    if attempt < MAX_RETRIES and retry_budget.try_spend():
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        response.close()
+                        attempt += 1
+                        if observation is not None:
+                            observation.retries += 1
+                        # 换了端点就不用等原端点的Retry-After
+                        if endpoint is not None and len(failed) < len(self.router.endpoints):
+                            retry_after = None
+                        stop.wait(backoff_delay(attempt, retry_after))
+                        continue
+                
+                try:
+                    response.raise_for_status()
+                except requests.exceptions.HTTPError:
+                    if endpoint is not None:
+                        self.router.release(endpoint)
+                    raise
+                return response, endpoint
+        finally:
+            if remove is not None:
+                remove()
+    
+    def chat_completion(self, messages, model=None, max_tokens=None, temperature=None, stream=False,
+                        module=None, cancel=None):
+        """
+        调用chat completions API（同时发出的相同请求会合并成一次上游调用）
+        
+        Args:
+            max_tokens: 输出token上限（可选，默认按模块的生成参数，开启自适应时按实际输出调整）
+            temperature: 温度（可选，默认按模块的生成参数）
+            module: 调用方模块名（story/chat/writer），用于指标标签、生成参数和按模块开启对冲请求
+            cancel: 取消令牌（可选，见 utils.cancellation），取消时流式响应立即断开上游连接
+        """
+        # 构建请求数据
+        profile = get_generation_profile(module)
+        data = build_request_data(
+            messages, model, profile.reserve(max_tokens),
+            profile.temperature if temperature is None else temperature, stream, profile.stop
+        )
+        hedge = get_hedge_policy(module)
+        
+        def send(data, cancel=None):
+            return observe_completion(module, data, functools.partial(
+                self._send, hedge=hedge, timeout=profile.timeout, cancel=cancel))
+        
+        return coalesce_completion(self, data, send, cancel)
+    
+    def _send(self, data, observation=None, hedge=None, timeout=None, cancel=None):
+        """
+        发送一次chat completions请求
+        
+        Args:
+            hedge: 对冲策略（可选），首字节超时时再发一个相同的请求
+            timeout: 等待首字节的超时秒数（可选）
+            cancel: 取消令牌（可选，只用于流式请求）；从发起请求起就生效，
+                    拿到响应后立即登记断开连接，等待首字节时取消也会马上断开
+        """
+        if not data["stream"]:
+            cancel = None
+        try:
+            if hedge is not None:
+                return self._send_hedged(data, observation, hedge, timeout, cancel)
+            
+            if data["stream"]:
+                # 流式响应处理
+                response, endpoint = self._post(data, stream=True, observation=observation, timeout=timeout,
+                                                cancel=cancel)
+                remove = cancel.on_cancel(lambda: abort_response(response)) if cancel is not None else None
+                
+                # 返回生成器：增量解析字节流，不逐行解码
+                return self._stream_generator(response, endpoint, observation=observation, cancel=cancel,
+                                              remove=remove)
+                
+            else:
+                # 非流式响应 - 确保返回字典
+                response, endpoint = self._post(data, observation=observation, timeout=timeout)
+                if endpoint is not None:
+                    # 非流式没有首token，用收到响应头的耗时代替
+                    self.router.record_success(endpoint, response.elapsed.total_seconds())
+                
+                return parse_completion_text(response.content)
+                
+        except _Cancelled:
+            return _cancelled_stream(observation, cancel)
+        except requests.exceptions.RequestException as e:
+            if cancel is not None and cancel.cancelled:
+                # 取消时主动断开了连接，请求出错是预期的
+                return _cancelled_stream(observation, cancel)
+            if isinstance(e, requests.exceptions.Timeout):
+                phase = "connect" if isinstance(e, requests.exceptions.ConnectTimeout) else "first_byte"
+                raise timeout_error(observation.module if observation is not None else None, phase) from e
+            raise Exception(f"API请求失败: {str(e)}")
+    
+    def _stream_generator(self, response, endpoint, events=None, observation=None, cancel=None, remove=None):
+        """
+        逐段产出流式响应的文本，并在首token到达时更新端点评分
+        
+        收到首个事件后，读取超时从等待首字节的超时换成 LLM_STREAM_IDLE_TIMEOUT。
+        取消令牌触发时立即断开连接，生成器安静地结束。
+        
+        Args:
+            events: 已经开始读取的SSE事件迭代器（对冲请求会预读首个事件）
+            observation: 请求观测对象（可选），记录最后事件中的 usage 和 finish_reason
+            cancel: 取消令牌（可选）
+            remove: 注销调用方已经在 cancel 上登记的断开连接回调的函数（可选，流结束时调用）
+        """
+        started = time.perf_counter() - response.elapsed.total_seconds()
+        module = observation.module if observation is not None else None
+        if events is None:
+            events = iter_sse_events(iter_response_bytes(response, SSE_READ_SIZE))
+        if remove is None and cancel is not None:
+            remove = cancel.on_cancel(lambda: abort_response(response))
+        pending = endpoint
+        received = completed = False
+        try:
+            for event in events:
+                if cancel is not None and cancel.cancelled:
+                    return
+                if not received:
+                    received = True
+                    set_read_timeout(response, LLM_STREAM_IDLE_TIMEOUT)
+                done, content = read_stream_event(event, observation)
+                if pending is not None and (done or content):
+                    # 首token到达，按首token延迟更新端点评分
+                    self.router.record_success(pending, time.perf_counter() - started)
+                    pending = None
+                if done:
+                    completed = True
+                    return
+                if content:
+                    yield content
+        except Exception as e:
+            if cancel is not None and cancel.cancelled:
+                # 取消时主动断开了连接，读取出错是预期的
+                return
+            if pending is not None:
+                self.router.record_failure(pending)
+                pending = None
+            if is_timeout(e):
+                raise timeout_error(module, "idle" if received else "first_byte") from e
+            raise
+        finally:
+            if remove is not None:
+                remove()
+            if cancel is not None and cancel.cancelled and not completed:
+                if observation is not None:
+                    observation.cancelled = True
+                record_cancellation(module, cancel.reason)
+            if pending is not None:
+                self.router.release(pending)
+            response.close()
+    
+    def _send_hedged(self, data, observation, hedge, timeout=None, cancel=None):
+        """
+        对冲发送：首字节在 hedge.delay() 秒内没到就再发一个相同的请求（有多个端点时发往另一个端点），
+        用先到达首字节的一方，另一方的连接立即关闭
+        
+        非流式请求要等整个响应生成完才有响应头，还在等待的一方只能在响应头到达后关闭。
+        取消令牌触发时每一方都立即断开，也不再发出对冲请求。
+        """
+        in_use = []
+        stream = data["stream"]
+        
+        def attempt(index, register, cancelled):
+            response, endpoint = self._post(data, stream=stream, observation=observation, in_use=in_use,
+                                            timeout=timeout, cancel=cancel)
+            once = threading.Lock()
+            
+            def closer():
+                # 输掉和被取消可能同时发生，只关闭一次
+                if not once.acquire(blocking=False):
+                    return
+                abort_response(response)
+                if endpoint is not None:
+                    self.router.release(endpoint)
+            
+            register(closer)
+            if not stream:
+                return response, endpoint, None
+            
+            remove = cancel.on_cancel(closer) if cancel is not None else None
+            events = iter_sse_events(iter_response_bytes(response, SSE_READ_SIZE))
+            try:
+                first = next(events, None)
+            except Exception as e:
+                stopped = cancelled.is_set() or (cancel is not None and cancel.cancelled)
+                if endpoint is not None and not stopped:
+                    self.router.record_failure(endpoint)
+                response.close()
+                if is_timeout(e) and not stopped:
+                    raise timeout_error(observation.module if observation is not None else None,
+                                        "first_byte") from e
+                raise
+            finally:
+                if remove is not None:
+                    remove()
+            if once.locked():
+                # 首字节到达的同时被取消或输掉，连接已经关闭
+                raise _Cancelled()
+            return response, endpoint, itertools.chain([first] if first is not None else [], events)
+        
+        try:
+            response, endpoint, events = run_hedged(attempt, hedge, cancel)
+        except Exception:
+            if cancel is not None and cancel.cancelled:
+                raise _Cancelled() from None
+            raise
+        if stream:
+            remove = cancel.on_cancel(lambda: abort_response(response)) if cancel is not None else None
+            return self._stream_generator(response, endpoint, events, observation, cancel, remove)
+        
+        if endpoint is not None:
+            self.router.record_success(endpoint, response.elapsed.total_seconds())
+        return parse_completion_text(response.content)
+
+
+class _Cancelled(Exception):
+    """请求在拿到响应之前被取消"""
+
+
+def _cancelled_stream(observation, cancel):
+    """拿到响应之前就被取消的流式请求：记录取消，返回空的文本片段迭代器"""
+    module = observation.module if observation is not None else None
+    if observation is not None:
+        observation.cancelled = True
+    record_cancellation(module, cancel.reason)
+    return iter(())
+
+
+def abort_response(response):
+    """
+    立即断开一个可能正阻塞在读取上的流式响应
+    
+    另一个线程正在读时直接 close() 会等那次读取返回（缓冲读取器的锁），
+    所以先 shutdown 底层socket让读取立刻出错，再关闭响应。
+    """
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+
+def set_read_timeout(response, seconds: float):
+    """修改流式响应底层socket的读取超时（之后的每次读取生效）"""
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        sock.settimeout(seconds)
+
+
+def is_timeout(error: Exception) -> bool:
+    """读取流式响应时的异常是否为读取超时"""
+    if isinstance(error, (socket.timeout, ReadTimeoutError, requests.exceptions.Timeout)):
+        return True
+    # iter_content 把 urllib3 的读取超时包装成了 ConnectionError
+    return bool(error.args) and isinstance(error.args[0], ReadTimeoutError)
+
+
+def coalesce_completion(client, data, send, cancel=None):
+    """
+    通过单飞合并层发送请求
+    
+    合并的流式请求中，某个调用方取消只让它自己离开；所有调用方都离开后才断开上游连接。
+    
+    Args:
+        client: 发起请求的客户端（提供 api_base 和 api_key）
+        data: 请求体
+        send: 实际发送请求的函数，参数为 (请求体, 取消令牌)
+        cancel: 调用方的取消令牌（可选，只用于流式请求）
+    
+    Returns:
+        非流式为响应字典，流式为文本片段迭代器
+    """
+    if not SINGLE_FLIGHT_ENABLED:
+        return send(data, cancel)
+    
+    key = request_key(client.api_base, client.api_key, data)
+    if data["stream"]:
+        return single_flight.stream(key, lambda upstream_cancel: send(data, upstream_cancel), cancel)
+    return single_flight.call(key, lambda: send(data))
+
+
+def build_request_data(messages, model=None, max_tokens=None, temperature=None, stream=False, stop=None):
+    """构建chat completions请求体（同步和异步客户端共用）"""
+    data = {
+        "model": model or OPENAI_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens or MAX_TOKENS,
+        "temperature": TEMPERATURE if temperature is None else temperature,
+        "stream": bool(stream)
+    }
+    if stop:
+        data["stop"] = list(stop)
+    if stream and STREAM_INCLUDE_USAGE:
+        # 让上游在最后一个事件里返回实际的 usage，自适应 max_tokens 依赖它
+        data["stream_options"] = {"include_usage": True}
+    return data
+
+
+def extract_delta_content(chunk):
+    """从流式响应的单个chunk中提取增量文本"""
+    if chunk.get('choices') and len(chunk['choices']) > 0:
+        delta = chunk['choices'][0].get('delta', {})
+        if delta.get('content'):
+            return delta['content']
+    return None
+
+
+def read_stream_event(event, observation=None):
+    """
+    解读流式响应中的一个SSE事件
+    
+    Args:
+        observation: 请求观测对象（可选），遇到 usage 和 finish_reason 时记录下来
+    
+    Returns:
+        (是否结束, 增量文本) 元组
+    """
+    if event.data == b'[DONE]':
+        return True, None
+    try:
+        chunk = json_loads(event.data)
+    except ValueError:
+        return False, None
+    if not isinstance(chunk, dict):
+        return False, None
+    if observation is not None:
+        if chunk.get('usage'):
+            observation.usage = chunk['usage']
+        if chunk.get('choices') and chunk['choices'][0].get('finish_reason'):
+            observation.finish_reason = chunk['choices'][0]['finish_reason']
+    return False, extract_delta_content(chunk)
+
+
+def parse_completion_text(response_body) -> dict:
+    """
+    解析非流式响应体
+    
+    Args:
+        response_body: HTTP响应体（bytes或str）
+    
+    Returns:
+        标准的chat completion响应字典
+    """
+    # 尝试解析JSON
+    try:
+        result = json_loads(response_body)
+    except ValueError:
+        # 如果不是JSON，可能是流式响应格式，用SSE解析器提取内容
+        if isinstance(response_body, str):
+            response_body = response_body.encode('utf-8')
+        content_parts = []
+        
+        for event in parse_sse_bytes(response_body):
+            if event.data == b'[DONE]':
+                break
+            try:
+                chunks = [json_loads(event.data)]
+            except ValueError:
+                # 有的网关不用空行分隔事件，多个data行被合并成了一个事件
+                chunks = []
+                for line in event.data.split(b'\n'):
+                    try:
+                        chunks.append(json_loads(line))
+                    except ValueError:
+                        continue
+            
+            for chunk_data in chunks:
+                if isinstance(chunk_data, dict) and chunk_data.get('choices'):
+                    # 对于流式格式，尝试提取delta或message内容
+                    choice = chunk_data['choices'][0]
+                    if 'delta' in choice and choice['delta'].get('content'):
+                        content_parts.append(choice['delta']['content'])
+                    elif 'message' in choice and choice['message'].get('content'):
+                        content_parts.append(choice['message']['content'])
+        
+        # 如果成功提取了内容，构造标准响应格式
+        if content_parts:
+            result = {
+                'choices': [{
+                    'message': {
+                        'content': ''.join(content_parts),
+                        'role': 'assistant'
+                    },
+                    'finish_reason': 'stop'
+                }]
+            }
+        else:
+            preview = response_body[:500].decode('utf-8', 'replace')
+            raise Exception(f"无法解析API响应: {preview}")
+    
+    # 确保返回的是字典格式
+    if not isinstance(result, dict):
+        raise Exception(f"API返回了非预期的格式: {type(result)}")
+    
+    return result
+
+
+class ClientRegistry:
+    """
+    进程级客户端注册表
+    
+    按 (api_base, api_key, transport) 缓存客户端，让所有浏览器会话共享
+    同一组keep-alive连接池，而不是每个会话各自建立冷连接。
+    """
+    
+    def __init__(self, pool_connections: int = None, pool_maxsize: int = None):
+        self.pool_connections = pool_connections or HTTP_POOL_CONNECTIONS
+        self.pool_maxsize = pool_maxsize or HTTP_POOL_MAXSIZE
+        self._clients = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get_client(self, api_key: str, api_base: str = None, transport: str = None):
+        """
+        获取（或创建）与配置对应的共享客户端
+        
+        Args:
+            api_key: API密钥
+            api_base: API端点URL（可选）
+            transport: "sync" 使用 SimpleAPIClient，"async" 使用异步客户端
+        
+        Returns:
+            拥有 chat_completion 方法的客户端实例
+        
+        Raises:
+            ValueError: 未知的传输方式；或者异步传输遇到了它不支持的多端点路由、对冲请求配置
+        """
+        transport = transport or API_TRANSPORT
+        if transport not in ("sync", "async"):
+            raise ValueError(f"未知的传输方式: {transport}")
+        if transport == "async":
+            _check_async_supported(api_base)
+        
+        key = (api_base or "https://api.openai.com/v1", api_key, transport)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.hits += 1
+                return client
+            
+            self.misses += 1
+            if transport == "async":
+                # 延迟导入，只有启用异步传输时才需要aiohttp
+                from utils.api_client_async import AsyncClientBridge
+                client = AsyncClientBridge(api_key, key[0], pool_maxsize=self.pool_maxsize)
+            else:
+                # 多端点路由只用于默认端点（未填写或 OPENAI_API_BASE）或配置里的端点，
+                # 用户自己填写的其它端点直接使用
+                router = get_endpoint_router()
+                if router is not None and not _routable(api_base, router):
+                    router = None
+                client = SimpleAPIClient(
+                    api_key, key[0],
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    router=router
+                )
+            self._clients[key] = client
+            return client
+    
+    def stats(self):
+        """
+        汇总注册表及所有连接池的命中情况，用于调整连接池大小
+        
+        Returns:
+            统计信息字典
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+            result = {
+                "clients": len(clients),
+                "registry_hits": self.hits,
+                "registry_misses": self.misses,
+                "pool_maxsize": self.pool_maxsize,
+                "connections_opened": 0,
+                "requests": 0,
+                "connection_reuse_hits": 0,
+                "connection_reuse_misses": 0,
+            }
+        
+        for client in clients:
+            for name, value in client.pool_stats().items():
+                result[name] += value
+        return result
+    
+    def clear(self):
+        """关闭并移除所有缓存的客户端"""
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+
+def _check_async_supported(api_base: str):
+    """
+    异步传输没有多端点路由和对冲请求；配置了却用异步传输时直接报错，而不是悄悄忽略
+    """
+    router = get_endpoint_router()
+    if router is not None and _routable(api_base, router):
+        raise ValueError("异步传输（API_TRANSPORT=async）不支持多端点路由，请去掉 OPENAI_API_ENDPOINTS 或改用 sync")
+    if HEDGE_MODULES:
+        raise ValueError("异步传输（API_TRANSPORT=async）不支持对冲请求，请去掉 HEDGE_MODULES 或改用 sync")
+
+
+def _routable(api_base: str, router) -> bool:
+    """api_base 是否交给多端点路由：未填写、等于 OPENAI_API_BASE，或是配置的端点之一"""
+    if not api_base or api_base.rstrip("/") == OPENAI_API_BASE.rstrip("/"):
+        return True
+    return router.serves(api_base)
+
+
+# 进程内唯一的客户端注册表，所有Streamlit会话共享
+client_registry = ClientRegistry()
+
+
+def get_pool_stats():
+    """获取进程级连接池统计信息"""
+    return client_registry.stats()
+
+
+def get_single_flight_stats():
+    """获取请求合并统计（上游调用数、合并数、每个请求的等待者数）"""
+    return single_flight.stats()
+
+
+def get_rate_limit_stats():
+    """获取进程级限流器（含排队深度）和重试预算的统计信息"""
+    return {**rate_limiter.stats(), **retry_budget.stats()}
+
+
+def get_endpoint_stats():
+    """获取多端点路由的每个端点状态；没有配置多端点时为空列表"""
+    router = get_endpoint_router()
+    return router.stats() if router is not None else []
+
+
+def get_generation_stats():
+    """获取各模块的生成参数、预留和节省的输出token数、当前的自适应 max_tokens"""
+    return generation_stats()
+
+
+def get_hedge_stats():
+    """获取各模块的对冲请求统计（请求数、对冲数、对冲获胜数、因比例上限没有对冲的次数）"""
+    return hedge_stats()
+
+
+def get_stream_stats():
+    """获取流式响应被取消（按原因）和请求超时（按阶段）的累计次数"""
+    return stream_stats()
+
+
+def _collect_client_gauges():
+    """导出指标时读取请求合并、限流器和端点熔断的瞬时状态"""
+    gauges = {
+        "llm_single_flight_in_flight": ("进行中的合并请求数", single_flight.stats()["in_flight"]),
+        "llm_rate_limit_queue_depth": ("当前在限流器中排队的请求数", rate_limiter.stats()["queue_depth"]),
+    }
+    router = get_endpoint_router()
+    if router is not None:
+        gauges["llm_endpoints_open"] = (
+            "处于熔断（含半开）状态的端点数", sum(e["state"] != "closed" for e in router.stats()))
+    return gauges
+
+
+def _collect_client_counters():
+    """导出指标时读取连接池、请求合并、限流器和端点路由的累计计数"""
+    pool = client_registry.stats()
+    counters = {
+        "llm_pool_connections_opened_total": ("连接池累计新建的连接数", pool["connections_opened"]),
+        "llm_pool_connection_reuse_hits_total": ("复用keep-alive连接的请求数", pool["connection_reuse_hits"]),
+        "llm_single_flight_coalesced_total": ("被合并到进行中请求的调用数", single_flight.stats()["coalesced"]),
+        "llm_rate_limit_rejected_total": ("排队超时被拒绝的请求数", rate_limiter.stats()["rejected"]),
+    }
+    router = get_endpoint_router()
+    if router is not None:
+        counters["llm_endpoint_failovers_total"] = ("重试时换到其它端点的次数", router.failovers)
+    return counters
+
+
+metrics_registry.register_collector(_collect_client_gauges)
+metrics_registry.register_collector(_collect_client_counters, kind="counter")